@@ -0,0 +1,216 @@
+""" CPU benchmarks. Every `bench_*` function sets up a fresh machine and returns the
+    callable that is timed by `benchmarks.run`. The callable returns the amount of work
+    it did (e.g. emulated cycles and instructions), which the runner turns into rates.
+"""
+import os
+import typing as t
+
+from hello64.codegen import CompiledEngine
+from hello64.conditions import Trap
+from hello64.cpu import CPU
+from hello64.machine import MachinePool
+from hello64.memory import Memory
+from tests.assembler import assemble_6502, strip_lines
+
+Bench = t.Callable[[], t.Dict[str, int]]
+
+
+def _machine(code: str, entry: int = 0x8000) -> CPU:
+    memory = Memory()
+    for _, pc, ecode in assemble_6502(strip_lines(code.splitlines())):
+        for v in ecode:
+            memory.ram[pc] = v
+            pc += 1
+    memory.ram[CPU.RESET_VECTOR] = entry & 0xff
+    memory.ram[CPU.RESET_VECTOR + 1] = entry >> 8
+    cpu = CPU(memory)
+    cpu.reset(extended=True)
+    return cpu
+
+
+def _run_to_trap(cpu: t.Union[CPU, CompiledEngine]) -> Bench:
+    def run():
+        res = cpu.run_until(Trap())
+        return {"cycles": res.cycles, "instructions": res.instructions}
+
+    return run
+
+
+def bench_functional() -> Bench:
+    """ Klaus Dormann's functional test to completion.
+    """
+    path = os.path.join(os.path.dirname(__file__), "..", "tests", "6502_functional_test.bin")
+    memory = Memory()
+    memory.ram = bytearray(open(path, "rb").read())
+    memory.ram[CPU.RESET_VECTOR] = 0x00
+    memory.ram[CPU.RESET_VECTOR + 1] = 0x04
+    cpu = CPU(memory)
+    cpu.reset()
+    return _run_to_trap(cpu)
+
+
+bench_functional.repeat = 1  # type: ignore
+
+
+def bench_functional_compiled() -> Bench:
+    """ The functional test executed by `hello64.codegen.CompiledEngine`.
+    """
+    path = os.path.join(os.path.dirname(__file__), "..", "tests", "6502_functional_test.bin")
+    memory = Memory()
+    memory.ram = bytearray(open(path, "rb").read())
+    memory.ram[CPU.RESET_VECTOR] = 0x00
+    memory.ram[CPU.RESET_VECTOR + 1] = 0x04
+    cpu = CPU(memory)
+    cpu.reset()
+    return _run_to_trap(CompiledEngine(cpu))
+
+
+bench_functional_compiled.repeat = 1  # type: ignore
+
+
+def bench_loop_10k() -> Bench:
+    """ The 10_000 cycle loop from `tests/test_clock.py`, repeated 200 times.
+    """
+    return _run_to_trap(
+        _machine("""
+        0x8000: LDA #200
+                STA %0x10
+        0x8004: LDY #0x12
+        0x8006: LDX #0x31
+        0x8008: ROL 0x9000
+                DEX
+                BNE 0x8008
+                ROL 0x9000
+                NOP
+                NOP
+                DEY
+                BNE 0x8006
+                ROL 0x9000
+                NOP
+                NOP
+                DEC %0x10
+                BNE 0x8004
+        done:   JMP done
+        """))
+
+
+def bench_decode_heavy() -> Bench:
+    """ A long straight-line block touching many opcodes and addressing modes,
+        so the time is dominated by fetching and decoding.
+    """
+    block = """
+                LDA #0x12
+                LDX %0x20
+                LDY 0x3000
+                ADC 0x3000,X
+                AND 0x3000,Y
+                ORA %0x20,X
+                EOR [0x40,X]
+                CMP [0x42,Y]
+                CPX #0x10
+                CPY %0x21
+                BIT 0x3001
+                STA %0x22
+                STX 0x3002
+                STY %0x23,X
+                TAX
+                TYA
+                INX
+                DEY
+                CLC
+                SEC
+                PHA
+                PLA
+    """
+    return _run_to_trap(
+        _machine(f"""
+        0x0040: DATA #0x00
+                DATA #0x30
+                DATA #0x00
+                DATA #0x31
+        0x8000: LDA #0
+                STA 0x0400
+        0x8005: {block * 16}
+                DEC 0x0400
+                BEQ done
+                JMP 0x8005
+        done:   JMP done
+        """))
+
+
+def bench_decimal() -> Bench:
+    """ Decimal mode `ADC`/`SBC` in a tight loop.
+    """
+    return _run_to_trap(
+        _machine("""
+        0x8000: SED
+                LDY #40
+        0x8003: LDX #0
+        0x8005: CLC
+                LDA %0x10
+                ADC #0x19
+                STA %0x10
+                ADC 0x3000,X
+                SEC
+                SBC #0x07
+                SBC %0x11
+                STA %0x11
+                DEX
+                BNE 0x8005
+                DEY
+                BNE 0x8003
+                CLD
+        done:   JMP done
+        """))
+
+
+def bench_indirect_indexed() -> Bench:
+    """ Copy and sum 48 pages through `(zp),Y` pointers.
+    """
+    return _run_to_trap(
+        _machine("""
+        0x8000: LDA #0x00
+                STA %0x10
+                STA %0x12
+                LDA #0x10
+                STA %0x11
+                LDA #0x40
+                STA %0x13
+                LDX #48
+        0x8010: LDY #0
+        0x8012: LDA [0x10,Y]
+                ADC [0x12,Y]
+                STA [0x12,Y]
+                INY
+                BNE 0x8012
+                INC %0x11
+                INC %0x13
+                DEX
+                BNE 0x8010
+        done:   JMP done
+        """))
+
+
+def bench_construction() -> Bench:
+    """ Building `Memory` and `CPU` objects.
+    """
+    def run():
+        for _ in range(2000):
+            CPU(Memory())
+        return {"constructions": 2000}
+
+    return run
+
+
+def bench_pool_reset() -> Bench:
+    """ Handing out reset machines from a `MachinePool`.
+    """
+    pool = MachinePool()
+
+    def run():
+        for _ in range(2000):
+            with pool.machine():
+                pass
+        return {"resets": 2000}
+
+    return run
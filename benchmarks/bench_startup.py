@@ -0,0 +1,52 @@
+""" Startup benchmarks: fresh interpreters importing `hello64` and building a first CPU,
+    as thousands of short-lived worker processes do. The bare interpreter is measured
+    as baseline.
+"""
+import os
+import subprocess
+import sys
+import typing as t
+
+Bench = t.Callable[[], t.Dict[str, int]]
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+STARTUPS = 20
+
+
+def _startup(code: str) -> Bench:
+    path = [SRC] + [p for p in [os.environ.get("PYTHONPATH")] if p]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+    # The first run writes the byte code and the cached handlers.
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+    def run():
+        for _ in range(STARTUPS):
+            subprocess.run([sys.executable, "-c", code], env=env, check=True)
+        return {"startups": STARTUPS}
+
+    return run
+
+
+def bench_interpreter() -> Bench:
+    """ `python -c pass`.
+    """
+    return _startup("pass")
+
+
+def bench_cpu() -> Bench:
+    """ `import hello64` and the first `CPU(Memory())`.
+    """
+    return _startup("import hello64; hello64.CPU(hello64.Memory())")
+
+
+def bench_machine() -> Bench:
+    """ The first `Machine` running a single instruction.
+    """
+    return _startup("import hello64; from hello64.conditions import InstructionBudget; "
+                    "hello64.Machine().run_until(InstructionBudget(1))")
+
+
+def bench_compiled() -> Bench:
+    """ The first `CompiledEngine` with the handlers loaded from the disk cache.
+    """
+    return _startup("import hello64; hello64.CompiledEngine(hello64.CPU(hello64.Memory()))")
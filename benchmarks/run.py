@@ -0,0 +1,118 @@
+""" A small, dependency free benchmark runner.
+
+    Run it from the repository root:
+
+        PYTHONPATH=src python -m benchmarks.run [-k substring] [--compare results/<rev>.json]
+
+    Every `bench_*` function found in the `benchmarks.bench_*` modules is set up and run
+    `repeat` times (default 3). The best run is reported as emulated cycles/sec,
+    instructions/sec etc. and the results are stored as JSON in `benchmarks/results/`
+    named after the current git revision, so numbers can be compared across commits.
+"""
+import argparse
+import importlib
+import json
+import os
+import pkgutil
+import platform
+import subprocess
+import sys
+import typing as t
+from time import perf_counter
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def discover() -> t.Dict[str, t.Callable]:
+    import benchmarks
+    found = {}
+    for info in pkgutil.iter_modules(benchmarks.__path__):
+        if not info.name.startswith("bench_"):
+            continue
+        module = importlib.import_module(f"benchmarks.{info.name}")
+        for name, fn in vars(module).items():
+            if name.startswith("bench_") and callable(fn):
+                found[f"{info.name[6:]}.{name[6:]}"] = fn
+    return found
+
+
+def measure(setup: t.Callable, repeat: int) -> t.Dict[str, t.Any]:
+    best = None
+    counts: t.Dict[str, int] = {}
+    for _ in range(repeat):
+        run = setup()
+        t0 = perf_counter()
+        counts = run()
+        duration = perf_counter() - t0
+        best = duration if best is None else min(best, duration)
+    assert best is not None
+    res: t.Dict[str, t.Any] = {"seconds": best, "repeat": repeat}
+    for k, v in counts.items():
+        res[k] = v
+        res[f"{k}_per_sec"] = v / best
+    return res
+
+
+def revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def format_result(name: str, res: t.Dict[str, t.Any], base: t.Optional[t.Dict[str, t.Any]]):
+    rates = []
+    for k, v in res.items():
+        if not k.endswith("_per_sec"):
+            continue
+        scale, unit = (1e6, "M") if v >= 1e6 else (1e3, "k") if v >= 1e3 else (1, " ")
+        rate = f"{v / scale:8.3f}{unit} {k[:-8]}/s"
+        if base and base.get(k):
+            rate += f" ({(v / base[k] - 1) * 100:+.1f}%)"
+        rates.append(rate)
+    return f"{name:32} {res['seconds']:8.3f}s  " + "  ".join(rates)
+
+
+def main(argv: t.Optional[t.List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run the hello64 benchmarks")
+    parser.add_argument("-k", dest="filter", default="", help="only run matching benchmarks")
+    parser.add_argument("--repeat", type=int, default=None, help="override the repeat count")
+    parser.add_argument("--compare", help="a previous JSON result to compare against")
+    parser.add_argument("--no-save", action="store_true", help="do not write a JSON result")
+    args = parser.parse_args(argv)
+
+    base = {}
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)["benchmarks"]
+    results = {}
+    for name, setup in discover().items():
+        if args.filter not in name:
+            continue
+        repeat = args.repeat or getattr(setup, "repeat", 3)
+        results[name] = measure(setup, repeat)
+        print(format_result(name, results[name], base.get(name)), flush=True)
+    if args.no_save:
+        return
+    rev = revision()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{rev}.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "revision": rev,
+                "python": sys.version,
+                "implementation": platform.python_implementation(),
+                "machine": platform.machine(),
+                "benchmarks": results,
+            },
+            f,
+            indent=2)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+""" A 6502 emulator.
+
+    `import hello64` is cheap: the names below are imported from their modules on first
+    access, so short-lived processes only pay for the subsystems they use.
+"""
+import importlib
+import typing as t
+
+# Name -> module defining it.
+_EXPORTS = {
+    "CPU": "hello64.cpu",
+    "UnknownOpcodeError": "hello64.cpu",
+    "Memory": "hello64.memory",
+    "Machine": "hello64.machine",
+    "MachinePool": "hello64.machine",
+    "NMOS6502": "hello64.variants",
+    "CMOS65C02": "hello64.variants",
+    "VARIANTS": "hello64.variants",
+    "BusEngine": "hello64.bus",
+    "CompiledEngine": "hello64.codegen",
+    "decode": "hello64.disasm",
+}
+
+__all__ = list(_EXPORTS)
+
+if t.TYPE_CHECKING:
+    from hello64.bus import BusEngine
+    from hello64.codegen import CompiledEngine
+    from hello64.cpu import CPU, UnknownOpcodeError
+    from hello64.disasm import decode
+    from hello64.machine import Machine, MachinePool
+    from hello64.memory import Memory
+    from hello64.variants import CMOS65C02, NMOS6502, VARIANTS
+
+
+def __getattr__(name: str) -> t.Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> t.List[str]:
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,714 @@
+""" Cycle-accurate bus access.
+
+    `CPU.start()` and `CPU.run_until()` get the number of cycles of an instruction right,
+    but do all of its memory accesses at once at the end. `BusEngine` executes the same
+    `CPU` (registers, memory and cycle counter) on per-opcode microcode instead: each
+    opcode is a precomputed tuple of micro-ops, one per cycle after the opcode fetch, and
+    every micro-op does exactly the read or write the NMOS 6502 puts on the bus in that
+    cycle, including the dummy reads of indexed addressing and the dummy write of the
+    read-modify-write instructions. Whatever sits behind `Memory.read()` and
+    `Memory.write()` sees the accesses in the order of the real CPU, and `cpu.cycles` is
+    the number of the cycle an access happens in.
+
+    The microcode is compiled from the bus pattern of each opcode in `hello64.spec` and
+    checked against its number of cycles. It follows
+    http://www.zimmers.net/anonftp/pub/cbm/documents/chipdata/64doc and covers `CPU` and
+    `hello64.variants.NMOS6502`, but not the 65C02.
+"""
+import logging
+import math
+import typing as t
+
+from hello64.conditions import ConditionSet, RunResult, StopCondition
+from hello64.cpu import CPU, UnknownOpcodeError
+from hello64.idle import detector
+from hello64.spec import AddrMode, OpcodeSpec
+
+logger = logging.getLogger("cpu")
+
+# A single cycle. Returns `True` if it ends the instruction before the end of its
+# sequence (no page crossed, branch not taken).
+MicroOp = t.Callable[["BusEngine"], t.Optional[bool]]
+Microcode = t.Tuple[MicroOp, ...]
+# One bus access: address, value, "read" or "write".
+Access = t.Tuple[int, int, str]
+
+
+class BusEngine:
+    """ Execute `cpu` one bus access per cycle.
+
+        With `trace` every access (including the opcode fetch) is appended to `trace`
+        as `(address, value, "read" | "write")`.
+    """
+    __slots__ = ["cpu", "microcode", "trace", "read", "write", "ea", "base", "value"]
+
+    def __init__(self, cpu: CPU, trace: bool = False) -> None:
+        self.cpu = cpu
+        unknown = _UNKNOWN[cpu.opcodes.unknown[0].__name__]
+        self.microcode = [m or unknown for m in microcode(type(cpu))]
+        self.trace: t.Optional[t.List[Access]] = [] if trace else None
+        self.read: t.Callable[[int], int] = cpu.mem.read
+        self.write: t.Callable[[int, int], None] = cpu.mem.write
+        # Effective address, unindexed base address and operand latched between cycles.
+        self.ea = 0
+        self.base = 0
+        self.value = 0
+
+    @property
+    def cycles(self) -> int:
+        return self.cpu.cycles
+
+    def _bind(self) -> t.Callable[[int], int]:
+        """ Look up the memory access methods (the class of `Memory` changes with its
+            observers) and return the one for opcode fetches.
+        """
+        mem = self.cpu.mem
+        if self.trace is None:
+            self.read, self.write = mem.read, mem.write
+            return mem.fetch
+        trace = self.trace
+
+        def read(address: int) -> int:
+            v = mem.read(address)
+            trace.append((address, v, "read"))
+            return v
+
+        def write(address: int, v: int):
+            trace.append((address, v, "write"))
+            mem.write(address, v)
+
+        def fetch(address: int) -> int:
+            v = mem.fetch(address)
+            trace.append((address, v, "read"))
+            return v
+
+        self.read, self.write = read, write
+        return fetch
+
+    def start(self) -> t.Iterator[t.Literal["busy", "idle"]]:
+        """ Like `CPU.start()`, but the state is emitted right after the bus access
+            of each cycle.
+        """
+        cpu = self.cpu
+        while True:
+            fetch = self._bind()
+            pc = cpu.pc
+            cpu.ins = fetch(pc)
+            cpu.pc = (pc + 1) % 0x10000
+            cpu.cycles += 1
+            yield "busy"
+            code = self.microcode[cpu.ins]
+            last = len(code) - 1
+            for i, op in enumerate(code):
+                done = op(self) or i == last
+                cpu.cycles += 1
+                if done:
+                    yield "idle"
+                    break
+                yield "busy"
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        """ Same as `CPU.run_until()`, one bus access per cycle.
+        """
+        cs = ConditionSet(conditions)
+        cpu = self.cpu
+        start_cycles = cpu.cycles
+        max_cycles = start_cycles + cs.cycle_budget.cycles if cs.cycle_budget else math.inf
+        max_instructions = cs.ins_budget.instructions if cs.ins_budget else math.inf
+        debug = logger.isEnabledFor(logging.DEBUG)
+        fetch = self._bind()
+        ram = cpu.mem.ram
+        table = self.microcode
+        idle = detector(cpu, debug or self.trace is not None)
+        instructions = 0
+        while True:
+            pc = cpu.pc
+            cpu.ins = ins = fetch(pc)
+            cpu.pc = (pc + 1) % 0x10000
+            cpu.cycles += 1
+            if ins in cs.halt_opcodes:
+                return RunResult(cs.halt_opcodes[ins], cpu.cycles - start_cycles, instructions)
+            if debug:
+                cpu._log_instruction(pc)
+            for op in table[ins]:
+                done = op(self)
+                cpu.cycles += 1
+                if done:
+                    break
+            instructions += 1
+            if cs.trap is not None and cpu.pc == pc:
+                return RunResult(cs.trap, cpu.cycles - start_cycles, instructions)
+            if cpu.pc in cs.pc_points:
+                return RunResult(cs.pc_points[cpu.pc], cpu.cycles - start_cycles, instructions)
+            for r in cs.pc_ranges:
+                if r.start <= cpu.pc < r.end:
+                    return RunResult(r, cpu.cycles - start_cycles, instructions)
+            for v in cs.mem_values:
+                if ram[v.address] == v.value:
+                    return RunResult(v, cpu.cycles - start_cycles, instructions)
+            if cpu.cycles >= max_cycles:
+                return RunResult(cs.cycle_budget, cpu.cycles - start_cycles,  # type: ignore
+                                 instructions)
+            if instructions >= max_instructions:
+                return RunResult(cs.ins_budget, cpu.cycles - start_cycles,  # type: ignore
+                                 instructions)
+            if cpu.pc <= pc and idle is not None:
+                instructions += idle.jumped(pc, instructions, max_cycles, max_instructions)
+
+
+# Addressing
+
+
+def _fetch_lo(e: BusEngine):
+    cpu = e.cpu
+    e.ea = e.read(cpu.pc)
+    cpu.pc = (cpu.pc + 1) % 0x10000
+
+
+def _fetch_hi(e: BusEngine):
+    cpu = e.cpu
+    e.ea |= e.read(cpu.pc) << 8
+    cpu.pc = (cpu.pc + 1) % 0x10000
+
+
+def _fetch_hi_x(e: BusEngine):
+    _fetch_hi(e)
+    e.base = e.ea
+    e.ea = (e.base + e.cpu.idx) % 0x10000
+
+
+def _fetch_hi_y(e: BusEngine):
+    _fetch_hi(e)
+    e.base = e.ea
+    e.ea = (e.base + e.cpu.idy) % 0x10000
+
+
+def _index_zerop_x(e: BusEngine):
+    e.read(e.ea)
+    e.ea = (e.ea + e.cpu.idx) % 0x100
+
+
+def _index_zerop_y(e: BusEngine):
+    e.read(e.ea)
+    e.ea = (e.ea + e.cpu.idy) % 0x100
+
+
+def _pointer_lo(e: BusEngine):
+    e.value = e.read(e.ea)
+
+
+def _pointer_hi(e: BusEngine):
+    e.ea = e.value | e.read((e.ea + 1) % 0x100) << 8
+
+
+def _pointer_hi_y(e: BusEngine):
+    _pointer_hi(e)
+    e.base = e.ea
+    e.ea = (e.base + e.cpu.idy) % 0x10000
+
+
+def _dummy_unfixed(e: BusEngine):
+    # The high byte of the address is fixed up one cycle after the index was added.
+    e.read((e.base & 0xff00) | (e.ea & 0xff))
+
+
+_ADDRESSING: t.Dict[str, Microcode] = {
+    "addr_zerop": (_fetch_lo, ),
+    "addr_zerop_x": (_fetch_lo, _index_zerop_x),
+    "addr_zerop_y": (_fetch_lo, _index_zerop_y),
+    "addr_abs": (_fetch_lo, _fetch_hi),
+    "addr_abs_x": (_fetch_lo, _fetch_hi_x),
+    "addr_abs_y": (_fetch_lo, _fetch_hi_y),
+    "addr_indirect_x": (_fetch_lo, _index_zerop_x, _pointer_lo, _pointer_hi),
+    "addr_indirect_y": (_fetch_lo, _pointer_lo, _pointer_hi_y),
+}
+# Modes whose effective address may still be in the wrong page one cycle before use.
+_INDEXED = {"addr_abs_x", "addr_abs_y", "addr_indirect_y"}
+
+# Instructions, the operation without any bus access.
+
+
+def _set_nz(cpu: CPU, v: int):
+    cpu.sr_z = v == 0
+    cpu.sr_n = bool(v & 0x80)
+
+
+def _lda(cpu: CPU, v: int):
+    cpu.acc = v
+    _set_nz(cpu, v)
+
+
+def _ldx(cpu: CPU, v: int):
+    cpu.idx = v
+    _set_nz(cpu, v)
+
+
+def _ldy(cpu: CPU, v: int):
+    cpu.idy = v
+    _set_nz(cpu, v)
+
+
+def _lax(cpu: CPU, v: int):
+    cpu.acc = cpu.idx = v
+    _set_nz(cpu, v)
+
+
+def _compare(cpu: CPU, reg: int, v: int):
+    cpu.sr_c = reg >= v
+    _set_nz(cpu, (reg - v) % 0x100)
+
+
+def _bit(cpu: CPU, v: int):
+    cpu.sr_n = bool(v & 0x80)
+    cpu.sr_v = bool(v & 0x40)
+    cpu.sr_z = v & cpu.acc == 0
+
+
+def _anc(cpu: CPU, v: int):
+    _lda(cpu, cpu.acc & v)
+    cpu.sr_c = cpu.sr_n
+
+
+def _alr(cpu: CPU, v: int):
+    v &= cpu.acc
+    cpu.sr_c = bool(v & 0x01)
+    _lda(cpu, v >> 1)
+
+
+def _sbx(cpu: CPU, v: int):
+    v = (cpu.acc & cpu.idx) - v
+    cpu.sr_c = v >= 0
+    _ldx(cpu, v % 0x100)
+
+
+_READ: t.Dict[str, t.Callable[[CPU, int], None]] = {
+    "adc": lambda cpu, v: cpu._adc(v),
+    "and_": lambda cpu, v: _lda(cpu, cpu.acc & v),
+    "bit": _bit,
+    "cmp": lambda cpu, v: _compare(cpu, cpu.acc, v),
+    "cpx": lambda cpu, v: _compare(cpu, cpu.idx, v),
+    "cpy": lambda cpu, v: _compare(cpu, cpu.idy, v),
+    "eor": lambda cpu, v: _lda(cpu, cpu.acc ^ v),
+    "lda": _lda,
+    "ldx": _ldx,
+    "ldy": _ldy,
+    "ora": lambda cpu, v: _lda(cpu, cpu.acc | v),
+    "sbc": lambda cpu, v: cpu._sbc(v),
+    "nop": lambda cpu, v: None,
+    "lax": _lax,
+    "anc": _anc,
+    "alr": _alr,
+    "arr": lambda cpu, v: cpu._arr(cpu.acc & v),  # type: ignore
+    "sbx": _sbx,
+}
+
+_WRITE: t.Dict[str, t.Callable[[CPU], int]] = {
+    "sta": lambda cpu: cpu.acc,
+    "stx": lambda cpu: cpu.idx,
+    "sty": lambda cpu: cpu.idy,
+    "sax": lambda cpu: cpu.acc & cpu.idx,
+}
+
+
+def _asl(cpu: CPU, v: int) -> int:
+    cpu.sr_c = bool(v & 0x80)
+    v = (v << 1) % 0x100
+    _set_nz(cpu, v)
+    return v
+
+
+def _lsr(cpu: CPU, v: int) -> int:
+    cpu.sr_c = bool(v & 0x01)
+    v >>= 1
+    _set_nz(cpu, v)
+    return v
+
+
+def _rol(cpu: CPU, v: int) -> int:
+    v = v << 1 | cpu.sr_c
+    cpu.sr_c = v > 0xff
+    v %= 0x100
+    _set_nz(cpu, v)
+    return v
+
+
+def _ror(cpu: CPU, v: int) -> int:
+    v |= 0x100 if cpu.sr_c else 0
+    cpu.sr_c = bool(v & 0x01)
+    v >>= 1
+    _set_nz(cpu, v)
+    return v
+
+
+def _inc(cpu: CPU, v: int) -> int:
+    v = (v + 1) % 0x100
+    _set_nz(cpu, v)
+    return v
+
+
+def _dec(cpu: CPU, v: int) -> int:
+    v = (v - 1) % 0x100
+    _set_nz(cpu, v)
+    return v
+
+
+def _combined(rmw: t.Callable[[CPU, int], int],
+              read: t.Callable[[CPU, int], None]) -> t.Callable[[CPU, int], int]:
+    """ The undocumented read-modify-write instructions: `rmw` followed by `read` on the
+        modified value. Only the carry of `rmw` is passed on to `read`.
+    """
+    def op(cpu: CPU, v: int) -> int:
+        z, n = cpu.sr_z, cpu.sr_n
+        v = rmw(cpu, v)
+        cpu.sr_z, cpu.sr_n = z, n
+        read(cpu, v)
+        return v
+
+    return op
+
+
+_RMW: t.Dict[str, t.Callable[[CPU, int], int]] = {
+    "asl": _asl,
+    "lsr": _lsr,
+    "rol": _rol,
+    "ror": _ror,
+    "inc": _inc,
+    "dec": _dec,
+    "slo": _combined(_asl, _READ["ora"]),
+    "rla": _combined(_rol, _READ["and_"]),
+    "sre": _combined(_lsr, _READ["eor"]),
+    "rra": _combined(_ror, _READ["adc"]),
+    "dcp": _combined(_dec, _READ["cmp"]),
+    "isc": _combined(_inc, _READ["sbc"]),
+}
+
+
+def _tax(cpu: CPU):
+    _ldx(cpu, cpu.acc)
+
+
+def _tay(cpu: CPU):
+    _ldy(cpu, cpu.acc)
+
+
+def _txs(cpu: CPU):
+    cpu.sp = cpu.idx
+
+
+_IMPLIED: t.Dict[str, t.Callable[[CPU], None]] = {
+    "clc": lambda cpu: setattr(cpu, "sr_c", False),
+    "cld": lambda cpu: setattr(cpu, "sr_d", False),
+    "cli": lambda cpu: setattr(cpu, "sr_i", False),
+    "clv": lambda cpu: setattr(cpu, "sr_v", False),
+    "sec": lambda cpu: setattr(cpu, "sr_c", True),
+    "sed": lambda cpu: setattr(cpu, "sr_d", True),
+    "sei": lambda cpu: setattr(cpu, "sr_i", True),
+    "tax": _tax,
+    "tay": _tay,
+    "tsx": lambda cpu: _ldx(cpu, cpu.sp),
+    "txa": lambda cpu: _lda(cpu, cpu.idx),
+    "txs": _txs,
+    "tya": lambda cpu: _lda(cpu, cpu.idy),
+    "dex": lambda cpu: _ldx(cpu, (cpu.idx - 1) % 0x100),
+    "dey": lambda cpu: _ldy(cpu, (cpu.idy - 1) % 0x100),
+    "inx": lambda cpu: _ldx(cpu, (cpu.idx + 1) % 0x100),
+    "iny": lambda cpu: _ldy(cpu, (cpu.idy + 1) % 0x100),
+    "nop": lambda cpu: None,
+}
+
+_BRANCHES: t.Dict[str, t.Callable[[CPU], bool]] = {
+    "bpl": lambda cpu: not cpu.sr_n,
+    "bmi": lambda cpu: cpu.sr_n,
+    "bvc": lambda cpu: not cpu.sr_v,
+    "bvs": lambda cpu: cpu.sr_v,
+    "bcc": lambda cpu: not cpu.sr_c,
+    "bcs": lambda cpu: cpu.sr_c,
+    "bne": lambda cpu: not cpu.sr_z,
+    "beq": lambda cpu: cpu.sr_z,
+}
+
+# Micro-op factories for the last cycles of an instruction.
+
+
+def _read_operand(op: t.Callable[[CPU, int], None]) -> MicroOp:
+    def read_operand(e: BusEngine):
+        op(e.cpu, e.read(e.ea))
+
+    return read_operand
+
+
+def _read_indexed(op: t.Callable[[CPU, int], None]) -> MicroOp:
+    """ Read from the not yet fixed up address, which is the right one if no page was
+        crossed.
+    """
+    def read_indexed(e: BusEngine) -> bool:
+        address = (e.base & 0xff00) | (e.ea & 0xff)
+        v = e.read(address)
+        if address != e.ea:
+            return False
+        op(e.cpu, v)
+        return True
+
+    return read_indexed
+
+
+def _immediate(op: t.Callable[[CPU, int], None]) -> MicroOp:
+    def immediate(e: BusEngine):
+        cpu = e.cpu
+        v = e.read(cpu.pc)
+        cpu.pc = (cpu.pc + 1) % 0x10000
+        op(cpu, v)
+
+    return immediate
+
+
+def _write_operand(reg: t.Callable[[CPU], int]) -> MicroOp:
+    def write_operand(e: BusEngine):
+        e.write(e.ea, reg(e.cpu))
+
+    return write_operand
+
+
+def _rmw_read(e: BusEngine):
+    e.value = e.read(e.ea)
+
+
+def _rmw_dummy_write(e: BusEngine):
+    # The unmodified value is written back while the ALU does its work.
+    e.write(e.ea, e.value)
+
+
+def _rmw_write(op: t.Callable[[CPU, int], int]) -> MicroOp:
+    def rmw_write(e: BusEngine):
+        e.write(e.ea, op(e.cpu, e.value))
+
+    return rmw_write
+
+
+def _dummy_pc(e: BusEngine):
+    e.read(e.cpu.pc)
+
+
+def _implied(op: t.Callable[[CPU], None]) -> MicroOp:
+    def implied(e: BusEngine):
+        e.read(e.cpu.pc)
+        op(e.cpu)
+
+    return implied
+
+
+def _accum(op: t.Callable[[CPU, int], int]) -> MicroOp:
+    def accum(e: BusEngine):
+        cpu = e.cpu
+        e.read(cpu.pc)
+        cpu.acc = op(cpu, cpu.acc)
+
+    return accum
+
+
+# Stack
+
+
+def _push(e: BusEngine, v: int):
+    cpu = e.cpu
+    e.write(CPU.STACK_ADDR + cpu.sp, v)
+    cpu.sp = (cpu.sp - 1) % 0x100
+
+
+def _pull(e: BusEngine) -> int:
+    cpu = e.cpu
+    cpu.sp = (cpu.sp + 1) % 0x100
+    return e.read(CPU.STACK_ADDR + cpu.sp)
+
+
+def _dummy_stack(e: BusEngine):
+    e.read(CPU.STACK_ADDR + e.cpu.sp)
+
+
+def _push_pch(e: BusEngine):
+    _push(e, e.cpu.pc >> 8)
+
+
+def _push_pcl(e: BusEngine):
+    _push(e, e.cpu.pc & 0xff)
+
+
+def _pha(e: BusEngine):
+    _push(e, e.cpu.acc)
+
+
+def _php(e: BusEngine):
+    _push(e, e.cpu.sr | 0x10)
+
+
+def _pla(e: BusEngine):
+    _lda(e.cpu, _pull(e))
+
+
+def _plp(e: BusEngine):
+    e.cpu.sr = _pull(e)
+
+
+def _pull_pcl(e: BusEngine):
+    e.value = _pull(e)
+
+
+def _pull_pch(e: BusEngine):
+    e.cpu.pc = e.value | _pull(e) << 8
+
+
+def _jsr_jump(e: BusEngine):
+    cpu = e.cpu
+    cpu.pc = e.ea | e.read(cpu.pc) << 8
+
+
+def _rts_inc(e: BusEngine):
+    cpu = e.cpu
+    e.read(cpu.pc)
+    cpu.pc = (cpu.pc + 1) % 0x10000
+
+
+def _brk_operand(e: BusEngine):
+    # The byte after BRK is read and skipped.
+    _rts_inc(e)
+
+
+def _brk_push_sr(e: BusEngine):
+    cpu = e.cpu
+    cpu.sr_b = True
+    _push(e, cpu.sr)
+
+
+def _brk_vector_lo(e: BusEngine):
+    e.value = e.read(CPU.BRK_IRQ_VECTOR)
+    e.cpu.sr_i = True
+
+
+def _brk_vector_hi(e: BusEngine):
+    e.cpu.pc = e.value | e.read(CPU.BRK_IRQ_VECTOR + 1) << 8
+
+
+# Jumps
+
+
+def _jmp_indirect(e: BusEngine):
+    # The pointer's high byte is read from the same page as its low byte.
+    e.cpu.pc = e.value | e.read((e.ea & 0xff00) | ((e.ea + 1) & 0xff)) << 8
+
+
+def _branch(condition: t.Callable[[CPU], bool]) -> Microcode:
+    def offset(e: BusEngine) -> bool:
+        cpu = e.cpu
+        v = e.read(cpu.pc)
+        cpu.pc = (cpu.pc + 1) % 0x10000
+        e.ea = (cpu.pc + v - (0x100 if v & 0x80 else 0)) % 0x10000
+        return not condition(cpu)
+
+    def taken(e: BusEngine) -> bool:
+        cpu = e.cpu
+        e.read(cpu.pc)
+        if (cpu.pc ^ e.ea) & 0xff00 == 0:
+            cpu.pc = e.ea
+            return True
+        cpu.pc = (cpu.pc & 0xff00) | (e.ea & 0xff)
+        return False
+
+    def fix_page(e: BusEngine):
+        e.read(e.cpu.pc)
+        e.cpu.pc = e.ea
+
+    return (offset, taken, fix_page)
+
+
+def _jam(e: BusEngine):
+    # Stay on the opcode forever (until reset).
+    cpu = e.cpu
+    cpu.pc = (cpu.pc - 1) % 0x10000
+    e.read(cpu.pc)
+
+
+def _unknown(e: BusEngine):
+    raise UnknownOpcodeError(f"Unknown opcode: {e.cpu.ins:02x}")
+
+
+_SPECIAL: t.Dict[t.Tuple[str, str], Microcode] = {
+    ("brk", "addr_implied"): (_brk_operand, _push_pch, _push_pcl, _brk_push_sr, _brk_vector_lo,
+                              _brk_vector_hi),
+    ("jsr", "addr_abs"): (_fetch_lo, _dummy_stack, _push_pch, _push_pcl, _jsr_jump),
+    ("rts", "addr_implied"): (_dummy_pc, _dummy_stack, _pull_pcl, _pull_pch, _rts_inc),
+    ("rti", "addr_implied"): (_dummy_pc, _dummy_stack, _plp, _pull_pcl, _pull_pch),
+    ("jmp", "addr_abs"): (_fetch_lo, _jsr_jump),
+    ("jmp", "addr_indirect"): (_fetch_lo, _fetch_hi, _pointer_lo, _jmp_indirect),
+    ("pha", "addr_implied"): (_dummy_pc, _pha),
+    ("php", "addr_implied"): (_dummy_pc, _php),
+    ("pla", "addr_implied"): (_dummy_pc, _dummy_stack, _pla),
+    ("plp", "addr_implied"): (_dummy_pc, _dummy_stack, _plp),
+    ("jam", "addr_implied"): (_jam, ),
+}
+
+# Microcode of the opcodes missing in `OPCODES`, by the name of the `CPU`'s handler.
+_UNKNOWN: t.Dict[str, Microcode] = {
+    "unknown": (_unknown, ),
+    "nop": (_implied(_IMPLIED["nop"]), ),
+    "jam": (_jam, ),
+}
+
+
+def _compile(s: OpcodeSpec) -> t.Optional[Microcode]:
+    code, mode = s.handler, s.addr_mode
+    if (code, mode) in _SPECIAL:
+        return _SPECIAL[code, mode]
+    if s.bus == "branch" and code in _BRANCHES:
+        return _branch(_BRANCHES[code])
+    if s.bus == "internal":
+        if s.mode == AddrMode.implied and code in _IMPLIED:
+            return (_implied(_IMPLIED[code]), )
+        if s.mode == AddrMode.accum and code in _RMW:
+            return (_accum(_RMW[code]), )
+        return None
+    if s.bus == "read" and s.mode == AddrMode.immed and code in _READ:
+        return (_immediate(_READ[code]), )
+    if mode not in _ADDRESSING:
+        return None
+    address = _ADDRESSING[mode]
+    indexed = mode in _INDEXED
+    if s.bus == "read" and code in _READ:
+        if indexed:
+            return address + (_read_indexed(_READ[code]), _read_operand(_READ[code]))
+        return address + (_read_operand(_READ[code]), )
+    fix = (_dummy_unfixed, ) if indexed else ()
+    if s.bus == "write" and code in _WRITE:
+        return address + fix + (_write_operand(_WRITE[code]), )
+    if s.bus == "rmw" and code in _RMW:
+        return address + fix + (_rmw_read, _rmw_dummy_write, _rmw_write(_RMW[code]))
+    return None
+
+
+# Micro-ops that may be skipped: the page fix up of a read, taken branch and page fix up.
+_SKIPPABLE = {"": 0, "page": 1, "branch": 2}
+
+
+def compile_opcode(s: OpcodeSpec) -> Microcode:
+    """ The microcode of the opcode specified by `s`, one micro-op per cycle after the
+        opcode fetch.
+    """
+    code = _compile(s)
+    if code is None:
+        raise ValueError(f"No microcode for {s!r}")
+    if len(code) != s.cycles - 1 + _SKIPPABLE[s.penalty]:
+        raise ValueError(f"The microcode of {s!r} takes {len(code) + 1} cycles")
+    return code
+
+
+_tables: t.Dict[type, t.List[t.Optional[Microcode]]] = {}
+
+
+def microcode(cpu_class: t.Type[CPU] = CPU) -> t.List[t.Optional[Microcode]]:
+    """ The microcode of all opcodes of `cpu_class`, `None` for the unknown ones.
+    """
+    if cpu_class not in _tables:
+        table: t.List[t.Optional[Microcode]] = [None] * 0x100
+        for op, s in cpu_class.SPEC.items():
+            table[op] = compile_opcode(s)
+        _tables[cpu_class] = table
+    return _tables[cpu_class]
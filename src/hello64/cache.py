@@ -0,0 +1,78 @@
+""" An on-disk cache for generated code and tables.
+
+    Whatever is generated from source text (e.g. the handlers of `hello64.codegen`) is
+    stored with `marshal` in a file named after the hash of that text, the cache `VERSION`
+    and the Python version. A changed source, format or interpreter simply misses the
+    cache, stale files are never read. Short-lived processes thereby skip the generation
+    all but the first time.
+
+    The directory is `$HELLO64_CACHE` or `~/.cache/hello64`, an empty `HELLO64_CACHE`
+    disables the cache. Failing to write it only costs the time to generate anew.
+"""
+import hashlib
+import linecache
+import logging
+import marshal
+import os
+import sys
+import types
+import typing as t
+
+logger = logging.getLogger("cache")
+
+ENV = "HELLO64_CACHE"
+# Bumped whenever the content of the cached values changes without their source.
+VERSION = 1
+
+T = t.TypeVar("T")
+
+
+def directory() -> str:
+    """ The cache directory, empty if caching is disabled.
+    """
+    return os.environ.get(ENV, os.path.join(os.path.expanduser("~"), ".cache", "hello64"))
+
+
+def path(name: str, source: str) -> str:
+    digest = hashlib.sha256(source.encode()).hexdigest()[:16]
+    return os.path.join(directory(),
+                        f"{name}-{digest}.v{VERSION}.{sys.implementation.cache_tag}.marshal")
+
+
+def load(name: str, source: str, build: t.Callable[[], T]) -> T:
+    """ The value `build()` generates from `source`, read from the cache if possible.
+        The value must be supported by `marshal`.
+    """
+    if not directory():
+        return build()
+    filename = path(name, source)
+    try:
+        with open(filename, "rb") as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    value = build()
+    tmp = f"{filename}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(tmp, "wb") as f:
+            marshal.dump(t.cast(t.Any, value), f)
+        # Atomic, so concurrent processes never read a partial file.
+        os.replace(tmp, filename)
+    except (OSError, ValueError) as e:
+        # `ValueError` if `marshal` does not support the value.
+        logger.debug("Cannot cache %s: %s", name, e)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    return value
+
+
+def compile_source(name: str, source: str) -> types.CodeType:
+    """ Compile the generated module `source`, using the cached code object if there is one.
+    """
+    filename = f"<{name}>"
+    # Let tracebacks show the generated lines.
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    return load(name, source, lambda: compile(source, filename, "exec"))
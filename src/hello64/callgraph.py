@@ -0,0 +1,155 @@
+""" Subroutine level profiling of emulated code.
+
+    `CallProfiler` keeps a shadow call stack that is only maintained by the call and
+    return instructions (`JSR`/`BRK` and `RTS`/`RTI`): their handlers in `CPU.opcodes` are
+    wrapped while the profiler is attached, so all other instructions run at full speed.
+    The cycles between two calls or returns are added to the current stack, which gives
+    the collapsed-stack format used by flame graph tools
+    (https://github.com/brendangregg/FlameGraph) for free.
+"""
+import typing as t
+from functools import wraps
+
+from hello64.cpu import CPU
+from hello64.symbols import SymbolTable
+
+JSR, BRK, RTS, RTI = 0x20, 0x00, 0x60, 0x40
+
+
+class RoutineStats:
+    __slots__ = ["address", "name", "calls", "inclusive", "exclusive"]
+
+    def __init__(self, address: int, name: str) -> None:
+        self.address = address
+        self.name = name
+        self.calls = 0
+        self.inclusive = 0
+        self.exclusive = 0
+
+    def __repr__(self) -> str:
+        return f"RoutineStats({self.name}, calls={self.calls}, inclusive={self.inclusive}, " \
+            f"exclusive={self.exclusive})"
+
+
+class CallProfiler:
+    """ Aggregate the cycles spent per subroutine of the program running on `cpu`.
+
+        Use it as a context manager (or call `attach()` and `detach()`) around running
+        the CPU. Routines are named after the symbols in `symbols` (defaults to
+        `cpu.symbols`) or after their address.
+    """
+    __slots__ = [
+        "cpu", "symbols", "_stack", "_sps", "_last", "_samples", "_calls", "_originals"
+    ]
+
+    def __init__(self, cpu: CPU, symbols: t.Optional[SymbolTable] = None) -> None:
+        self.cpu = cpu
+        self.symbols = symbols or cpu.symbols
+        # Entry addresses of the active routines along with the stack pointer
+        # at the time of the call. The root is never left.
+        self._stack: t.List[int] = [cpu.pc]
+        self._sps: t.List[int] = [0x100]
+        self._last = cpu.cycles
+        # Exclusive cycles per call stack.
+        self._samples: t.Dict[t.Tuple[int, ...], int] = {}
+        self._calls: t.Dict[int, int] = {}
+        self._originals: t.Dict[int, t.Tuple[t.Callable, t.Callable]] = {}
+
+    def __enter__(self) -> "CallProfiler":
+        self.attach()
+        return self
+
+    def __exit__(self, *_):
+        self.detach()
+
+    def attach(self):
+        opcodes = self.cpu.opcodes
+        for op, wrapper in ((JSR, self._wrap_call), (BRK, self._wrap_call),
+                            (RTS, self._wrap_return), (RTI, self._wrap_return)):
+            code, addr_mode = self._originals[op] = opcodes[op]
+            opcodes[op] = (wrapper(op, code), addr_mode)
+
+    def detach(self):
+        self._account()
+        self.cpu.opcodes.update(self._originals)
+        self._originals = {}
+
+    def _account(self):
+        now = self.cpu.cycles
+        key = tuple(self._stack)
+        self._samples[key] = self._samples.get(key, 0) + now - self._last
+        self._last = now
+
+    def _wrap_call(self, op: int, code: t.Callable) -> t.Callable:
+        cpu = self.cpu
+
+        @wraps(code)
+        def call(addr, m):
+            self._account()
+            if op == JSR:
+                target = addr
+            else:
+                target = cpu.mem.read(CPU.BRK_IRQ_VECTOR) + (cpu.mem.read(CPU.BRK_IRQ_VECTOR + 1)
+                                                            << 8)
+            self._stack.append(target)
+            self._sps.append(cpu.sp)
+            self._calls[target] = self._calls.get(target, 0) + 1
+            yield from code(addr, m)
+
+        return call
+
+    def _wrap_return(self, op: int, code: t.Callable) -> t.Callable:
+        cpu = self.cpu
+
+        @wraps(code)
+        def ret(addr, m):
+            self._account()
+            # Leave every routine that was called at or below the stack pointer we are
+            # returning to. This also cleans up routines that never return properly
+            # (e.g. those dropping their return address with `PLA`).
+            sp = (cpu.sp + (2 if op == RTS else 3)) % 0x100
+            while len(self._stack) > 1 and self._sps[-1] <= sp:
+                self._stack.pop()
+                self._sps.pop()
+            yield from code(addr, m)
+
+        return ret
+
+    def name(self, address: int) -> str:
+        if self.symbols is not None:
+            loc = self.symbols.lookup(address)
+            if loc.symbol is not None and loc.offset == 0:
+                return loc.symbol
+        return f"{address:04x}"
+
+    def collapsed(self) -> t.List[str]:
+        """ The profile in collapsed-stack format: `root;caller;callee cycles`.
+        """
+        if self._originals:
+            self._account()
+        return [
+            ";".join(self.name(a) for a in stack) + f" {cycles}"
+            for stack, cycles in sorted(self._samples.items()) if cycles
+        ]
+
+    def write_collapsed(self, path: str):
+        with open(path, "w") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
+
+    def stats(self) -> t.List[RoutineStats]:
+        """ Calls, inclusive and exclusive cycles per routine, most expensive first.
+        """
+        if self._originals:
+            self._account()
+        stats: t.Dict[int, RoutineStats] = {}
+        for stack, cycles in self._samples.items():
+            for address in set(stack):
+                if address not in stats:
+                    stats[address] = RoutineStats(address, self.name(address))
+                stats[address].inclusive += cycles
+            stats[stack[-1]].exclusive += cycles
+        for address, calls in self._calls.items():
+            if address in stats:
+                stats[address].calls = calls
+        return sorted(stats.values(), key=lambda s: s.inclusive, reverse=True)
@@ -0,0 +1,131 @@
+""" What both 6526 CIAs of the C64 have in common: 16 registers mirrored over a page and
+    two interval timers. Their data ports are what tells them apart, see
+    `hello64.keyboard.CIA1` and `hello64.iec.CIA2`.
+
+    The timers are not decremented every cycle. Each one remembers its value at the
+    cycle it was last looked at, and when a timer register is accessed the current
+    value is computed from the cycles of the CPU. Only counting cycles is supported, and
+    an underflow sets its interrupt flag without interrupting the CPU. The timers are part
+    of the snapshots of `hello64.journal`.
+"""
+import typing as t
+
+from hello64.machine import Machine
+from hello64.memory import Device
+
+if t.TYPE_CHECKING:
+    from hello64.cpu import CPU
+
+# Registers.
+TA_LO, TA_HI, TB_LO, TB_HI = 0x04, 0x05, 0x06, 0x07
+ICR = 0x0d
+CRA, CRB = 0x0e, 0x0f
+
+# Control register bits.
+START = 0x01
+ONE_SHOT = 0x08
+LOAD = 0x10
+# Anything but counting cycles (CNT or timer A underflows).
+INPUT_MODE = (0x20, 0x60)
+
+
+class CIA(Device):
+    """ The registers of a CIA with working timers.
+    """
+    __slots__ = ["regs", "cpu", "latches", "counters", "since", "flags", "mask"]
+
+    def __init__(self) -> None:
+        # The 16 registers, mirrored over the whole page.
+        self.regs = bytearray(16)
+        # The clock of the timers, set by `attach()`. Without one, time stands still.
+        self.cpu: t.Optional["CPU"] = None
+        self.latches = [0xffff, 0xffff]
+        # The value of each timer at cycle `since`.
+        self.counters = [0xffff, 0xffff]
+        self.since = [0, 0]
+        # The interrupt flags (bit 0 for timer A, bit 1 for timer B) and their mask.
+        self.flags = 0
+        self.mask = 0
+
+    def attach(self, machine: Machine, address: int):
+        """ Map the registers to the page at `address`, counting the cycles of `machine`.
+        """
+        machine.memory.map_device(self, address, address + 0x100)
+        self.cpu = machine.cpu
+
+    def read(self, address: int) -> int:
+        reg = address & 0x0f
+        if TA_LO <= reg <= TB_HI:
+            value = self._counter((reg - TA_LO) >> 1)
+            return value >> 8 if reg & 1 else value & 0xff
+        if reg == ICR:
+            self._counter(0)
+            self._counter(1)
+            flags, self.flags = self.flags, 0
+            return flags | (0x80 if flags & self.mask else 0)
+        return self.regs[reg]
+
+    def write(self, address: int, value: int):
+        reg = address & 0x0f
+        if TA_LO <= reg <= TB_HI:
+            i = (reg - TA_LO) >> 1
+            self._counter(i)
+            latch = self.latches[i]
+            if reg & 1:
+                self.latches[i] = latch & 0xff | value << 8
+                # Writing the high byte of a stopped timer loads it.
+                if not self.regs[CRA + i] & START:
+                    self.counters[i] = self.latches[i]
+            else:
+                self.latches[i] = latch & 0xff00 | value
+        elif reg == ICR:
+            if value & 0x80:
+                self.mask |= value & 0x1f
+            else:
+                self.mask &= ~value
+        elif reg in (CRA, CRB):
+            i = reg - CRA
+            self._counter(i)
+            if value & LOAD:
+                self.counters[i] = self.latches[i]
+            self.since[i] = self._now()
+            self.regs[reg] = value & ~LOAD
+        else:
+            self.regs[reg] = value
+
+    def snapshot(self) -> t.Any:
+        return (bytes(self.regs), tuple(self.latches), tuple(self.counters), tuple(self.since),
+                self.flags, self.mask)
+
+    def restore(self, state: t.Any):
+        regs, latches, counters, since, self.flags, self.mask = state
+        self.regs[:] = regs
+        self.latches, self.counters, self.since = list(latches), list(counters), list(since)
+
+    def _now(self) -> int:
+        return 0 if self.cpu is None else self.cpu.cycles
+
+    def _counter(self, i: int) -> int:
+        """ Bring timer `i` up to date and return its value.
+        """
+        cr = self.regs[CRA + i]
+        if not cr & START or cr & INPUT_MODE[i]:
+            return self.counters[i]
+        now = self._now()
+        # The cycles go back when the machine is taken back in time without restoring the
+        # timers (e.g. by `hello64.history.History`): count from there.
+        elapsed = max(now - self.since[i], 0)
+        counter = self.counters[i]
+        self.since[i] = now
+        if elapsed <= counter:
+            self.counters[i] = counter - elapsed
+        else:
+            # It underflowed, after `counter + 1` cycles and then every `latch + 1` cycles.
+            self.flags |= 1 << i
+            latch = self.latches[i]
+            if cr & ONE_SHOT:
+                self.regs[CRA + i] = cr & ~START
+                self.counters[i] = latch
+            else:
+                self.counters[i] = latch - (elapsed - counter - 1) % (latch + 1)
+        return self.counters[i]
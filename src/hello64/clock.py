@@ -1,3 +1,4 @@
+import asyncio
 import typing as t
 from time import time_ns
 
@@ -5,9 +6,8 @@ from time import time_ns
 class Clock:
     """ Simulate an oscillator to let us model the correct timing of cycles.
         It is hard to do accurate timing with Python and the simplistic approach we've
-        chosen. We could use asyncio (and the `sched` module) and may achieve better timing
-        accurancy along with less wasted resources due to the generators we use everywhere.
-        But we don't want to use asyncio for now.
+        chosen. This clock waits in a busy loop for every single cycle, see `AsyncClock`
+        for pacing whole batches of cycles within an asyncio event loop.
 
         So this is clearly just "best effort".
     """
@@ -41,3 +41,41 @@ class Clock:
                 next_ts += cycle_incr
             self.cycles += 1
             yield self.cycles
+
+
+class AsyncClock:
+    """ Pace batches of cycles to `frequency` by awaiting their deadline in an asyncio
+        event loop, so other coroutines (and other machines) can run in the meantime
+        instead of busy waiting.
+
+        The emulation runs ahead for a whole batch and then sleeps until the batch is
+        due. If it falls behind we count a miss and continue from there, the lost time
+        is not made up.
+    """
+    __slots__ = ["frequency", "misses", "cycles", "_start"]
+
+    def __init__(self, frequency: int) -> None:
+        self.frequency = frequency
+        self.misses = 0
+        self.cycles = 0
+        self._start: t.Optional[float] = None
+
+    def start(self):
+        self._start = asyncio.get_running_loop().time()
+        self.cycles = 0
+
+    async def advance(self, cycles: int):
+        """ Account for `cycles` elapsed cycles and wait until they are due.
+        """
+        loop = asyncio.get_running_loop()
+        if self._start is None:
+            self.start()
+        self.cycles += cycles
+        delay = self._start + self.cycles / self.frequency - loop.time()  # type: ignore
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            self.misses += 1
+            self._start -= delay  # type: ignore
+            # Still let the other coroutines run.
+            await asyncio.sleep(0)
@@ -0,0 +1,438 @@
+""" Specialized per-opcode handlers generated from source templates.
+
+    The handlers of `CPU` are generic over the addressing modes: each instruction calls
+    an addressing method returning an `(address, AddrMode)` tuple, checks the mode flags
+    for a crossed page and runs a generator yielding its cycles. Here every opcode of
+    `CPU.SPEC` gets its own plain function instead, with the addressing mode inlined and
+    the number of cycles computed rather than yielded:
+
+        def op_b1(c, read, write):      # LDA (zp),Y
+            p = read(c.pc)
+            ...
+            return 4 + ((a ^ b) > 0xff)
+
+    The source is assembled from the templates `_ADDRESSING` and `_OPERATIONS` below,
+    compiled once per CPU class and the code object cached on disk (see `hello64.cache`),
+    so later processes skip the compilation. Opcodes whose handler or addressing method a
+    variant overrides (see `hello64.variants`) keep running the generic handler.
+
+    `CompiledEngine` executes a `CPU` with these handlers, with the same stop conditions
+    and the same results as `CPU.run_until()`.
+"""
+import logging
+import math
+import textwrap
+import typing as t
+
+from hello64.cache import compile_source
+from hello64.conditions import ConditionSet, RunResult, StopCondition
+from hello64.cpu import CPU
+from hello64.idle import detector
+from hello64.spec import AddrMode, OpcodeSpec
+
+logger = logging.getLogger("cpu")
+
+# Executes the instruction of the opcode just fetched: `(cpu, read, write)` -> number
+# of cycles after the opcode fetch.
+Handler = t.Callable[[CPU, t.Callable[[int], int], t.Callable[[int, int], None]], int]
+
+# Addressing: advance the PC past the operand and set the effective address `a`. The
+# indexed modes also set the unindexed base address `b` to check for a crossed page.
+_ADDRESSING = {
+    AddrMode.implied: "",
+    AddrMode.accum: "",
+    AddrMode.immed: """
+        a = c.pc
+        c.pc = (a + 1) % 0x10000
+    """,
+    AddrMode.zerop: """
+        a = read(c.pc)
+        c.pc = (c.pc + 1) % 0x10000
+    """,
+    AddrMode.zerop_x: """
+        a = (read(c.pc) + c.idx) % 0x100
+        c.pc = (c.pc + 1) % 0x10000
+    """,
+    AddrMode.zerop_y: """
+        a = (read(c.pc) + c.idy) % 0x100
+        c.pc = (c.pc + 1) % 0x10000
+    """,
+    AddrMode.abs: """
+        pc = c.pc
+        a = read(pc) + (read((pc + 1) % 0x10000) << 8)
+        c.pc = (pc + 2) % 0x10000
+    """,
+    AddrMode.abs_x: """
+        pc = c.pc
+        b = read(pc) + (read((pc + 1) % 0x10000) << 8)
+        a = (b + c.idx) % 0x10000
+        c.pc = (pc + 2) % 0x10000
+    """,
+    AddrMode.abs_y: """
+        pc = c.pc
+        b = read(pc) + (read((pc + 1) % 0x10000) << 8)
+        a = (b + c.idy) % 0x10000
+        c.pc = (pc + 2) % 0x10000
+    """,
+    AddrMode.indirect: """
+        pc = c.pc
+        p = read(pc) + (read((pc + 1) % 0x10000) << 8)
+        c.pc = (pc + 2) % 0x10000
+        a = read(p) + (read((p & 0xff00) | ((p + 1) & 0xff)) << 8)
+    """,
+    AddrMode.indirect_x: """
+        p = (read(c.pc) + c.idx) % 0x100
+        c.pc = (c.pc + 1) % 0x10000
+        a = read(p) + (read((p + 1) % 0x100) << 8)
+    """,
+    AddrMode.indirect_y: """
+        p = read(c.pc)
+        c.pc = (c.pc + 1) % 0x10000
+        b = read(p) + (read((p + 1) % 0x100) << 8)
+        a = (b + c.idy) % 0x10000
+    """,
+}
+
+_BRANCH = """
+    if {cond}:
+        pc = c.pc
+        r = read(a)
+        n = pc + r - 0x100 if r & 0x80 else pc + r
+        c.pc = n % 0x10000
+        return 2 + (n >> 8 != pc >> 8)
+    return 1
+"""
+
+_COMPARE = """
+    v = {reg} - read(a)
+    c.sr_c = v >= 0
+    if v < 0:
+        v += 0x100
+    c.sr_z = v == 0
+    c.sr_n = bool(v & 0x80)
+"""
+
+_LOAD = """
+    v = read(a)
+    {reg} = v
+    c.sr_n = bool(v & 0x80)
+    c.sr_z = not v
+"""
+
+_TRANSFER = """
+    v = {src}
+    c.sr_n = bool(v & 0x80)
+    c.sr_z = not v
+    {dst} = v
+"""
+
+_INC = """
+    v = ({reg} {op} 1) % 0x100
+    c.sr_z = v == 0
+    c.sr_n = bool(v & 0x80)
+    {reg} = v
+"""
+
+# The instructions by handler name, doing exactly what the `CPU` handler does. `{operand}`
+# and `{store}` read and write the operand, i.e. the accumulator or memory at `a`.
+_OPERATIONS = {
+    "adc": "c._adc({operand})",
+    "and_": """
+        v = {operand} & c.acc
+        c.sr_z = v == 0
+        c.sr_n = bool(v & 0x80)
+        c.acc = v
+    """,
+    "asl": """
+        v = {operand}
+        c.sr_c = bool(v & 0x80)
+        v = (v << 1) % 0x100
+        c.sr_z = v == 0
+        c.sr_n = bool(v & 0x80)
+        {store}
+    """,
+    "bcc": _BRANCH.format(cond="not c.sr_c"),
+    "bcs": _BRANCH.format(cond="c.sr_c"),
+    "beq": _BRANCH.format(cond="c.sr_z"),
+    "bmi": _BRANCH.format(cond="c.sr_n"),
+    "bne": _BRANCH.format(cond="not c.sr_z"),
+    "bpl": _BRANCH.format(cond="not c.sr_n"),
+    "bvc": _BRANCH.format(cond="not c.sr_v"),
+    "bvs": _BRANCH.format(cond="c.sr_v"),
+    "bit": """
+        v = {operand}
+        c.sr_n = bool(v & 0x80)
+        c.sr_v = bool(v & 0x40)
+        c.sr_z = bool(v & c.acc == 0)
+    """,
+    "brk": """
+        pc = (c.pc + 1) % 0x10000
+        c.pc = pc
+        write(c.sp + 0x100, pc >> 8)
+        c.sp = (c.sp - 1) % 0x100
+        write(c.sp + 0x100, pc & 0xff)
+        c.sp = (c.sp - 1) % 0x100
+        c.sr_b = True
+        write(c.sp + 0x100, c.sr)
+        c.sp = (c.sp - 1) % 0x100
+        c.sr_i = True
+        c.pc = read(c.BRK_IRQ_VECTOR) + (read(c.BRK_IRQ_VECTOR + 1) << 8)
+    """,
+    "clc": "c.sr_c = False",
+    "cld": "c.sr_d = False",
+    "cli": "c.sr_i = False",
+    "clv": "c.sr_v = False",
+    "cmp": _COMPARE.format(reg="c.acc"),
+    "cpx": _COMPARE.format(reg="c.idx"),
+    "cpy": _COMPARE.format(reg="c.idy"),
+    "dec": """
+        v = {operand} - 1
+        if v < 0:
+            v += 0x100
+        c.sr_z = v == 0
+        c.sr_n = bool(v & 0x80)
+        {store}
+    """,
+    "dex": _INC.format(reg="c.idx", op="-"),
+    "dey": _INC.format(reg="c.idy", op="-"),
+    "eor": """
+        v = {operand} ^ c.acc
+        c.sr_z = v == 0
+        c.sr_n = bool(v & 0x80)
+        c.acc = v
+    """,
+    "inc": """
+        v = ({operand} + 1) % 0x100
+        c.sr_z = v == 0
+        c.sr_n = bool(v & 0x80)
+        {store}
+    """,
+    "inx": _INC.format(reg="c.idx", op="+"),
+    "iny": _INC.format(reg="c.idy", op="+"),
+    "jam": "c.pc = (c.pc - 1) % 0x10000",
+    "jmp": "c.pc = a",
+    "jsr": """
+        pc = (c.pc - 1) % 0x10000
+        write(c.sp + 0x100, pc >> 8)
+        c.sp = (c.sp - 1) % 0x100
+        write(c.sp + 0x100, pc & 0xff)
+        c.sp = (c.sp - 1) % 0x100
+        c.pc = a
+    """,
+    "lda": _LOAD.format(reg="c.acc"),
+    "ldx": _LOAD.format(reg="c.idx"),
+    "ldy": _LOAD.format(reg="c.idy"),
+    "lsr": """
+        v = {operand}
+        c.sr_c = bool(v & 0x01)
+        v = v >> 1
+        c.sr_n = bool(v & 0x80)
+        c.sr_z = not v
+        {store}
+    """,
+    "nop": "",
+    "ora": """
+        v = c.acc | {operand}
+        c.sr_n = bool(v & 0x80)
+        c.sr_z = not v
+        c.acc = v
+    """,
+    "pha": """
+        write(c.sp + 0x100, c.acc)
+        c.sp = (c.sp - 1) % 0x100
+    """,
+    "php": """
+        write(c.sp + 0x100, c.sr | 0x10)
+        c.sp = (c.sp - 1) % 0x100
+    """,
+    "pla": """
+        c.sp = (c.sp + 1) % 0x100
+        v = read(c.sp + 0x100)
+        c.sr_n = bool(v & 0x80)
+        c.sr_z = not v
+        c.acc = v
+    """,
+    "plp": """
+        c.sp = (c.sp + 1) % 0x100
+        c.sr = read(c.sp + 0x100)
+    """,
+    "rol": """
+        v = {operand} << 1
+        if c.sr_c:
+            v |= 0x01
+        c.sr_c = v > 0xff
+        v &= 0xff
+        c.sr_z = v == 0
+        c.sr_n = bool(v & 0x80)
+        {store}
+    """,
+    "ror": """
+        v = {operand}
+        if c.sr_c:
+            v |= 0x100
+        c.sr_c = bool(v & 0x01)
+        v = v >> 1
+        c.sr_z = v == 0
+        c.sr_n = bool(v & 0x80)
+        {store}
+    """,
+    "rti": """
+        sp = (c.sp + 1) % 0x100
+        c.sr = read(sp + 0x100)
+        sp = (sp + 1) % 0x100
+        lo = read(sp + 0x100)
+        sp = (sp + 1) % 0x100
+        c.pc = lo + (read(sp + 0x100) << 8)
+        c.sp = sp
+    """,
+    "rts": """
+        sp = (c.sp + 1) % 0x100
+        lo = read(sp + 0x100)
+        sp = (sp + 1) % 0x100
+        c.pc = (lo + (read(sp + 0x100) << 8) + 1) % 0x10000
+        c.sp = sp
+    """,
+    "sbc": "c._sbc({operand})",
+    "sec": "c.sr_c = True",
+    "sed": "c.sr_d = True",
+    "sei": "c.sr_i = True",
+    "sta": "write(a, c.acc)",
+    "stx": "write(a, c.idx)",
+    "sty": "write(a, c.idy)",
+    "tax": _TRANSFER.format(src="c.acc", dst="c.idx"),
+    "tay": _TRANSFER.format(src="c.acc", dst="c.idy"),
+    "tsx": _TRANSFER.format(src="c.sp", dst="c.idx"),
+    "txa": _TRANSFER.format(src="c.idx", dst="c.acc"),
+    "txs": "c.sp = c.idx",
+    "tya": _TRANSFER.format(src="c.idy", dst="c.acc"),
+}
+
+# The `CPU` methods the templates inline. A class overriding any of them keeps the
+# generic handlers for all opcodes.
+_INLINED = ("_read", "_write", "_read_with_acc", "_write_with_acc", "_push_stack",
+            "_pull_stack", "_jump_relative", "_inc_pc", "_timing")
+
+
+def specializable(cpu_class: t.Type[CPU], s: OpcodeSpec) -> bool:
+    """ Whether the opcode `s` of `cpu_class` runs the `CPU` handler and addressing mode,
+        i.e. the templates apply.
+    """
+    return s.handler in _OPERATIONS and s.mode in _ADDRESSING \
+        and getattr(cpu_class, s.handler) is getattr(CPU, s.handler) \
+        and getattr(cpu_class, s.addr_mode) is getattr(CPU, s.addr_mode) \
+        and all(getattr(cpu_class, name) is getattr(CPU, name) for name in _INLINED)
+
+
+def generate(s: OpcodeSpec) -> str:
+    """ The source of the handler `op_<opcode>` of the opcode `s`.
+    """
+    if s.mode == AddrMode.accum:
+        operand, store = "c.acc", "c.acc = v"
+    else:
+        operand, store = "read(a)", "write(a, v)"
+    operation = textwrap.dedent(_OPERATIONS[s.handler]).format(operand=operand, store=store)
+    body = textwrap.dedent(_ADDRESSING[s.mode]).strip() + "\n" + operation.strip()
+    if s.penalty == "page":
+        body += f"\nreturn {s.cycles - 1} + ((a ^ b) > 0xff)"
+    elif s.penalty == "":
+        body += f"\nreturn {s.cycles - 1}"
+    # Branches return on their own.
+    return f"def op_{s.opcode:02x}(c, read, write):  # {s.mnemonic} {s.mode.name}\n" \
+        + textwrap.indent(body.strip(), "    ") + "\n"
+
+
+def source(cpu_class: t.Type[CPU]) -> str:
+    """ The source of the handlers of all specializable opcodes of `cpu_class`.
+    """
+    return "\n\n".join(
+        generate(s) for _, s in sorted(cpu_class.SPEC.items()) if specializable(cpu_class, s))
+
+
+_handlers: t.Dict[type, t.List[t.Optional[Handler]]] = {}
+
+
+def handlers(cpu_class: t.Type[CPU] = CPU) -> t.List[t.Optional[Handler]]:
+    """ The specialized handlers of `cpu_class` by opcode, `None` where there is none.
+    """
+    if cpu_class not in _handlers:
+        namespace: t.Dict[str, t.Any] = {}
+        exec(compile_source(f"handlers-{cpu_class.__name__}", source(cpu_class)), namespace)
+        _handlers[cpu_class] = [namespace.get(f"op_{op:02x}") for op in range(0x100)]
+    return _handlers[cpu_class]
+
+
+def _generic(code: t.Callable, addr_mode: t.Callable) -> Handler:
+    """ Run the bound generic handler `code` like a specialized one.
+    """
+    def op(c: CPU, read: t.Callable[[int], int], write: t.Callable[[int, int], None]) -> int:
+        addr, m = addr_mode()
+        n = 0
+        for _ in code(addr, m):
+            n += 1
+        return n
+
+    return op
+
+
+class CompiledEngine:
+    """ Execute `cpu` with the specialized handlers of its class.
+    """
+    __slots__ = ["cpu", "handlers"]
+
+    def __init__(self, cpu: CPU) -> None:
+        self.cpu = cpu
+        compiled = handlers(type(cpu))
+        # Unknown opcodes go to the handler selected by `cpu.opcodes`.
+        self.handlers: t.List[Handler] = [
+            compiled[op] or _generic(*cpu.opcodes[op]) for op in range(0x100)
+        ]
+
+    @property
+    def cycles(self) -> int:
+        return self.cpu.cycles
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        """ Same as `CPU.run_until()`.
+        """
+        cs = ConditionSet(conditions)
+        cpu = self.cpu
+        start_cycles = cpu.cycles
+        max_cycles = start_cycles + cs.cycle_budget.cycles if cs.cycle_budget else math.inf
+        max_instructions = cs.ins_budget.instructions if cs.ins_budget else math.inf
+        debug = logger.isEnabledFor(logging.DEBUG)
+        # Looked up once per run, the class of `Memory` changes with its observers.
+        mem = cpu.mem
+        fetch, read, write = mem.fetch, mem.read, mem.write
+        ram = mem.ram
+        table = self.handlers
+        idle = detector(cpu, debug)
+        instructions = 0
+        while True:
+            pc = cpu.pc
+            cpu.ins = ins = fetch(pc)
+            cpu.pc = (pc + 1) % 0x10000
+            cpu.cycles += 1
+            if ins in cs.halt_opcodes:
+                return RunResult(cs.halt_opcodes[ins], cpu.cycles - start_cycles, instructions)
+            if debug:
+                cpu._log_instruction(pc)
+            cpu.cycles += table[ins](cpu, read, write)
+            instructions += 1
+            if cs.trap is not None and cpu.pc == pc:
+                return RunResult(cs.trap, cpu.cycles - start_cycles, instructions)
+            if cpu.pc in cs.pc_points:
+                return RunResult(cs.pc_points[cpu.pc], cpu.cycles - start_cycles, instructions)
+            for r in cs.pc_ranges:
+                if r.start <= cpu.pc < r.end:
+                    return RunResult(r, cpu.cycles - start_cycles, instructions)
+            for v in cs.mem_values:
+                if ram[v.address] == v.value:
+                    return RunResult(v, cpu.cycles - start_cycles, instructions)
+            if cpu.cycles >= max_cycles:
+                return RunResult(cs.cycle_budget, cpu.cycles - start_cycles,  # type: ignore
+                                 instructions)
+            if instructions >= max_instructions:
+                return RunResult(cs.ins_budget, cpu.cycles - start_cycles,  # type: ignore
+                                 instructions)
+            if cpu.pc <= pc and idle is not None:
+                instructions += idle.jumped(pc, instructions, max_cycles, max_instructions)
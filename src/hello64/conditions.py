@@ -0,0 +1,202 @@
+import typing as t
+
+
+class StopCondition:
+    """ Base class of all declarative stop conditions understood by `CPU.run_until()`.
+
+        The conditions themselves only carry data. `CPU.run_until()` sorts them by kind
+        once and then checks them inside the interpreter loop, so the host does not need
+        to step the CPU cycle by cycle just to decide when to stop.
+    """
+    __slots__: t.List[str] = []
+
+
+class Trap(StopCondition):
+    """ Stop when an instruction leaves the PC where it was, i.e. the program
+        is caught in a self-jump like `JMP *` or `BNE *`.
+    """
+    __slots__: t.List[str] = []
+
+    def __repr__(self) -> str:
+        return "Trap()"
+
+
+class PCRange(StopCondition):
+    """ Stop when an instruction leaves the PC in `start <= pc < end`.
+    """
+    __slots__ = ["start", "end"]
+
+    def __init__(self, start: int, end: int = 0x10000) -> None:
+        self.start = start
+        self.end = end
+
+    def __repr__(self) -> str:
+        return f"PCRange({self.start:04x}, {self.end:04x})"
+
+
+class CycleBudget(StopCondition):
+    """ Stop after the instruction during which at least `cycles` cycles have elapsed.
+    """
+    __slots__ = ["cycles"]
+
+    def __init__(self, cycles: int) -> None:
+        self.cycles = cycles
+
+    def __repr__(self) -> str:
+        return f"CycleBudget({self.cycles})"
+
+
+class InstructionBudget(StopCondition):
+    """ Stop after `instructions` instructions have been executed.
+    """
+    __slots__ = ["instructions"]
+
+    def __init__(self, instructions: int) -> None:
+        self.instructions = instructions
+
+    def __repr__(self) -> str:
+        return f"InstructionBudget({self.instructions})"
+
+
+class Opcode(StopCondition):
+    """ Stop as soon as `opcode` is fetched. The fetch cycle is counted, but the
+        instruction itself is not executed (useful to mark the end of a snippet
+        with an illegal opcode).
+    """
+    __slots__ = ["opcode"]
+
+    def __init__(self, opcode: int) -> None:
+        self.opcode = opcode
+
+    def __repr__(self) -> str:
+        return f"Opcode({self.opcode:02x})"
+
+
+class MemoryValue(StopCondition):
+    """ Stop when an instruction leaves `value` at `address`.
+    """
+    __slots__ = ["address", "value"]
+
+    def __init__(self, address: int, value: int) -> None:
+        self.address = address
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"MemoryValue({self.address:04x}, {self.value:02x})"
+
+
+class RunResult:
+    """ What `CPU.run_until()` returns: the condition that stopped the run and
+        the number of cycles and instructions executed by this call.
+    """
+    __slots__ = ["condition", "cycles", "instructions"]
+
+    def __init__(self, condition: StopCondition, cycles: int, instructions: int) -> None:
+        self.condition = condition
+        self.cycles = cycles
+        self.instructions = instructions
+
+    def __repr__(self) -> str:
+        return f"RunResult({self.condition!r}, cycles={self.cycles}, " \
+            f"instructions={self.instructions})"
+
+
+class ConditionSet:
+    """ `conditions` sorted by kind, the way the interpreter loops check them.
+    """
+    __slots__ = [
+        "trap", "halt_opcodes", "pc_points", "pc_ranges", "mem_values", "cycle_budget",
+        "ins_budget"
+    ]
+
+    def __init__(self, conditions: t.Sequence[StopCondition]) -> None:
+        if not conditions:
+            raise ValueError("At least one stop condition is needed")
+        self.trap: t.Optional[Trap] = None
+        self.halt_opcodes: t.Dict[int, Opcode] = {}
+        # Ranges of a single address (breakpoints, traps) by address, so that any number of
+        # them is checked with one lookup.
+        self.pc_points: t.Dict[int, PCRange] = {}
+        self.pc_ranges: t.List[PCRange] = []
+        self.mem_values: t.List[MemoryValue] = []
+        self.cycle_budget: t.Optional[CycleBudget] = None
+        self.ins_budget: t.Optional[InstructionBudget] = None
+        for c in conditions:
+            if isinstance(c, Trap):
+                self.trap = c
+            elif isinstance(c, Opcode):
+                self.halt_opcodes[c.opcode] = c
+            elif isinstance(c, PCRange):
+                if c.end == c.start + 1:
+                    self.pc_points.setdefault(c.start, c)
+                else:
+                    self.pc_ranges.append(c)
+            elif isinstance(c, MemoryValue):
+                self.mem_values.append(c)
+            elif isinstance(c, CycleBudget):
+                if self.cycle_budget is None or c.cycles < self.cycle_budget.cycles:
+                    self.cycle_budget = c
+            elif isinstance(c, InstructionBudget):
+                if self.ins_budget is None or c.instructions < self.ins_budget.instructions:
+                    self.ins_budget = c
+            else:
+                raise TypeError(f"Unknown stop condition: {c!r}")
+
+
+class BatchedRun:
+    """ Run `cpu` until one of `conditions` is met, but in batches, so the caller can do
+        other work (take snapshots, feed inputs, poll sockets, ...) in between.
+
+        Cycle and instruction budgets count from the start of the whole run, not from
+        the start of a batch.
+    """
+    __slots__ = ["cpu", "conditions", "start_cycles", "instructions", "result"]
+
+    def __init__(self, cpu: t.Any, *conditions: StopCondition) -> None:
+        self.cpu = cpu
+        self.conditions = conditions
+        self.start_cycles = cpu.cycles
+        self.instructions = 0
+        # Set as soon as one of `conditions` was met.
+        self.result: t.Optional[RunResult] = None
+
+    def run(self, cycles: t.Optional[int] = None, instructions: t.Optional[int] = None,
+            until: t.Sequence[StopCondition] = ()) -> t.Optional[RunResult]:
+        """ Run for (at least) another `cycles` cycles or `instructions` instructions,
+            whichever comes first, or without a limit if both are `None`. Conditions in
+            `until` end the batch early, but not the run.
+
+            :return: the result of the whole run once one of the conditions is met.
+        """
+        if self.result is not None:
+            return self.result
+        elapsed = self.cpu.cycles - self.start_cycles
+        conditions: t.List[StopCondition] = []
+        originals: t.Dict[int, StopCondition] = {}
+        for c in self.conditions:
+            if isinstance(c, CycleBudget):
+                adjusted: StopCondition = CycleBudget(c.cycles - elapsed)
+                remaining = c.cycles - elapsed
+            elif isinstance(c, InstructionBudget):
+                adjusted = InstructionBudget(c.instructions - self.instructions)
+                remaining = c.instructions - self.instructions
+            else:
+                conditions.append(c)
+                continue
+            if remaining <= 0:
+                self.result = RunResult(c, elapsed, self.instructions)
+                return self.result
+            originals[id(adjusted)] = c
+            conditions.append(adjusted)
+        batch = list(until)
+        if cycles is not None:
+            batch.append(CycleBudget(cycles))
+        if instructions is not None:
+            batch.append(InstructionBudget(instructions))
+        res = self.cpu.run_until(*conditions, *batch)
+        self.instructions += res.instructions
+        if any(res.condition is c for c in batch):
+            return None
+        self.result = RunResult(originals.get(id(res.condition), res.condition),
+                                self.cpu.cycles - self.start_cycles, self.instructions)
+        return self.result
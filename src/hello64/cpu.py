@@ -1,36 +1,49 @@
 import logging
 import math
 import typing as t
-from enum import IntEnum
 
+from hello64.conditions import ConditionSet, RunResult, StopCondition
 from hello64.dump import CPUDump
+from hello64.idle import detector
 from hello64.memory import Memory
+from hello64.spec import DOCUMENTED, AddrMode, Spec, Timing, opcodes, timing
+from hello64.symbols import SymbolTable
 
 logger = logging.getLogger("cpu")
 
 AddrOrACC = t.Union[int, t.Literal["A"]]
 
 
-class AddrMode(IntEnum):
-    implied = 1
-    immed = 2
-    accum = 4
-    zerop = 8
-    zerop_x = 16
-    zerop_y = 32
-    abs = 64
-    abs_x = 128
-    abs_y = 256
-    indirect = 512
-    indirect_x = 1024
-    indirect_y = 2048
-    page_boundary_crossed = 4096
+# The addressing modes whose address only depends on the operand, which
+# `CPU.run_until()` decodes once.
+_STATIC_MODES = {"addr_implied", "addr_accum", "addr_immed", "addr_zerop", "addr_abs"}
+
+
+class UnknownOpcodeError(Exception):
+    pass
+
+
+class OpcodeTable(dict):
+    """ The dispatch table of a `CPU`: opcode -> (bound handler, bound addressing mode).
+
+        Looking up an opcode it does not contain gives the handler for unknown opcodes, so
+        the interpreter loop needs no check of its own.
+    """
+    __slots__ = ["unknown"]
+
+    def __init__(self, table: t.Dict[int, t.Tuple[t.Callable, t.Callable]],
+                 unknown: t.Tuple[t.Callable, t.Callable]) -> None:
+        super().__init__(table)
+        self.unknown = unknown
+
+    def __missing__(self, opcode: int) -> t.Tuple[t.Callable, t.Callable]:
+        return self.unknown
 
 
 class CPU:
     __slots__ = [
         "mem", "acc", "idx", "idy", "sr_c", "sr_z", "sr_i", "sr_d", "sr_b", "sr_v", "sr_n", "pc",
-        "sp", "ins", "opcodes"
+        "sp", "ins", "opcodes", "timing", "symbols", "cycles", "skip_idle"
     ]
 
     RESET_VECTOR = 0xfffc
@@ -38,7 +51,18 @@ class CPU:
     BRK_IRQ_VECTOR = 0xfffe
     STACK_ADDR = 0x0100
 
-    def __init__(self, memory: Memory) -> None:
+    # The opcodes as specified in `hello64.spec` and the dispatch table generated from
+    # them: opcode -> (handler, addressing mode). Variants (see `hello64.variants`) compose
+    # their own from these when their class is defined.
+    SPEC: Spec = DOCUMENTED
+    OPCODES: t.Dict[int, t.Tuple[str, str]] = opcodes(SPEC)
+
+    # How to handle opcodes missing in `OPCODES`: raise `UnknownOpcodeError`, treat them
+    # as a 1 byte `NOP` or `JAM` (the CPU hangs, i.e. the PC stays where it is).
+    UNKNOWN_OPCODES = {"raise": "unknown", "nop": "nop", "jam": "jam"}
+    UNKNOWN = "raise"
+
+    def __init__(self, memory: Memory, unknown: t.Optional[str] = None) -> None:
         self.mem = memory
         # Registers
         self.acc = 0
@@ -58,160 +82,23 @@ class CPU:
         self.sp = 0
         # Instruction register holding the current instruction.
         self.ins = 0
-        # All opcodes
-        self.opcodes = {
-            0x69: (self.adc, self.addr_immed),
-            0x65: (self.adc, self.addr_zerop),
-            0x75: (self.adc, self.addr_zerop_x),
-            0x6d: (self.adc, self.addr_abs),
-            0x7d: (self.adc, self.addr_abs_x),
-            0x79: (self.adc, self.addr_abs_y),
-            0x61: (self.adc, self.addr_indirect_x),
-            0x71: (self.adc, self.addr_indirect_y),
-            0x29: (self.and_, self.addr_immed),
-            0x25: (self.and_, self.addr_zerop),
-            0x35: (self.and_, self.addr_zerop_x),
-            0x2d: (self.and_, self.addr_abs),
-            0x3d: (self.and_, self.addr_abs_x),
-            0x39: (self.and_, self.addr_abs_y),
-            0x21: (self.and_, self.addr_indirect_x),
-            0x31: (self.and_, self.addr_indirect_y),
-            0x0a: (self.asl, self.addr_accum),
-            0x06: (self.asl, self.addr_zerop),
-            0x16: (self.asl, self.addr_zerop_x),
-            0x0e: (self.asl, self.addr_abs),
-            0x1e: (self.asl, self.addr_abs_x),
-            0x24: (self.bit, self.addr_zerop),
-            0x2c: (self.bit, self.addr_abs),
-            0x10: (self.bpl, self.addr_immed),
-            0x30: (self.bmi, self.addr_immed),
-            0x50: (self.bvc, self.addr_immed),
-            0x70: (self.bvs, self.addr_immed),
-            0x90: (self.bcc, self.addr_immed),
-            0xb0: (self.bcs, self.addr_immed),
-            0xd0: (self.bne, self.addr_immed),
-            0xf0: (self.beq, self.addr_immed),
-            0x00: (self.brk, self.addr_implied),
-            0xc9: (self.cmp, self.addr_immed),
-            0xc5: (self.cmp, self.addr_zerop),
-            0xd5: (self.cmp, self.addr_zerop_x),
-            0xcd: (self.cmp, self.addr_abs),
-            0xdd: (self.cmp, self.addr_abs_x),
-            0xd9: (self.cmp, self.addr_abs_y),
-            0xc1: (self.cmp, self.addr_indirect_x),
-            0xd1: (self.cmp, self.addr_indirect_y),
-            0xe0: (self.cpx, self.addr_immed),
-            0xe4: (self.cpx, self.addr_zerop),
-            0xec: (self.cpx, self.addr_abs),
-            0xc0: (self.cpy, self.addr_immed),
-            0xc4: (self.cpy, self.addr_zerop),
-            0xcc: (self.cpy, self.addr_abs),
-            0xc6: (self.dec, self.addr_zerop),
-            0xd6: (self.dec, self.addr_zerop_x),
-            0xce: (self.dec, self.addr_abs),
-            0xde: (self.dec, self.addr_abs_x),
-            0x49: (self.eor, self.addr_immed),
-            0x45: (self.eor, self.addr_zerop),
-            0x55: (self.eor, self.addr_zerop_x),
-            0x4d: (self.eor, self.addr_abs),
-            0x5d: (self.eor, self.addr_abs_x),
-            0x59: (self.eor, self.addr_abs_y),
-            0x41: (self.eor, self.addr_indirect_x),
-            0x51: (self.eor, self.addr_indirect_y),
-            0x18: (self.clc, self.addr_implied),
-            0x38: (self.sec, self.addr_implied),
-            0x58: (self.cli, self.addr_implied),
-            0x78: (self.sei, self.addr_implied),
-            0xb8: (self.clv, self.addr_implied),
-            0xd8: (self.cld, self.addr_implied),
-            0xf8: (self.sed, self.addr_implied),
-            0xe6: (self.inc, self.addr_zerop),
-            0xf6: (self.inc, self.addr_zerop_x),
-            0xee: (self.inc, self.addr_abs),
-            0xfe: (self.inc, self.addr_abs_x),
-            0x4c: (self.jmp, self.addr_abs),
-            0x6c: (self.jmp, self.addr_indirect),
-            0x20: (self.jsr, self.addr_abs),
-            0xa9: (self.lda, self.addr_immed),
-            0xa5: (self.lda, self.addr_zerop),
-            0xb5: (self.lda, self.addr_zerop_x),
-            0xad: (self.lda, self.addr_abs),
-            0xbd: (self.lda, self.addr_abs_x),
-            0xb9: (self.lda, self.addr_abs_y),
-            0xa1: (self.lda, self.addr_indirect_x),
-            0xb1: (self.lda, self.addr_indirect_y),
-            0xa2: (self.ldx, self.addr_immed),
-            0xa6: (self.ldx, self.addr_zerop),
-            0xb6: (self.ldx, self.addr_zerop_y),
-            0xae: (self.ldx, self.addr_abs),
-            0xbe: (self.ldx, self.addr_abs_y),
-            0xa0: (self.ldy, self.addr_immed),
-            0xa4: (self.ldy, self.addr_zerop),
-            0xb4: (self.ldy, self.addr_zerop_x),
-            0xac: (self.ldy, self.addr_abs),
-            0xbc: (self.ldy, self.addr_abs_x),
-            0x4a: (self.lsr, self.addr_accum),
-            0x46: (self.lsr, self.addr_zerop),
-            0x56: (self.lsr, self.addr_zerop_x),
-            0x4e: (self.lsr, self.addr_abs),
-            0x5e: (self.lsr, self.addr_abs_x),
-            0xea: (self.nop, self.addr_implied),
-            0x09: (self.ora, self.addr_immed),
-            0x05: (self.ora, self.addr_zerop),
-            0x15: (self.ora, self.addr_zerop_x),
-            0x0d: (self.ora, self.addr_abs),
-            0x1d: (self.ora, self.addr_abs_x),
-            0x19: (self.ora, self.addr_abs_y),
-            0x01: (self.ora, self.addr_indirect_x),
-            0x11: (self.ora, self.addr_indirect_y),
-            0xaa: (self.tax, self.addr_implied),
-            0x8a: (self.txa, self.addr_implied),
-            0xca: (self.dex, self.addr_implied),
-            0xe8: (self.inx, self.addr_implied),
-            0xa8: (self.tay, self.addr_implied),
-            0x98: (self.tya, self.addr_implied),
-            0x88: (self.dey, self.addr_implied),
-            0xc8: (self.iny, self.addr_implied),
-            0x2a: (self.rol, self.addr_accum),
-            0x26: (self.rol, self.addr_zerop),
-            0x36: (self.rol, self.addr_zerop_x),
-            0x2e: (self.rol, self.addr_abs),
-            0x3e: (self.rol, self.addr_abs_x),
-            0x6a: (self.ror, self.addr_accum),
-            0x66: (self.ror, self.addr_zerop),
-            0x76: (self.ror, self.addr_zerop_x),
-            0x6e: (self.ror, self.addr_abs),
-            0x7e: (self.ror, self.addr_abs_x),
-            0x40: (self.rti, self.addr_implied),
-            0x60: (self.rts, self.addr_implied),
-            0xe9: (self.sbc, self.addr_immed),
-            0xe5: (self.sbc, self.addr_zerop),
-            0xf5: (self.sbc, self.addr_zerop_x),
-            0xed: (self.sbc, self.addr_abs),
-            0xfd: (self.sbc, self.addr_abs_x),
-            0xf9: (self.sbc, self.addr_abs_y),
-            0xe1: (self.sbc, self.addr_indirect_x),
-            0xf1: (self.sbc, self.addr_indirect_y),
-            0x85: (self.sta, self.addr_zerop),
-            0x95: (self.sta, self.addr_zerop_x),
-            0x8d: (self.sta, self.addr_abs),
-            0x9d: (self.sta, self.addr_abs_x),
-            0x99: (self.sta, self.addr_abs_y),
-            0x81: (self.sta, self.addr_indirect_x),
-            0x91: (self.sta, self.addr_indirect_y),
-            0x9a: (self.txs, self.addr_implied),
-            0xba: (self.tsx, self.addr_implied),
-            0x48: (self.pha, self.addr_implied),
-            0x68: (self.pla, self.addr_implied),
-            0x08: (self.php, self.addr_implied),
-            0x28: (self.plp, self.addr_implied),
-            0x86: (self.stx, self.addr_zerop),
-            0x96: (self.stx, self.addr_zerop_y),
-            0x8e: (self.stx, self.addr_abs),
-            0x84: (self.sty, self.addr_zerop),
-            0x94: (self.sty, self.addr_zerop_x),
-            0x8c: (self.sty, self.addr_abs),
-        }
+        # Number of cycles elapsed since the last (extended) reset.
+        self.cycles = 0
+        # Used to annotate the debug log with symbols and source lines.
+        self.symbols: t.Optional[SymbolTable] = None
+        # Whether `run_until()` skips idle loops (see `hello64.idle`).
+        self.skip_idle = True
+        # All opcodes, bound to this instance. Unknown ones are handled according to
+        # `unknown` (see `UNKNOWN_OPCODES`).
+        unknown = unknown or self.UNKNOWN
+        if unknown not in self.UNKNOWN_OPCODES:
+            raise ValueError(f"`unknown` must be one of {list(self.UNKNOWN_OPCODES)}")
+        self.opcodes = OpcodeTable(
+            {op: (getattr(self, code), getattr(self, addr_mode))
+             for op, (code, addr_mode) in self.OPCODES.items()},
+            (getattr(self, self.UNKNOWN_OPCODES[unknown]), self.addr_implied))
+        # Busy cycles per opcode, without and with a page crossed.
+        self.timing = _timing_table(type(self))
 
     @property
     def sr(self):
@@ -228,6 +115,12 @@ class CPU:
         self.sr_v = bool(v & 0x40)
         self.sr_n = bool(v & 0x80)
 
+    def describe(self, opcode: int) -> t.Tuple[str, AddrMode]:
+        """ Return the mnemonic and the addressing mode of `opcode`.
+        """
+        code, addr_mode = self.opcodes[opcode]
+        return code.__name__.rstrip("_").upper(), AddrMode[addr_mode.__name__[5:]]
+
     def dump(self, cycles: int) -> CPUDump:
         status = "".join([
             "N" if self.sr_n else "n",
@@ -266,6 +159,8 @@ class CPU:
         self.pc = self.mem.read(self.RESET_VECTOR) + (self.mem.read(self.RESET_VECTOR + 1) << 8)
         if extended:
             self.sp = 0xff
+            self.ins = 0
+            self.cycles = 0
             self.acc = self.idx = self.idy = 0
             self.sr_c = self.sr_z = self.sr_i = self.sr_d = False
             self.sr_d = self.sr_b = self.sr_v = self.sr_n = False
@@ -278,17 +173,93 @@ class CPU:
         while True:
             # Read instruction
             debug_pc = self.pc
-            self.ins = self.mem.read(self.pc)
+            self.ins = self.mem.fetch(self.pc)
             self._inc_pc()
+            self.cycles += 1
             yield "busy"
-            assert self.ins in self.opcodes, f"Unknow opcode: {self.ins:02x}"
             code, addr_mode = self.opcodes[self.ins]
             addr, m = addr_mode()
             if logger.isEnabledFor(logging.DEBUG):
-                addr_str = "" if addr == "implied" else " A " if addr == "A" else f" {addr:04x} "
-                logger.debug(
-                    f"PC {debug_pc:04x}: {code.__name__.upper()}{addr_str}({self.ins:02x})")
-            yield from code(addr, m)  # type: ignore
+                self._log_instruction(debug_pc)
+            for state in code(addr, m):  # type: ignore
+                self.cycles += 1
+                yield state
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        """ Execute whole instructions until one of the given `conditions` is met.
+
+            This runs the same instructions as `start()` but counts the cycles itself
+            instead of handing every single one to the caller, so a complete program
+            can be run with a single call.
+
+            :return: the condition that stopped the run along with the number of
+                     cycles and instructions executed.
+        """
+        cs = ConditionSet(conditions)
+        trap, halt_opcodes, pc_points, pc_ranges, mem_values = \
+            cs.trap, cs.halt_opcodes, cs.pc_points, cs.pc_ranges, cs.mem_values
+        cycle_budget, ins_budget = cs.cycle_budget, cs.ins_budget
+        start_cycles = self.cycles
+        max_cycles = start_cycles + cycle_budget.cycles if cycle_budget else math.inf
+        max_instructions = ins_budget.instructions if ins_budget else math.inf
+        debug = logger.isEnabledFor(logging.DEBUG)
+        mem = self.mem
+        fetch = mem.fetch
+        ram = mem.ram
+        opcodes = self.opcodes
+        idle = detector(self, debug)
+        # Decoded instructions by address: (generation of their page, opcode, handler,
+        # address, mode, next PC). Only kept for this run, the host may change `ram`
+        # directly in between, and not while the operand reads are counted.
+        decoded: t.Dict[int, t.Tuple[int, int, t.Callable, t.Any, t.Any, int]] = {}
+        generations = mem.generations
+        cache = mem.counters is None
+        instructions = 0
+        while True:
+            pc = self.pc
+            entry = decoded.get(pc)
+            if entry is not None and entry[0] == generations[pc >> 8]:
+                _, self.ins, code, addr, m, self.pc = entry
+                self.cycles += 1
+            else:
+                self.ins = ins = fetch(pc)
+                self.pc = (pc + 1) % 0x10000
+                self.cycles += 1
+                if ins in halt_opcodes:
+                    return RunResult(halt_opcodes[ins], self.cycles - start_cycles,
+                                     instructions)
+                code, addr_mode = opcodes[ins]
+                addr, m = addr_mode()
+                page = pc >> 8
+                # The operand must be in the same page, which no device is mapped to.
+                if cache and addr_mode.__name__ in _STATIC_MODES and \
+                        (self.pc - 1) >> 8 == page and mem.devices[page] is None:
+                    decoded[pc] = (generations[page], ins, code, addr, m, self.pc)
+            if debug:
+                self._log_instruction(pc)
+            n = 0
+            for _ in code(addr, m):  # type: ignore
+                n += 1
+            self.cycles += n
+            instructions += 1
+            if trap is not None and self.pc == pc:
+                return RunResult(trap, self.cycles - start_cycles, instructions)
+            if self.pc in pc_points:
+                return RunResult(pc_points[self.pc], self.cycles - start_cycles, instructions)
+            for r in pc_ranges:
+                if r.start <= self.pc < r.end:
+                    return RunResult(r, self.cycles - start_cycles, instructions)
+            for v in mem_values:
+                if ram[v.address] == v.value:
+                    return RunResult(v, self.cycles - start_cycles, instructions)
+            if self.cycles >= max_cycles:
+                return RunResult(cycle_budget, self.cycles - start_cycles,  # type: ignore
+                                 instructions)
+            if instructions >= max_instructions:
+                return RunResult(ins_budget, self.cycles - start_cycles,  # type: ignore
+                                 instructions)
+            if self.pc <= pc and idle is not None:
+                instructions += idle.jumped(pc, instructions, max_cycles, max_instructions)
 
     def addr_implied(self):
         return "implied", AddrMode.implied
@@ -308,37 +279,39 @@ class CPU:
 
     def addr_abs_x(self):
         addr1 = self.mem.read(self.pc) + (self.mem.read(self.pc + 1) << 8)
-        addr2 = addr1 + self.idx
+        addr2 = (addr1 + self.idx) % 0x10000
         self._inc_pc(2)
-        return addr2, AddrMode.abs_x | (addr2 // 0x100 -
-                                        addr1 // 0x100) * AddrMode.page_boundary_crossed
+        return addr2, AddrMode.abs_x | bool(
+            (addr1 ^ addr2) & 0xff00) * AddrMode.page_boundary_crossed
 
     def addr_abs_y(self):
         addr1 = self.mem.read(self.pc) + (self.mem.read(self.pc + 1) << 8)
-        addr2 = addr1 + self.idy
+        addr2 = (addr1 + self.idy) % 0x10000
         self._inc_pc(2)
-        return addr2, AddrMode.abs_y | (addr2 // 0x100 -
-                                        addr1 // 0x100) * AddrMode.page_boundary_crossed
+        return addr2, AddrMode.abs_y | bool(
+            (addr1 ^ addr2) & 0xff00) * AddrMode.page_boundary_crossed
 
     def addr_indirect(self):
         addr = self.mem.read(self.pc) + (self.mem.read(self.pc + 1) << 8)
         self._inc_pc(2)
-        addr = self.mem.read(addr) + (self.mem.read(addr + 1) << 8)
+        # The NMOS 6502 does not carry into the high byte of the pointer: JMP ($10FF)
+        # reads the target from $10FF and $1000.
+        addr = self.mem.read(addr) + (self.mem.read((addr & 0xff00) | ((addr + 1) & 0xff)) << 8)
         return addr, AddrMode.indirect
 
     def addr_indirect_x(self):
         addr = (self.mem.read(self.pc) + self.idx) % 0x100
         self._inc_pc()
-        addr = self.mem.read(addr) + (self.mem.read(addr + 1) << 8)
+        addr = self.mem.read(addr) + (self.mem.read((addr + 1) % 0x100) << 8)
         return addr, AddrMode.indirect_x
 
     def addr_indirect_y(self):
         addr0 = self.mem.read(self.pc)
         self._inc_pc()
-        addr1 = self.mem.read(addr0) + (self.mem.read(addr0 + 1) << 8)
+        addr1 = self.mem.read(addr0) + (self.mem.read((addr0 + 1) % 0x100) << 8)
         addr2 = (addr1 + self.idy) % 0x10000
-        return addr2, AddrMode.indirect_y | (addr2 // 0x100 -
-                                             addr1 // 0x100) * AddrMode.page_boundary_crossed
+        return addr2, AddrMode.indirect_y | bool(
+            (addr1 ^ addr2) & 0xff00) * AddrMode.page_boundary_crossed
 
     def addr_zerop(self):
         addr = self.mem.read(self.pc)
@@ -356,20 +329,12 @@ class CPU:
         return addr, AddrMode.zerop_y
 
     def adc(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
-        src = self._read(addr)
-        if self.sr_d:
-            d1 = self._from_BCD(src)
-            d2 = self._from_BCD(self.acc)
-            v = d1 + d2 + self.sr_c
-            self.acc = self._to_BCD(v % 100)
-            self.sr_c = v > 99
-        else:
-            self._add(src)
+        yield from self._timing(m)
+        self._adc(self._read(addr))
         yield "idle"
 
     def and_(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self._read(addr) & self.acc
         self.sr_z = v == 0
         self.sr_n = bool(v & 0x80)
@@ -377,7 +342,7 @@ class CPU:
         yield "idle"
 
     def asl(self, addr: AddrOrACC, m: AddrMode):
-        yield from self._mem_access_timing2(m)
+        yield from self._timing(m)
         v = self._read_with_acc(addr)
         self.sr_c = bool(v & 0x80)
         v = (v << 1) % 0x100
@@ -396,7 +361,7 @@ class CPU:
         yield from self._jump_relative(self.sr_z, addr)
 
     def bit(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self._read(addr)
         self.sr_n = bool(v & 0x80)
         self.sr_v = bool(v & 0x40)
@@ -413,7 +378,7 @@ class CPU:
         yield from self._jump_relative(not self.sr_n, addr)
 
     def brk(self, *_):
-        yield from ["busy"] * 5
+        yield from self._timing()
         self._inc_pc()
         self._push_stack(self.pc >> 8)
         self._push_stack(self.pc & 0xff)
@@ -446,7 +411,7 @@ class CPU:
         yield "idle"
 
     def cmp(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self.acc - self._read(addr)
         self.sr_c = v >= 0
         if v < 0:
@@ -456,7 +421,7 @@ class CPU:
         yield "idle"
 
     def cpx(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self.idx - self._read(addr)
         self.sr_c = v >= 0
         if v < 0:
@@ -466,7 +431,7 @@ class CPU:
         yield "idle"
 
     def cpy(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self.idy - self._read(addr)
         self.sr_c = v >= 0
         if v < 0:
@@ -476,13 +441,12 @@ class CPU:
         yield "idle"
 
     def dec(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing2(m)
+        yield from self._timing(m)
         v = (self._read(addr) - 1)
         if v < 0:
             v += 0x100
         self.sr_z = v == 0
         self.sr_n = bool(v & 0x80)
-        self.acc = v
         self._write(addr, v)
         yield "idle"
 
@@ -505,7 +469,7 @@ class CPU:
         yield "idle"
 
     def eor(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self._read(addr) ^ self.acc
         self.sr_z = v == 0
         self.sr_n = bool(v & 0x80)
@@ -513,7 +477,7 @@ class CPU:
         yield "idle"
 
     def inc(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing2(m)
+        yield from self._timing(m)
         v = (self._read(addr) + 1) % 0x100
         self.sr_z = v == 0
         self.sr_n = bool(v & 0x80)
@@ -535,15 +499,12 @@ class CPU:
         yield "idle"
 
     def jmp(self, addr: int, m: AddrMode):
-        yield "busy"
-        if m & AddrMode.indirect != 0:
-            yield "busy"
-            yield "busy"
+        yield from self._timing()
         self.pc = addr
         yield "idle"
 
     def jsr(self, addr: int, *_):
-        yield from ["busy"] * 4
+        yield from self._timing()
         self._inc_pc(-1)
         self._push_stack(self.pc >> 8)
         self._push_stack(self.pc & 0xff)
@@ -551,7 +512,7 @@ class CPU:
         yield "idle"
 
     def lda(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self._read(addr)
         self.acc = v
         self.sr_n = bool(v & 0x80)
@@ -559,7 +520,7 @@ class CPU:
         yield "idle"
 
     def ldx(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self._read(addr)
         self.idx = v
         self.sr_n = bool(v & 0x80)
@@ -567,7 +528,7 @@ class CPU:
         yield "idle"
 
     def ldy(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self._read(addr)
         self.idy = v
         self.sr_n = bool(v & 0x80)
@@ -575,7 +536,7 @@ class CPU:
         yield "idle"
 
     def lsr(self, addr: AddrOrACC, m: AddrMode):
-        yield from self._mem_access_timing2(m)
+        yield from self._timing(m)
         v = self._read_with_acc(addr)
         self.sr_c = bool(v & 0x01)
         v = v >> 1
@@ -584,11 +545,22 @@ class CPU:
         self._write_with_acc(addr, v)
         yield "idle"
 
-    def nop(self, *_):
+    def nop(self, addr: AddrOrACC, m: AddrMode):
+        # The undocumented NOPs of `hello64.variants.NMOS6502` read their operand.
+        yield from self._timing(m)
+        yield "idle"
+
+    def jam(self, *_):
+        # Stay on the opcode forever (until reset).
+        self._inc_pc(-1)
+        yield "idle"
+
+    def unknown(self, *_):
+        raise UnknownOpcodeError(f"Unknown opcode: {self.ins:02x}")
         yield "idle"
 
     def ora(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
+        yield from self._timing(m)
         v = self.acc | self._read(addr)
         self.sr_n = bool(v & 0x80)
         self.sr_z = not v
@@ -596,19 +568,19 @@ class CPU:
         yield "idle"
 
     def pha(self, *_):
-        yield "busy"
+        yield from self._timing()
         self._push_stack(self.acc)
         yield "idle"
 
     def php(self, *_):
-        yield "busy"
+        yield from self._timing()
         # Note: The "B" flag (bit 4) is always pushed as 1 according to specification.
         v = self.sr | 0x10
         self._push_stack(v)
         yield "idle"
 
     def pla(self, *_):
-        yield from ["busy"] * 2
+        yield from self._timing()
         v = self._pull_stack()
         self.sr_n = bool(v & 0x80)
         self.sr_z = not v
@@ -616,12 +588,12 @@ class CPU:
         yield "idle"
 
     def plp(self, *_):
-        yield from ["busy"] * 2
+        yield from self._timing()
         self.sr = self._pull_stack()
         yield "idle"
 
     def rol(self, addr: AddrOrACC, m: AddrMode):
-        yield from self._mem_access_timing2(m)
+        yield from self._timing(m)
         v = self._read_with_acc(addr) << 1
         if self.sr_c:
             v |= 0x01
@@ -633,7 +605,7 @@ class CPU:
         yield "idle"
 
     def ror(self, addr: AddrOrACC, m: AddrMode):
-        yield from self._mem_access_timing2(m)
+        yield from self._timing(m)
         v = self._read_with_acc(addr)
         if self.sr_c:
             v |= 0x100
@@ -645,20 +617,23 @@ class CPU:
         yield "idle"
 
     def rti(self, *_):
-        yield from ["busy"] * 4
+        yield from self._timing()
         self.sr = self._pull_stack()
         self.pc = self._pull_stack() + (self._pull_stack() << 8)
         yield "idle"
 
     def rts(self, *_):
-        yield from ["busy"] * 4
+        yield from self._timing()
         v = self._pull_stack() + (self._pull_stack() << 8)
-        self.pc = v + 1
+        self.pc = (v + 1) % 0x10000
         yield "idle"
 
     def sbc(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing1(m)
-        src = self._read(addr)
+        yield from self._timing(m)
+        self._sbc(self._read(addr))
+        yield "idle"
+
+    def _sbc(self, src: int):
         if self.sr_d:
             tmp = 0xf + (self.acc & 0xf) - (src & 0xf) + self.sr_c
             if (tmp < 0x10):
@@ -677,7 +652,6 @@ class CPU:
             self.acc = v & 0xff
         else:
             self._add(src ^ 0xff)
-        yield "idle"
 
     def sec(self, *_):
         self.sr_c = True
@@ -692,17 +666,17 @@ class CPU:
         yield "idle"
 
     def sta(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing3(m)
+        yield from self._timing(m)
         self._write(addr, self.acc)
         yield "idle"
 
     def stx(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing3(m)
+        yield from self._timing(m)
         self._write(addr, self.idx)
         yield "idle"
 
     def sty(self, addr: int, m: AddrMode):
-        yield from self._mem_access_timing3(m)
+        yield from self._timing(m)
         self._write(addr, self.idy)
         yield "idle"
 
@@ -760,42 +734,11 @@ class CPU:
         self.pc = new_pc % 0x10000
         yield "idle"
 
-    def _mem_access_timing1(self, m: AddrMode):
-        """ Timing for LDA etc.
+    def _timing(self, m: int = 0) -> t.Tuple[str, ...]:
+        """ The busy cycles of the current instruction.
         """
-        if m & AddrMode.zerop != 0:
-            pass
-            yield "busy"
-        elif m & (AddrMode.abs | AddrMode.zerop_x | AddrMode.zerop_y) != 0:
-            yield from ["busy"] * 2
-        elif m & AddrMode.indirect_y != 0:
-            yield from ["busy"] * 3
-            if m & AddrMode.page_boundary_crossed != 0:
-                yield "busy"
-        elif m & AddrMode.indirect_x != 0:
-            yield from ["busy"] * 4
-        elif m & (AddrMode.abs_y | AddrMode.abs_x) != 0:
-            yield from ["busy"] * 2
-            if m & AddrMode.page_boundary_crossed != 0:
-                yield "busy"
-
-    def _mem_access_timing2(self, m: AddrMode):
-        if m & AddrMode.zerop != 0:
-            yield from ["busy"] * 3
-        elif m & (AddrMode.abs | AddrMode.zerop_x) != 0:
-            yield from ["busy"] * 4
-        elif m & (AddrMode.abs_x) != 0:
-            yield from ["busy"] * 5
-
-    def _mem_access_timing3(self, m: AddrMode):
-        if m & AddrMode.zerop != 0:
-            yield "busy"
-        elif m & (AddrMode.abs | AddrMode.zerop_x | AddrMode.zerop_y) != 0:
-            yield from ["busy"] * 2
-        elif m & (AddrMode.abs_x | AddrMode.abs_y) != 0:
-            yield from ["busy"] * 3
-        elif m & (AddrMode.indirect_x | AddrMode.indirect_y) != 0:
-            yield from ["busy"] * 4
+        busy, crossed = self.timing[self.ins]
+        return crossed if m & AddrMode.page_boundary_crossed else busy
 
     def _pull_stack(self) -> int:
         self.sp = (self.sp + 1) % 0x100
@@ -826,9 +769,25 @@ class CPU:
     def _write(self, addr: int, v: int):
         self.mem.write(addr, v)
 
+    def _log_instruction(self, pc: int):
+        from hello64.disasm import decode
+        location = f" [{self.symbols.lookup(pc)}]" if self.symbols else ""
+        text = decode(self.mem.ram, pc, type(self)).text
+        logger.debug(f"PC {pc:04x}: {text} ({self.ins:02x}){location}")
+
     def _inc_pc(self, add=1):
         self.pc = (self.pc + add) % 0x10000
 
+    def _adc(self, src: int):
+        if self.sr_d:
+            d1 = self._from_BCD(src)
+            d2 = self._from_BCD(self.acc)
+            v = d1 + d2 + self.sr_c
+            self.acc = self._to_BCD(v % 100)
+            self.sr_c = v > 99
+        else:
+            self._add(src)
+
     def _add(self, src: int):
         v = src + self.acc + self.sr_c
         # The overflow bit is a bit tricky. It is set if the sign changes. This can only
@@ -847,3 +806,12 @@ class CPU:
 
     def _to_BCD(self, v):
         return int(math.floor(v / 10)) * 16 + (v % 10)
+
+
+_timings: t.Dict[t.Type[CPU], Timing] = {}
+
+
+def _timing_table(cpu_class: t.Type[CPU]) -> Timing:
+    if cpu_class not in _timings:
+        _timings[cpu_class] = timing(cpu_class.SPEC)
+    return _timings[cpu_class]
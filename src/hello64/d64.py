@@ -0,0 +1,347 @@
+""" D64 disk images, the sectors of a 1541 floppy disk one after the other.
+
+    An image is memory mapped rather than read, and its directory and BAM are indexed
+    once when it is opened. The files themselves are read from the mapping on demand
+    and kept once read, so loading the same program over and over (e.g. in a test suite,
+    see `D64.open()`) touches the image only once. `D64` is a `hello64.kernal.Storage`:
+
+        # Fast: LOAD and SAVE are serviced straight from the image.
+        Traps(machine, Kernal(D64("disk.d64")).handlers())
+        # Compatible: a 1541 on the serial bus, see `hello64.iec`.
+        iec.attach(machine, D64("disk.d64"))
+"""
+import mmap
+import os
+import typing as t
+
+from hello64.kernal import Storage, match
+
+SECTOR = 0x100
+
+# Sectors per track, for tracks 1 to 40.
+SECTORS = [21] * 17 + [19] * 7 + [18] * 6 + [17] * 10
+# Offset of each track in the image, track 1 first.
+OFFSETS = [0]
+for _n in SECTORS:
+    OFFSETS.append(OFFSETS[-1] + _n * SECTOR)
+
+# Image size -> number of tracks. The larger sizes of each have error bytes appended.
+SIZES = {
+    OFFSETS[35]: 35,
+    OFFSETS[35] + OFFSETS[35] // SECTOR: 35,
+    OFFSETS[40]: 40,
+    OFFSETS[40] + OFFSETS[40] // SECTOR: 40,
+}
+
+# The track of the BAM and the directory, and where the directory starts.
+DIR_TRACK = 18
+DIR_SECTOR = 1
+# The gap between the sectors of a file, as written by the 1541.
+INTERLEAVE = 10
+
+# File types, the low bits of the type byte of a directory entry.
+TYPES = ("DEL", "SEQ", "PRG", "USR", "REL")
+PRG = 2
+CLOSED = 0x80
+LOCKED = 0x40
+
+# (track, sector)
+Location = t.Tuple[int, int]
+
+
+class Entry:
+    """ A file in the directory.
+    """
+    __slots__ = ["name", "type", "start", "blocks", "offset"]
+
+    def __init__(self, name: bytes, type: int, start: Location, blocks: int,
+                 offset: int) -> None:
+        self.name = name
+        # The raw type byte, see `TYPES`, `CLOSED` and `LOCKED`.
+        self.type = type
+        self.start = start
+        self.blocks = blocks
+        # Where the entry is in the image.
+        self.offset = offset
+
+    def __repr__(self) -> str:
+        return f"Entry({self.name!r}, {TYPES[self.type & 7]}, {self.blocks} blocks)"
+
+
+class D64(Storage):
+    """ A disk image, from a file (memory mapped, written back only if `writable`) or
+        from its contents (copied).
+    """
+    __slots__ = ["path", "data", "writable", "tracks", "entries", "_files"]
+
+    # Images opened by `open()`, by path.
+    _opened: t.Dict[str, t.Tuple[t.Tuple[int, int], "D64"]] = {}
+
+    def __init__(self, image: t.Union[str, bytes, bytearray], writable: bool = False) -> None:
+        self.path: t.Optional[str] = None
+        self.data: t.Union[bytearray, mmap.mmap]
+        self.writable = writable or not isinstance(image, str)
+        if isinstance(image, str):
+            self.path = image
+            with open(image, "r+b" if writable else "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0,
+                                      access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        else:
+            self.data = bytearray(image)
+        if len(self.data) not in SIZES:
+            size = len(self.data)
+            self.close()
+            raise ValueError(f"Not a D64 image, {size} bytes")
+        self.tracks = SIZES[len(self.data)]
+        self.entries = self._index()
+        # The contents of the files read so far, by start location.
+        self._files: t.Dict[Location, bytes] = {}
+
+    @classmethod
+    def open(cls, path: str) -> "D64":
+        """ The image at `path`, read-only. The same object is returned as long as the
+            file does not change, so the image is only mapped and indexed once.
+        """
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        cached = cls._opened.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        image = cls(path)
+        cls._opened[path] = (key, image)
+        return image
+
+    @classmethod
+    def blank(cls, name: bytes = b"", disk_id: bytes = b"00") -> "D64":
+        """ A formatted, empty 35 track disk.
+        """
+        image = cls(bytes(OFFSETS[35]))
+        bam = image.sector(DIR_TRACK, 0)
+        bam[0:4] = bytes((DIR_TRACK, DIR_SECTOR, ord("A"), 0))
+        for track in range(1, 36):
+            n = SECTORS[track - 1]
+            bits = (1 << n) - 1
+            bam[4 * track:4 * track + 4] = bytes((n, bits & 0xff, bits >> 8 & 0xff, bits >> 16))
+        bam[0x90:0xab] = _pad(name, 16) + b"\xa0\xa0" + _pad(disk_id, 2) + b"\xa02A" + b"\xa0" * 4
+        image.sector(DIR_TRACK, DIR_SECTOR)[0:2] = b"\x00\xff"
+        image._allocate(DIR_TRACK, 0)
+        image._allocate(DIR_TRACK, DIR_SECTOR)
+        return image
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def sector(self, track: int, sector: int) -> memoryview:
+        if not 1 <= track <= self.tracks or not 0 <= sector < SECTORS[track - 1]:
+            raise ValueError(f"No sector {track}/{sector}")
+        offset = OFFSETS[track - 1] + sector * SECTOR
+        return memoryview(self.data)[offset:offset + SECTOR]
+
+    @property
+    def name(self) -> bytes:
+        return bytes(self.sector(DIR_TRACK, 0)[0x90:0xa0]).rstrip(b"\xa0")
+
+    @property
+    def id(self) -> bytes:
+        return bytes(self.sector(DIR_TRACK, 0)[0xa2:0xa4])
+
+    def free(self) -> int:
+        """ The number of free blocks, without the directory track.
+        """
+        bam = self.sector(DIR_TRACK, 0)
+        return sum(bam[4 * track] for track in range(1, 36) if track != DIR_TRACK)
+
+    def find(self, name: bytes) -> t.Optional[Entry]:
+        """ The first file matching `name` (see `hello64.kernal.match()`).
+        """
+        for e in self.entries:
+            if e.type & 7 and match(name, e.name):
+                return e
+        return None
+
+    def read(self, entry: Entry) -> bytes:
+        """ The contents of a file.
+        """
+        data = self._files.get(entry.start)
+        if data is None:
+            data = self._files[entry.start] = self._chain(entry.start)
+        return data
+
+    def load(self, name: bytes) -> t.Optional[bytes]:
+        if name in (b"$", b"$0", b"0:$"):
+            return self.listing()
+        entry = self.find(name)
+        if entry is None or not entry.type & CLOSED:
+            return None
+        return self.read(entry)
+
+    def save(self, name: bytes, data: bytes) -> bool:
+        """ Write a PRG file, replacing an existing one if `name` starts with `@`.
+        """
+        if not self.writable:
+            return False
+        replace = name.startswith(b"@")
+        name = name.split(b":", 1)[1] if b":" in name else name
+        if not name or any(c in name for c in b"*?,"):
+            return False
+        existing = next((e for e in self.entries if e.type & 7 and e.name == name), None)
+        if existing is not None and not replace:
+            return False
+        blocks = max(1, -(-len(data) // (SECTOR - 2)))
+        if blocks > self.free():
+            return False
+        slot = self._free_slot()
+        if slot is None:
+            return False
+        if existing is not None:
+            self._delete(existing)
+        start = self._write_chain(data)
+        self.data[slot + 2:slot + 32] = bytes((CLOSED | PRG, ) + start) + _pad(name, 16) + \
+            bytes(9) + bytes((blocks & 0xff, blocks >> 8))
+        self.entries = self._index()
+        return True
+
+    def listing(self) -> bytes:
+        """ The directory as a BASIC program, the way a 1541 sends it for `LOAD "$",8`.
+        """
+        bam = self.sector(DIR_TRACK, 0)
+        header = b'\x12"' + bytes(bam[0x90:0xa0]) + b'" ' + bytes(bam[0xa2:0xa7])
+        lines = [(0, header.replace(b"\xa0", b" "))]
+        for e in self.entries:
+            quoted = b'"' + e.name + b'"'
+            kind = TYPES[e.type & 7].encode() if e.type & 7 < len(TYPES) else b"???"
+            text = b" " * (4 - len(str(e.blocks))) + quoted.ljust(18) + \
+                (b" " if e.type & CLOSED else b"*") + kind + (b"<" if e.type & LOCKED else b"")
+            lines.append((e.blocks, text))
+        lines.append((self.free(), b"BLOCKS FREE.".ljust(25)))
+        address = 0x0401
+        program = bytearray(b"\x01\x04")
+        for number, text in lines:
+            address += 4 + len(text) + 1
+            program += bytes((address & 0xff, address >> 8, number & 0xff, number >> 8))
+            program += text + b"\0"
+        return bytes(program + b"\0\0")
+
+    def _index(self) -> t.List[Entry]:
+        entries = []
+        seen: t.Set[Location] = set()
+        location = (DIR_TRACK, DIR_SECTOR)
+        while location[0] and location not in seen:
+            seen.add(location)
+            sector = self.sector(*location)
+            base = OFFSETS[location[0] - 1] + location[1] * SECTOR
+            for i in range(0, SECTOR, 32):
+                raw = sector[i:i + 32]
+                if raw[2]:
+                    entries.append(
+                        Entry(bytes(raw[5:21]).rstrip(b"\xa0"), raw[2], (raw[3], raw[4]),
+                              raw[30] | raw[31] << 8, base + i))
+            location = (sector[0], sector[1])
+        return entries
+
+    def _chain(self, location: Location) -> bytes:
+        """ The data of the sectors linked from `location` on.
+        """
+        data = bytearray()
+        seen: t.Set[Location] = set()
+        while location[0] and location not in seen:
+            seen.add(location)
+            sector = self.sector(*location)
+            if sector[0]:
+                data += sector[2:]
+            else:
+                # The last sector, the second byte is the index of its last byte.
+                data += sector[2:max(sector[1] + 1, 2)]
+            location = (sector[0], sector[1])
+        return bytes(data)
+
+    def _write_chain(self, data: bytes) -> Location:
+        chunks = [data[i:i + SECTOR - 2] for i in range(0, len(data), SECTOR - 2)] or [b""]
+        locations = []
+        last: t.Optional[Location] = None
+        for _ in chunks:
+            last = self._next_free(last)
+            self._allocate(*last)
+            locations.append(last)
+        for i, chunk in enumerate(chunks):
+            sector = self.sector(*locations[i])
+            if i + 1 < len(chunks):
+                sector[0:2] = bytes(locations[i + 1])
+            else:
+                sector[0:2] = bytes((0, len(chunk) + 1))
+            sector[2:2 + len(chunk)] = chunk
+            sector[2 + len(chunk):] = bytes(SECTOR - 2 - len(chunk))
+        self._files.clear()
+        return locations[0]
+
+    def _next_free(self, last: t.Optional[Location]) -> Location:
+        """ The free sector to write after `last`: on the same track if possible, else on
+            the next one further away from the directory track.
+        """
+        if last is not None:
+            track, sector = last
+            n = SECTORS[track - 1]
+            for i in range(n):
+                s = (sector + INTERLEAVE + i) % n
+                if self._is_free(track, s):
+                    return track, s
+        for distance in range(1, 36):
+            for track in (DIR_TRACK - distance, DIR_TRACK + distance):
+                if 1 <= track <= 35 and self._bam_entry(track)[0]:
+                    return track, next(s for s in range(SECTORS[track - 1])
+                                       if self._is_free(track, s))
+        raise ValueError("Disk full")
+
+    def _bam_entry(self, track: int) -> memoryview:
+        return self.sector(DIR_TRACK, 0)[4 * track:4 * track + 4]
+
+    def _is_free(self, track: int, sector: int) -> bool:
+        return bool(self._bam_entry(track)[1 + sector // 8] & (1 << sector % 8))
+
+    def _allocate(self, track: int, sector: int, free: bool = False):
+        entry = self._bam_entry(track)
+        bit = 1 << sector % 8
+        if free != bool(entry[1 + sector // 8] & bit):
+            entry[1 + sector // 8] ^= bit
+            entry[0] += 1 if free else -1
+
+    def _delete(self, entry: Entry):
+        location = entry.start
+        seen: t.Set[Location] = set()
+        while location[0] and location not in seen:
+            seen.add(location)
+            self._allocate(*location, free=True)
+            sector = self.sector(*location)
+            location = (sector[0], sector[1])
+        self.data[entry.offset + 2] = 0
+        self._files.clear()
+
+    def _free_slot(self) -> t.Optional[int]:
+        """ The offset of an unused directory entry, adding a directory sector if needed.
+        """
+        location = (DIR_TRACK, DIR_SECTOR)
+        while True:
+            sector = self.sector(*location)
+            base = OFFSETS[location[0] - 1] + location[1] * SECTOR
+            for i in range(0, SECTOR, 32):
+                if not sector[i + 2]:
+                    return base + i
+            if not sector[0]:
+                break
+            location = (sector[0], sector[1])
+        for s in range(location[1] + 3, location[1] + 3 + SECTORS[DIR_TRACK - 1]):
+            s %= SECTORS[DIR_TRACK - 1]
+            if self._is_free(DIR_TRACK, s):
+                self._allocate(DIR_TRACK, s)
+                sector[0:2] = bytes((DIR_TRACK, s))
+                new = self.sector(DIR_TRACK, s)
+                new[:] = bytes(SECTOR)
+                new[1] = 0xff
+                return OFFSETS[DIR_TRACK - 1] + s * SECTOR
+        return None
+
+
+def _pad(name: bytes, length: int) -> bytes:
+    return name[:length].ljust(length, b"\xa0")
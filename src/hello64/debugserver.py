@@ -0,0 +1,261 @@
+""" A debug server speaking (a subset of) the GDB remote serial protocol.
+
+    External debuggers and tools connect over a local TCP socket and can read and write
+    registers and memory, set breakpoints, step and continue - no Python callbacks
+    need to be embedded into the emulator. While continuing, the CPU runs in batches of
+    `batch` cycles between polls of the socket, so the debugging overhead stays small.
+
+    Packets are `$<data>#<checksum>`, each acknowledged with `+`; a single `\\x03` byte
+    interrupts a running CPU. Supported commands:
+
+        ?                   reason of the last stop
+        g / G<hex>          read / write all registers
+        p<n> / P<n>=<hex>   read / write register `n`
+        m<addr>,<len>       read memory
+        M<addr>,<len>:<hex> write memory
+        Z0,<addr>,<kind>    set a breakpoint (`z0` removes it)
+        s / c               step one instruction / continue
+        D / k               detach / kill
+
+    There is no official 6502 target description, registers are ordered as in `REGS`
+    with the PC as 16 bit little endian value and all others as a single byte.
+"""
+import argparse
+import asyncio
+import logging
+import typing as t
+
+from hello64.conditions import BatchedRun, InstructionBudget, PCRange, StopCondition
+from hello64.cpu import UnknownOpcodeError
+from hello64.machine import Machine
+
+logger = logging.getLogger("debugserver")
+
+# Register name (a `CPU` attribute) and size in bytes.
+REGS = (("acc", 1), ("idx", 1), ("idy", 1), ("sr", 1), ("sp", 1), ("pc", 2))
+
+SIGINT, SIGILL, SIGTRAP = 2, 4, 5
+INTERRUPT = 0x03
+
+
+def checksum(data: bytes) -> int:
+    return sum(data) % 0x100
+
+
+def encode_packet(data: str) -> bytes:
+    payload = data.encode("latin-1")
+    return b"$" + payload + b"#" + f"{checksum(payload):02x}".encode()
+
+
+def _hex_value(value: int, size: int) -> str:
+    return value.to_bytes(size, "little").hex()
+
+
+def _register(n: str) -> t.Tuple[str, int]:
+    """ The name and size of register number `n` (hex), `ValueError` if there is none.
+    """
+    index = int(n, 16)
+    if not 0 <= index < len(REGS):
+        raise ValueError(f"No register {index}")
+    return REGS[index]
+
+
+class DebugServer:
+    """ Serve the GDB remote protocol for `machine`, one client at a time.
+    """
+    __slots__ = ["machine", "batch", "breakpoints", "signal", "_lock"]
+
+    def __init__(self, machine: Machine, batch: int = 10_000) -> None:
+        self.machine = machine
+        self.batch = batch
+        self.breakpoints: t.Set[int] = set()
+        # The signal reported for the last stop.
+        self.signal = SIGTRAP
+        # Serializes the clients, created by `start()` in the loop it is used in.
+        self._lock: t.Optional[asyncio.Lock] = None
+
+    async def start(self, host: str = "127.0.0.1",
+                    port: int = 0) -> "asyncio.base_events.Server":
+        """ Start listening, `port` 0 picks a free port (see `server.sockets`).
+        """
+        self._lock = asyncio.Lock()
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            packets: asyncio.Queue = asyncio.Queue()
+            interrupt = asyncio.Event()
+            receiver = asyncio.create_task(self._receive(reader, writer, packets, interrupt))
+            try:
+                while True:
+                    packet = await packets.get()
+                    if packet is None:
+                        break
+                    interrupt.clear()
+                    reply = await self.execute(packet, interrupt)
+                    if reply is None:
+                        break
+                    writer.write(encode_packet(reply))
+                    await writer.drain()
+            finally:
+                receiver.cancel()
+                writer.close()
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       packets: asyncio.Queue, interrupt: asyncio.Event):
+        """ Split the incoming bytes into packets. Interrupts are signalled right away,
+            so they are seen while the CPU is running.
+        """
+        buf = b""
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                buf += data
+                while buf:
+                    if buf[0] == INTERRUPT:
+                        interrupt.set()
+                        buf = buf[1:]
+                    elif buf[:1] != b"$":
+                        # Acks and garbage between packets.
+                        buf = buf[1:]
+                    else:
+                        end = buf.find(b"#")
+                        if end < 0 or len(buf) < end + 3:
+                            break
+                        payload, sum_ = buf[1:end], buf[end + 1:end + 3]
+                        buf = buf[end + 3:]
+                        if int(sum_, 16) != checksum(payload):
+                            writer.write(b"-")
+                            continue
+                        writer.write(b"+")
+                        await packets.put(payload.decode("latin-1"))
+        finally:
+            await packets.put(None)
+
+    async def execute(self, packet: str, interrupt: t.Optional[asyncio.Event] = None
+                      ) -> t.Optional[str]:
+        """ Execute a single command and return the reply, `None` ends the session.
+        """
+        cmd, args = packet[:1], packet[1:]
+        if cmd in ("D", "k"):
+            return "OK" if cmd == "D" else None
+        if cmd in ("c", "s"):
+            if args:
+                try:
+                    self.machine.cpu.pc = int(args, 16) % 0x10000
+                except ValueError:
+                    return "E01"
+            if cmd == "c":
+                return await self.cont(interrupt or asyncio.Event())
+            return self._run(InstructionBudget(1))
+        try:
+            return self.command(cmd, args)
+        except ValueError:
+            return "E01"
+
+    def command(self, cmd: str, args: str) -> str:
+        """ Execute all commands that do not run the CPU.
+        """
+        cpu = self.machine.cpu
+        if cmd == "?":
+            return f"S{self.signal:02x}"
+        if cmd == "g":
+            return "".join(_hex_value(getattr(cpu, r), size) for r, size in REGS)
+        if cmd == "G":
+            values = bytes.fromhex(args)
+            for r, size in REGS:
+                setattr(cpu, r, int.from_bytes(values[:size], "little"))
+                values = values[size:]
+            return "OK"
+        if cmd == "p":
+            r, size = _register(args)
+            return _hex_value(getattr(cpu, r), size)
+        if cmd == "P":
+            n, value = args.split("=")
+            r, size = _register(n)
+            setattr(cpu, r, int.from_bytes(bytes.fromhex(value), "little"))
+            return "OK"
+        if cmd == "m":
+            start, length = (int(v, 16) for v in args.split(","))
+            return bytes(self.machine.memory.ram[start:start + length]).hex()
+        if cmd == "M":
+            where, data = args.split(":")
+            start = int(where.split(",")[0], 16)
+            for i, byte in enumerate(bytes.fromhex(data)):
+                self.machine.memory.write((start + i) % 0x10000, byte)
+            return "OK"
+        if cmd in ("Z", "z"):
+            kind, where, _ = args.split(",")
+            if kind != "0":
+                return ""
+            address = int(where, 16)
+            if cmd == "Z":
+                self.breakpoints.add(address)
+            else:
+                self.breakpoints.discard(address)
+            return "OK"
+        if cmd == "H":
+            return "OK"
+        if cmd == "q" and args.startswith("Supported"):
+            return "PacketSize=4000"
+        # Unsupported, the client falls back or gives up.
+        return ""
+
+    def _run(self, *conditions: StopCondition) -> str:
+        try:
+            self.machine.run_until(*conditions)
+            self.signal = SIGTRAP
+        except UnknownOpcodeError:
+            self.signal = SIGILL
+        return f"S{self.signal:02x}"
+
+    async def cont(self, interrupt: asyncio.Event) -> str:
+        """ Run until a breakpoint is hit or the client interrupts.
+        """
+        run = BatchedRun(self.machine.cpu, *(PCRange(a, a + 1) for a in self.breakpoints))
+        try:
+            while run.run(self.batch) is None:
+                # Give the receiver a chance to see an interrupt.
+                await asyncio.sleep(0)
+                if interrupt.is_set():
+                    self.signal = SIGINT
+                    return f"S{self.signal:02x}"
+        except UnknownOpcodeError:
+            self.signal = SIGILL
+            return f"S{self.signal:02x}"
+        self.signal = SIGTRAP
+        return f"S{self.signal:02x}"
+
+
+async def serve(machine: Machine, host: str, port: int):
+    server = await DebugServer(machine).start(host, port)
+    for sock in server.sockets:
+        logger.info("Listening on %s:%d", *sock.getsockname()[:2])
+    async with server:
+        await server.serve_forever()
+
+
+def main(args: t.Optional[t.Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Debug a program via the GDB remote protocol")
+    parser.add_argument("program", help="binary to load")
+    parser.add_argument("--load", type=lambda v: int(v, 0), default=0,
+                        help="address to load the program to")
+    parser.add_argument("--pc", type=lambda v: int(v, 0), default=None,
+                        help="start address (defaults to the load address)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6510)
+    opts = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+    machine = Machine()
+    with open(opts.program, "rb") as f:
+        machine.load(opts.load, f.read())
+    machine.cpu.pc = opts.load if opts.pc is None else opts.pc
+    asyncio.run(serve(machine, opts.host, opts.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+""" Disassembler producing the syntax understood by `tests/assembler.py`:
+
+        0x8000: LDA #0x42
+        0x8002: STA %0x10,X
+        0x8004: BNE 0x8000
+"""
+import typing as t
+
+from hello64.cpu import CPU
+from hello64.memory import RAM, Memory
+from hello64.spec import AddrMode
+
+BRANCHES = {"BPL", "BMI", "BVC", "BVS", "BCC", "BCS", "BNE", "BEQ", "BRA"}
+
+# opcode -> (mnemonic, addressing mode, length)
+OpcodeInfo = t.Tuple[str, AddrMode, int]
+_tables: t.Dict[t.Type[CPU], t.Dict[int, OpcodeInfo]] = {}
+
+
+def opcode_table(cpu_class: t.Type[CPU] = CPU) -> t.Dict[int, OpcodeInfo]:
+    """ Mnemonic, addressing mode and instruction length of all opcodes known to `cpu_class`.
+    """
+    table = _tables.get(cpu_class)
+    if table is None:
+        table = _tables[cpu_class] = {
+            op: (s.mnemonic, s.mode, s.size)
+            for op, s in cpu_class.SPEC.items()
+        }
+    return table
+
+
+class Instruction:
+    __slots__ = ["address", "opcode", "mnemonic", "mode", "length", "operand"]
+
+    def __init__(self, address: int, opcode: int, mnemonic: str, mode: AddrMode, length: int,
+                 operand: int) -> None:
+        self.address = address
+        self.opcode = opcode
+        self.mnemonic = mnemonic
+        self.mode = mode
+        self.length = length
+        self.operand = operand
+
+    def __str__(self) -> str:
+        return f"0x{self.address:04x}: {self.text}"
+
+    @property
+    def text(self) -> str:
+        """ The instruction without its address.
+        """
+        m, v = self.mode, self.operand
+        if self.mnemonic == "DATA":
+            arg = f" #0x{v:02x}"
+        elif self.mnemonic in BRANCHES:
+            target = (self.address + 2 + (v - 0x100 if v & 0x80 else v)) % 0x10000
+            arg = f" 0x{target:04x}"
+        elif m == AddrMode.implied:
+            arg = ""
+        elif m == AddrMode.accum:
+            arg = " A"
+        elif m == AddrMode.immed:
+            arg = f" #0x{v:02x}"
+        elif m == AddrMode.zerop:
+            arg = f" %0x{v:02x}"
+        elif m == AddrMode.zerop_x:
+            arg = f" %0x{v:02x},X"
+        elif m == AddrMode.zerop_y:
+            arg = f" %0x{v:02x},Y"
+        elif m == AddrMode.abs:
+            arg = f" 0x{v:04x}"
+        elif m == AddrMode.abs_x:
+            arg = f" 0x{v:04x},X"
+        elif m == AddrMode.abs_y:
+            arg = f" 0x{v:04x},Y"
+        elif m == AddrMode.indirect:
+            arg = f" [0x{v:04x}]"
+        elif m == AddrMode.indirect_x:
+            arg = f" [0x{v:02x},X]"
+        elif m == AddrMode.zerop_indirect:
+            arg = f" [0x{v:02x}]"
+        elif m == AddrMode.abs_indirect_x:
+            arg = f" [0x{v:04x},X]"
+        else:
+            arg = f" [0x{v:02x},Y]"
+        return f"{self.mnemonic}{arg}"
+
+
+def decode(ram: RAM, address: int, cpu_class: t.Type[CPU] = CPU) -> Instruction:
+    """ Decode the instruction at `address` without any caching.
+    """
+    op = ram[address]
+    info = opcode_table(cpu_class).get(op)
+    if info is None:
+        return Instruction(address, op, "DATA", AddrMode.immed, 1, op)
+    mnemonic, mode, length = info
+    if length == 1:
+        operand = 0
+    elif length == 2:
+        operand = ram[(address + 1) % 0x10000]
+    else:
+        operand = ram[(address + 1) % 0x10000] + (ram[(address + 2) % 0x10000] << 8)
+    return Instruction(address, op, mnemonic, mode, length, operand)
+
+
+class Disassembler:
+    """ Disassemble `memory` with a per-address cache of decoded instructions.
+
+        The cache covers `start <= address < end`. Writes through `Memory.write()` invalidate
+        the instructions the written byte belongs to, direct changes to `Memory.ram` need an
+        explicit `invalidate()`. Used as a context manager, it stops observing the memory
+        at the end of the block.
+    """
+    __slots__ = ["memory", "start", "end", "cpu_class", "_cache"]
+
+    def __init__(self, memory: Memory, start: int = 0, end: int = 0x10000,
+                 cpu_class: t.Type[CPU] = CPU) -> None:
+        self.memory = memory
+        self.start = start
+        self.end = end
+        # The CPU variant whose opcodes are decoded.
+        self.cpu_class = cpu_class
+        self._cache: t.List[t.Optional[Instruction]] = [None] * 0x10000
+        memory.add_write_observer(self._on_write)
+
+    def close(self):
+        """ Stop observing the memory.
+        """
+        self.memory.remove_write_observer(self._on_write)
+
+    def __enter__(self) -> "Disassembler":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def invalidate(self, start: int = 0, end: int = 0x10000):
+        # An instruction starting up to two bytes before `start` may cover it.
+        start = max(0, start - 2)
+        self._cache[start:end] = [None] * (end - start)
+
+    def _on_write(self, address: int, _):
+        cache = self._cache
+        cache[address] = None
+        cache[address - 1] = None
+        cache[address - 2] = None
+
+    def decode(self, address: int) -> Instruction:
+        ins = self._cache[address]
+        if ins is not None:
+            return ins
+        ins = decode(self.memory.ram, address, self.cpu_class)
+        if self.start <= address < self.end:
+            self._cache[address] = ins
+        return ins
+
+    def instructions(self, start: int, end: int) -> t.Iterator[Instruction]:
+        """ Decode the instructions in `start <= address < end` one after the other.
+        """
+        address = start
+        while address < end:
+            ins = self.decode(address)
+            yield ins
+            address += ins.length
+
+    def listing(self, start: int, end: int) -> str:
+        return "\n".join(str(ins) for ins in self.instructions(start, end))
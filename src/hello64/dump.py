@@ -1,5 +1,8 @@
 import typing as t
 
+if t.TYPE_CHECKING:
+    from hello64.memory import RAM
+
 
 class CPUDump:
     def __init__(self,
@@ -36,7 +39,7 @@ class CPUDump:
         })
 
 
-def hexdump(b: bytearray, start: int, length: int):
+def hexdump(b: "RAM", start: int, length: int):
     lines = []
     for i in range(start, start + length, 16):
         line = [f"{i:04x}: "]
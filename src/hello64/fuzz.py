@@ -0,0 +1,299 @@
+""" Differential fuzzing of the CPU's execution engines.
+
+    A `Case` is a random instruction stream together with random registers and memory.
+    It is executed by every engine in lockstep and the complete machine state is compared
+    after each instruction. Failing cases are shrunk to a minimal instruction stream and can
+    be saved (along with the trace of a reference engine) and replayed later.
+
+    Run it with:
+
+        python -m hello64.fuzz --cases 10000 --jobs 8 --out fuzz-failures
+"""
+import argparse
+import json
+import os
+import random
+import typing as t
+from multiprocessing import Pool
+
+from hello64.bus import BusEngine
+from hello64.codegen import CompiledEngine
+from hello64.conditions import InstructionBudget
+from hello64.cpu import CPU
+from hello64.memory import Memory
+from hello64.spec import OPERAND_SIZE
+
+# Executes exactly one instruction and returns the number of cycles it took.
+Step = t.Callable[[], int]
+State = t.Tuple[int, ...]
+
+
+def generator_engine(cpu: CPU) -> Step:
+    """ Drive `CPU.start()` cycle by cycle until the instruction is done.
+    """
+    stepper = cpu.start()
+
+    def step():
+        cycles = 0
+        for state in stepper:
+            cycles += 1
+            if state == "idle":
+                break
+        return cycles
+
+    return step
+
+
+def run_until_engine(cpu: CPU) -> Step:
+    """ Execute one instruction with `CPU.run_until()`.
+    """
+    budget = InstructionBudget(1)
+    return lambda: cpu.run_until(budget).cycles
+
+
+def bus_engine(cpu: CPU) -> Step:
+    """ Execute one instruction with `BusEngine.run_until()`.
+    """
+    engine = BusEngine(cpu)
+    budget = InstructionBudget(1)
+    return lambda: engine.run_until(budget).cycles
+
+
+def compiled_engine(cpu: CPU) -> Step:
+    """ Execute one instruction with `CompiledEngine.run_until()`.
+    """
+    engine = CompiledEngine(cpu)
+    budget = InstructionBudget(1)
+    return lambda: engine.run_until(budget).cycles
+
+
+ENGINES: t.Dict[str, t.Callable[[CPU], Step]] = {
+    "generator": generator_engine,
+    "run_until": run_until_engine,
+    "bus": bus_engine,
+    "compiled": compiled_engine,
+}
+
+
+class Case:
+    """ Everything needed to reproduce a single fuzzing run.
+
+        `program` is a list of instructions (each a list of bytes) placed at `origin`.
+        `fill` seeds the random memory content, `None` means all zeros.
+    """
+    __slots__ = ["regs", "program", "fill", "origin"]
+
+    def __init__(self, regs: t.Dict[str, int], program: t.List[t.List[int]],
+                 fill: t.Optional[int], origin: int) -> None:
+        self.regs = regs
+        self.program = program
+        self.fill = fill
+        self.origin = origin
+
+    @classmethod
+    def generate(cls, seed: int, length: int = 32) -> "Case":
+        rnd = random.Random(seed)
+        cpu = CPU(Memory())
+        choices = sorted(cpu.opcodes)
+        program = []
+        for _ in range(length):
+            op = rnd.choice(choices)
+            size = OPERAND_SIZE[cpu.describe(op)[1]]
+            program.append([op] + [rnd.randrange(0x100) for _ in range(size)])
+        regs = {r: rnd.randrange(0x100) for r in ("acc", "idx", "idy", "sp", "sr")}
+        return cls(regs, program, rnd.randrange(2**32), 0x0200 + rnd.randrange(0x7000))
+
+    def machine(self) -> CPU:
+        if self.fill is None:
+            ram = bytearray(0x10000)
+        else:
+            ram = bytearray(random.Random(self.fill).randbytes(0x10000))
+        addr = self.origin
+        for ins in self.program:
+            for v in ins:
+                ram[addr % 0x10000] = v
+                addr += 1
+        memory = Memory()
+        memory.ram = ram
+        cpu = CPU(memory)
+        for r, v in self.regs.items():
+            setattr(cpu, r, v)
+        cpu.pc = self.origin
+        return cpu
+
+    def to_json(self) -> t.Dict[str, t.Any]:
+        return {
+            "regs": self.regs,
+            "program": self.program,
+            "fill": self.fill,
+            "origin": self.origin
+        }
+
+    @classmethod
+    def from_json(cls, d: t.Dict[str, t.Any]) -> "Case":
+        return cls(d["regs"], d["program"], d["fill"], d["origin"])
+
+    def __repr__(self) -> str:
+        program = " ".join("".join(f"{v:02x}" for v in ins) for ins in self.program)
+        return f"Case(origin={self.origin:04x}, fill={self.fill}, regs={self.regs}, " \
+            f"program={program})"
+
+
+class Divergence:
+    """ The engines disagreed about the state after instruction `index`.
+    """
+    __slots__ = ["index", "states"]
+
+    def __init__(self, index: int, states: t.Dict[str, t.Any]) -> None:
+        self.index = index
+        self.states = states
+
+    def __repr__(self) -> str:
+        states = "\n".join(f"  {k}: {v}" for k, v in self.states.items())
+        return f"Divergence after instruction {self.index}:\n{states}"
+
+
+def state(cpu: CPU, cycles: int) -> State:
+    return (cpu.pc, cpu.sp, cpu.acc, cpu.idx, cpu.idy, cpu.sr, cpu.ins, cycles, cpu.cycles)
+
+
+def execute(case: Case,
+            engines: t.Sequence[str],
+            reference: t.Optional[t.List[State]] = None) -> t.Optional[Divergence]:
+    """ Execute `case` with all `engines` in lockstep and compare their state (and
+        the memory) after each instruction, and optionally against a `reference` trace.
+    """
+    cpus = [case.machine() for _ in engines]
+    steps = [ENGINES[e](cpu) for e, cpu in zip(engines, cpus)]
+    known = cpus[0].opcodes
+    for i in range(len(case.program)):
+        if cpus[0].mem.read(cpus[0].pc) not in known:
+            # Both engines would just fail on an unknown opcode.
+            return None
+        states: t.Dict[str, t.Any] = {}
+        for e, cpu, step in zip(engines, cpus, steps):
+            try:
+                states[e] = state(cpu, step())
+            except Exception as ex:
+                states[e] = repr(ex)
+        if reference is not None and i < len(reference):
+            states["reference"] = tuple(reference[i])
+        if len(set(states.values())) > 1:
+            return Divergence(i, states)
+        if any(isinstance(v, str) for v in states.values()):
+            # All engines failed the same way, there is nothing left to compare.
+            return None
+        ram = cpus[0].mem.ram
+        for e, cpu in zip(engines[1:], cpus[1:]):
+            if cpu.mem.ram != ram:
+                diff = next(a for a in range(0x10000) if cpu.mem.ram[a] != ram[a])
+                return Divergence(
+                    i, {
+                        engines[0]: f"mem[{diff:04x}] = {ram[diff]:02x}",
+                        e: f"mem[{diff:04x}] = {cpu.mem.ram[diff]:02x}"
+                    })
+    return None
+
+
+def trace(case: Case, engine: str) -> t.List[State]:
+    """ Record the state after each instruction of `case` executed by `engine`.
+    """
+    cpu = case.machine()
+    step = ENGINES[engine](cpu)
+    states = []
+    for _ in case.program:
+        if cpu.mem.read(cpu.pc) not in cpu.opcodes:
+            break
+        states.append(state(cpu, step()))
+    return states
+
+
+def shrink(case: Case, engines: t.Sequence[str], divergence: Divergence) -> Case:
+    """ Greedily reduce `case` while it keeps failing: cut the program after the failing
+        instruction, drop single instructions, clear the memory and the registers.
+    """
+    def fails(c: Case) -> bool:
+        return execute(c, engines) is not None
+
+    candidate = Case(dict(case.regs), case.program[:divergence.index + 1], case.fill,
+                     case.origin)
+    if fails(candidate):
+        case = candidate
+    i = len(case.program) - 1
+    while i >= 0:
+        candidate = Case(case.regs, case.program[:i] + case.program[i + 1:], case.fill,
+                         case.origin)
+        if candidate.program and fails(candidate):
+            case = candidate
+        i -= 1
+    if case.fill is not None:
+        candidate = Case(case.regs, case.program, None, case.origin)
+        if fails(candidate):
+            case = candidate
+    for r in list(case.regs):
+        if case.regs[r] != 0:
+            candidate = Case(dict(case.regs, **{r: 0}), case.program, case.fill, case.origin)
+            if fails(candidate):
+                case = candidate
+    return case
+
+
+def fuzz_range(args: t.Tuple[int, int, int, t.Sequence[str]]) -> t.List[t.Dict[str, t.Any]]:
+    """ Fuzz the seeds `start` to `stop` and return the shrunk failures.
+    """
+    start, stop, length, engines = args
+    failures = []
+    for seed in range(start, stop):
+        case = Case.generate(seed, length)
+        divergence = execute(case, engines)
+        if divergence is None:
+            continue
+        small = shrink(case, engines, divergence)
+        failures.append({
+            "seed": seed,
+            "case": small.to_json(),
+            "divergence": repr(execute(small, engines) or divergence),
+            "trace": trace(small, engines[0]),
+        })
+    return failures
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the CPU engines")
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--length", type=int, default=32, help="instructions per case")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--out", help="directory to store failing cases in")
+    parser.add_argument("--replay", help="replay a stored failing case against its trace")
+    args = parser.parse_args(argv)
+    engines = args.engines.split(",")
+
+    if args.replay:
+        with open(args.replay) as f:
+            failure = json.load(f)
+        divergence = execute(Case.from_json(failure["case"]), engines, failure.get("trace"))
+        print(divergence or "No divergence")
+        return 1 if divergence else 0
+
+    chunk = max(1, min(500, args.cases // (args.jobs * 4) or 1))
+    ranges = [(s, min(s + chunk, args.seed + args.cases), args.length, engines)
+              for s in range(args.seed, args.seed + args.cases, chunk)]
+    failures = []
+    with Pool(args.jobs) as pool:
+        for res in pool.imap_unordered(fuzz_range, ranges):
+            for failure in res:
+                print(f"Seed {failure['seed']}: {failure['divergence']}")
+                failures.append(failure)
+    if args.out and failures:
+        os.makedirs(args.out, exist_ok=True)
+        for failure in failures:
+            with open(os.path.join(args.out, f"{failure['seed']}.json"), "w") as f:
+                json.dump(failure, f)
+    print(f"{args.cases} cases, {len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+""" Memory access statistics.
+
+    While counters are enabled (`Memory.enable_counters()`) every read, write and
+    opcode fetch is counted per address. This shows which pages are hot and which code
+    regions are never written to (i.e. could be ROM).
+
+    The counts can be exported as NumPy array (if NumPy is installed) or as a 256x256
+    pixel heatmap (one row per page) in the PPM format that any image viewer and
+    converter understands.
+"""
+import math
+import typing as t
+from array import array
+
+KINDS = ("reads", "writes", "executes")
+
+
+class AccessCounters:
+    """ One `array('I')` counter per address and kind of access.
+    """
+    __slots__ = ["reads", "writes", "executes"]
+
+    def __init__(self) -> None:
+        self.reads = array("I", bytes(4 * 0x10000))
+        self.writes = array("I", bytes(4 * 0x10000))
+        self.executes = array("I", bytes(4 * 0x10000))
+
+    def clear(self):
+        for kind in KINDS:
+            getattr(self, kind)[:] = array("I", bytes(4 * 0x10000))
+
+    def pages(self, kind: str) -> t.List[int]:
+        """ Total number of accesses of `kind` per page.
+        """
+        counts = getattr(self, kind)
+        return [sum(counts[p << 8:(p + 1) << 8]) for p in range(0x100)]
+
+    def hot_pages(self, n: int = 8) -> t.List[t.Tuple[int, int]]:
+        """ The `n` pages with the most accesses of any kind as `(page, accesses)`.
+        """
+        totals = [sum(c) for c in zip(*(self.pages(kind) for kind in KINDS))]
+        return sorted(((p, c) for p, c in enumerate(totals) if c), key=lambda pc: -pc[1])[:n]
+
+    def code_regions(self) -> t.List[t.Tuple[int, int]]:
+        """ Ranges `(start, end)` of executed code that was never written to.
+
+            Only opcodes count as executed, their operands are read. So an instruction
+            spans its opcode plus up to two following bytes that were read but neither
+            executed nor written.
+        """
+        regions: t.List[t.Tuple[int, int]] = []
+        reads, writes, executes = self.reads, self.writes, self.executes
+        for address in range(0x10000):
+            if not executes[address] or writes[address]:
+                continue
+            end = address + 1
+            while end < min(address + 3, 0x10000) and reads[end] and not writes[end] \
+                    and not executes[end]:
+                end += 1
+            if regions and regions[-1][1] == address:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((address, end))
+        return regions
+
+    def to_numpy(self) -> t.Any:
+        """ The counters as `uint32` array of shape `(3, 256, 256)`: kind, page, offset.
+        """
+        import numpy as np  # type: ignore[import]
+        return np.stack([np.frombuffer(getattr(self, kind), dtype=np.uint32)
+                         for kind in KINDS]).reshape(3, 0x100, 0x100)
+
+    def write_ppm(self, path: str):
+        """ Write a 256x256 heatmap with one row per page: red are writes, green opcode
+            fetches and blue reads, each on a logarithmic scale.
+        """
+        channels = []
+        for kind in ("writes", "executes", "reads"):
+            counts = getattr(self, kind)
+            scale = 255 / math.log1p(max(counts) or 1)
+            channels.append(bytes(int(math.log1p(c) * scale) for c in counts))
+        pixels = bytearray(3 * 0x10000)
+        for i, channel in enumerate(channels):
+            pixels[i::3] = channel
+        with open(path, "wb") as f:
+            f.write(b"P6\n256 256\n255\n")
+            f.write(pixels)
@@ -0,0 +1,171 @@
+""" Reverse execution.
+
+    While attached, `History` keeps an undo record `(address, old value)` for every
+    `Memory.write()` and a checkpoint of the registers every `interval` instructions.
+    Going back to an earlier instruction undoes the writes down to the closest checkpoint
+    before it, restores the registers and runs forward again from there.
+
+    Both the undo records and the checkpoints live in fixed size ring buffers backed by
+    `array`s, so a long run only keeps the most recent part of its history and the memory
+    used is bounded by `capacity` and `checkpoints`.
+"""
+import typing as t
+from array import array
+
+from hello64.conditions import BatchedRun, InstructionBudget, RunResult, StopCondition
+from hello64.machine import Machine
+
+REGS = ("pc", "sp", "acc", "idx", "idy", "sr", "ins")
+
+# Layout of a checkpoint: instruction, cycles, write position, registers.
+_INS, _CYCLES, _POS, _REGS = 0, 1, 2, 3
+_FIELDS = _REGS + len(REGS)
+
+
+class History:
+    """ Record the execution of `machine` so that it can be stepped backwards.
+
+        Run the machine through `run_until()` while the history is attached (use it as a
+        context manager or call `attach()` and `detach()`), then go back with `step_back()`,
+        `goto()` or `last_write()`. Only writes made through `Memory.write()` can be undone.
+    """
+    __slots__ = [
+        "machine", "capacity", "interval", "instruction", "_addrs", "_values", "_writes",
+        "_checkpoints", "_first", "_count", "_paused"
+    ]
+
+    def __init__(self, machine: Machine, capacity: int = 1 << 20, interval: int = 1000,
+                 checkpoints: int = 4096) -> None:
+        self.machine = machine
+        self.capacity = capacity
+        self.interval = interval
+        # Number of instructions executed since the history was created.
+        self.instruction = 0
+        # Ring buffer of undo records, `_writes` counts all records ever made.
+        self._addrs = array("H", bytes(2 * capacity))
+        self._values = array("B", bytes(capacity))
+        self._writes = 0
+        # Ring buffer of checkpoints, `_first` and `_count` are absolute indices.
+        self._checkpoints = array("Q", bytes(8 * _FIELDS * checkpoints))
+        self._first = 0
+        self._count = 0
+        self._paused = False
+        self._checkpoint()
+
+    def __enter__(self) -> "History":
+        self.attach()
+        return self
+
+    def __exit__(self, *_):
+        self.detach()
+
+    def attach(self):
+        self.machine.memory.add_write_observer(self._record)
+
+    def detach(self):
+        self.machine.memory.remove_write_observer(self._record)
+
+    def _record(self, address: int, _: int):
+        if self._paused:
+            return
+        i = self._writes % self.capacity
+        self._addrs[i] = address
+        self._values[i] = self.machine.memory.ram[address]
+        self._writes += 1
+
+    def _checkpoint(self):
+        cpu = self.machine.cpu
+        n = len(self._checkpoints) // _FIELDS
+        if self._count - self._first == n:
+            self._first += 1
+        i = (self._count % n) * _FIELDS
+        regs = tuple(getattr(cpu, r) for r in REGS)
+        self._checkpoints[i:i + _FIELDS] = array(
+            "Q", (self.instruction, cpu.cycles, self._writes) + regs)
+        self._count += 1
+
+    def _get(self, index: int) -> array:
+        i = (index % (len(self._checkpoints) // _FIELDS)) * _FIELDS
+        return self._checkpoints[i:i + _FIELDS]
+
+    def _valid(self, checkpoint: array) -> bool:
+        # All writes made since the checkpoint must still be in the ring buffer.
+        return checkpoint[_POS] >= self._writes - self.capacity
+
+    @property
+    def earliest(self) -> int:
+        """ The earliest instruction that can still be reached.
+        """
+        for index in range(self._first, self._count):
+            checkpoint = self._get(index)
+            if self._valid(checkpoint):
+                return checkpoint[_INS]
+        return self.instruction
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        run = BatchedRun(self.machine.cpu, *conditions)
+        while True:
+            start = run.instructions
+            next_checkpoint = self.interval - self.instruction % self.interval
+            res = run.run(instructions=next_checkpoint)
+            self.instruction += run.instructions - start
+            if run.instructions > start and self.instruction % self.interval == 0:
+                self._checkpoint()
+            if res is not None:
+                return res
+
+    def _rewind(self, index: int):
+        """ Undo all writes made after checkpoint `index` and restore its registers.
+        """
+        checkpoint = self._get(index)
+        memory = self.machine.memory
+        self._paused = True
+        try:
+            for pos in range(self._writes - 1, checkpoint[_POS] - 1, -1):
+                i = pos % self.capacity
+                memory.write(self._addrs[i], self._values[i])
+        finally:
+            self._paused = False
+        self._writes = checkpoint[_POS]
+        self._count = index + 1
+        cpu = self.machine.cpu
+        for r, v in zip(REGS, checkpoint[_REGS:]):
+            setattr(cpu, r, v)
+        cpu.cycles = checkpoint[_CYCLES]
+        self.instruction = checkpoint[_INS]
+
+    def _checkpoint_before(self, condition: t.Callable[[array], bool]) -> int:
+        for index in range(self._count - 1, self._first - 1, -1):
+            checkpoint = self._get(index)
+            if not self._valid(checkpoint):
+                break
+            if condition(checkpoint):
+                return index
+        raise LookupError("Out of the recorded history")
+
+    def goto(self, instruction: int):
+        """ Bring the machine to the state right before executing `instruction`.
+        """
+        if instruction < self.instruction:
+            self._rewind(self._checkpoint_before(lambda c: c[_INS] <= instruction))
+        if instruction > self.instruction:
+            self.run_until(InstructionBudget(instruction - self.instruction))
+
+    def step_back(self, instructions: int = 1):
+        self.goto(self.instruction - instructions)
+
+    def last_write(self, address: int) -> int:
+        """ Go back to right after the most recent instruction that wrote to `address`.
+
+            :return: the instruction index the machine is at afterwards.
+        """
+        oldest = max(self._writes - self.capacity, 0)
+        for pos in range(self._writes - 1, oldest - 1, -1):
+            if self._addrs[pos % self.capacity] == address:
+                break
+        else:
+            raise LookupError(f"No write to {address:04x} in the recorded history")
+        self._rewind(self._checkpoint_before(lambda c: c[_POS] <= pos))
+        while self._writes <= pos:
+            self.run_until(InstructionBudget(1))
+        return self.instruction
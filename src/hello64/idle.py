@@ -0,0 +1,179 @@
+""" Skipping loops that wait for something that cannot happen while they run.
+
+    Programs waiting for an interrupt, a key or a timer often spin in a tight loop like
+    `JMP *` or `wait: LDA flag; BEQ wait`. The CPU takes no interrupts and the host only
+    changes memory between runs, so such a loop spins until a cycle or instruction budget
+    ends the run: the end of a batch of `BatchedRun`, after which the journal, a keyboard
+    script, ... applies its next event. The engines recognize these loops and credit the
+    cycles and instructions of all iterations up to that point at once.
+
+    A loop is idle when the same backward branch or `JMP` is taken three times in a row
+    (no other instruction jumps backward in between) with the same registers, and the code
+    from its target up to it
+
+    - is at most `MAX_SIZE` bytes,
+    - does nothing but read memory and change registers (no writes, no stack),
+    - branches forward only to instructions of its own,
+    - reads no memory mapped device, since reading one may change it, and
+    - does not change the index register of an indexed or indirect read, since the pages
+      read are found from the registers at the jump.
+
+    Every further iteration then runs the same instructions from the same state, so the
+    stop conditions not met by the last one will not be met by any of them. Skipping stops
+    the run at the same instruction and cycle as running them.
+"""
+import math
+import typing as t
+
+from hello64.spec import AddrMode
+
+if t.TYPE_CHECKING:
+    from hello64.cpu import CPU
+
+# The longest loop recognized, in bytes.
+MAX_SIZE = 64
+
+# The bus patterns (see `hello64.spec`) of the instructions an idle loop may contain.
+_PURE = {"read", "internal", "branch", "jump"}
+
+# The index register changed by each of these instructions, and the one the page read in
+# each of these addressing modes depends on.
+_CHANGES_INDEX = {
+    "LDX": "X", "TAX": "X", "TSX": "X", "INX": "X", "DEX": "X", "LAX": "X", "SBX": "X",
+    "LDY": "Y", "TAY": "Y", "INY": "Y", "DEY": "Y",
+}
+_INDEXED_BY = {
+    AddrMode.abs_x: "X", AddrMode.indirect_x: "X",
+    AddrMode.abs_y: "Y", AddrMode.indirect_y: "Y",
+}
+
+
+class IdleLoops:
+    """ Recognizes idle loops of `cpu` during a single run, see the module documentation.
+    """
+    __slots__ = ["cpu", "loop", "regs", "cycles", "instructions", "idle"]
+
+    def __init__(self, cpu: "CPU") -> None:
+        self.cpu = cpu
+        # The last backward jump taken, as (address of the jump, target), and the
+        # registers, cycles and instructions of the run after it.
+        self.loop = (-1, -1)
+        self.regs: t.Tuple[int, ...] = ()
+        self.cycles = 0
+        self.instructions = 0
+        # Whether the code of the loop is idle, `None` until it is looked at.
+        self.idle: t.Optional[bool] = None
+
+    def jumped(self, pc: int, instructions: int, max_cycles: float,
+               max_instructions: float) -> int:
+        """ Called after the instruction at `pc` jumped back to `cpu.pc`, the run having
+            executed `instructions` instructions and stopping at `max_cycles` or
+            `max_instructions` at the latest. Skips the iterations of an idle loop before
+            that point, adding their cycles to the CPU.
+
+            :return: the number of instructions skipped.
+        """
+        cpu = self.cpu
+        loop = (pc, cpu.pc)
+        regs = (cpu.acc, cpu.idx, cpu.idy, cpu.sp, cpu.sr)
+        skipped = 0
+        if loop != self.loop or regs != self.regs:
+            self.loop, self.regs, self.idle = loop, regs, None
+        elif self.idle is None:
+            # The code is only looked at now, so it is the code of the next iteration.
+            self.idle = self._is_idle(*loop)
+        elif self.idle:
+            skipped = self._skip(instructions, max_cycles, max_instructions)
+        self.cycles, self.instructions = cpu.cycles, instructions + skipped
+        return skipped
+
+    def _skip(self, instructions: int, max_cycles: float, max_instructions: float) -> int:
+        cpu = self.cpu
+        cycles = cpu.cycles - self.cycles
+        length = instructions - self.instructions
+        # Full iterations until the run ends, leaving the last one to be run.
+        iterations = [(limit - now) // per
+                      for limit, now, per in ((max_cycles, cpu.cycles, cycles),
+                                              (max_instructions, instructions, length))
+                      if limit != math.inf]
+        if not iterations or min(iterations) < 2:
+            return 0
+        n = int(min(iterations)) - 1
+        cpu.cycles += n * cycles
+        return n * length
+
+    def _is_idle(self, end: int, target: int) -> bool:
+        """ Whether the code from `target` up to the jump at `end` makes an idle loop.
+        """
+        if not 0 <= end - target <= MAX_SIZE:
+            return False
+        cpu = self.cpu
+        mem = cpu.mem
+        ram = mem.ram
+        spec = cpu.SPEC
+        starts: t.Set[int] = set()
+        jumps: t.List[int] = []
+        pages: t.Set[int] = set()
+        changed: t.Set[str] = set()
+        indexes: t.Set[str] = set()
+        addr = target
+        while addr <= end:
+            op = spec.get(ram[addr])
+            if op is None or op.bus not in _PURE:
+                return False
+            starts.add(addr)
+            if op.mnemonic in _CHANGES_INDEX:
+                changed.add(_CHANGES_INDEX[op.mnemonic])
+            if op.bus == "branch":
+                offset = ram[(addr + 1) % 0x10000]
+                jumps.append((addr + 2 + offset - (offset & 0x80) * 2) % 0x10000)
+            elif op.bus == "jump":
+                if op.mode != AddrMode.abs:
+                    return False
+                jumps.append(ram[(addr + 1) % 0x10000] | ram[(addr + 2) % 0x10000] << 8)
+            elif op.bus == "read":
+                pages.update(self._pages(op.mode, addr))
+                if op.mode in _INDEXED_BY:
+                    indexes.add(_INDEXED_BY[op.mode])
+            addr += op.size
+        if end not in starts or any(target <= j <= end and j not in starts for j in jumps):
+            return False
+        if changed & indexes:
+            return False
+        # The code itself (and the dummy reads of the cycle exact engine around it) must not
+        # be in a device page either.
+        pages.update(range(target >> 8, ((addr + 1) >> 8) + 1))
+        return not any(mem.devices[p % 0x100] for p in pages)
+
+    def _pages(self, mode: AddrMode, addr: int) -> t.Tuple[int, ...]:
+        """ The pages read by the instruction at `addr`, including dummy reads.
+        """
+        cpu = self.cpu
+        ram = self.cpu.mem.ram
+        lo = ram[(addr + 1) % 0x10000]
+        word = lo | ram[(addr + 2) % 0x10000] << 8
+        if mode in (AddrMode.zerop, AddrMode.zerop_x, AddrMode.zerop_y):
+            return (0, )
+        if mode == AddrMode.abs:
+            return (word >> 8, )
+        if mode in (AddrMode.abs_x, AddrMode.abs_y):
+            index = cpu.idx if mode == AddrMode.abs_x else cpu.idy
+            return word >> 8, ((word + index) % 0x10000) >> 8
+        if mode == AddrMode.indirect_x:
+            pointer = (lo + cpu.idx) % 0x100
+            return 0, ram[(pointer + 1) % 0x100]
+        if mode in (AddrMode.indirect_y, AddrMode.zerop_indirect):
+            base = ram[lo] | ram[(lo + 1) % 0x100] << 8
+            index = cpu.idy if mode == AddrMode.indirect_y else 0
+            return 0, base >> 8, ((base + index) % 0x10000) >> 8
+        return ()
+
+
+def detector(cpu: "CPU", debug: bool = False) -> t.Optional[IdleLoops]:
+    """ An `IdleLoops` for a run of `cpu`, or `None` if skipping is turned off with
+        `CPU.skip_idle` or would show in the log of each instruction (`debug`) or in the
+        counted memory accesses.
+    """
+    if not cpu.skip_idle or debug or cpu.mem.counters is not None:
+        return None
+    return IdleLoops(cpu)
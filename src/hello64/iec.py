@@ -0,0 +1,355 @@
+""" The serial (IEC) bus of the C64 at the level of its lines, with 1541 drives on it.
+
+    The C64 drives the ATN, CLK and DATA lines through port A of CIA 2 (`$DD00`) and
+    reads CLK and DATA back from it. Each line is low as long as anyone pulls it. The
+    KERNAL routines talking to the bus run unchanged: a `Drive1541` answers them with
+    the real handshakes, bit by bit, including the timing of EOI (which the KERNAL
+    measures with timer B of CIA 1, see `hello64.cia`). This is slow but compatible,
+    `hello64.kernal.Kernal` services LOAD and SAVE without the bus instead.
+
+    The drive is not a second CPU running the DOS of the 1541 but a process in Python
+    waiting for line changes and points in time. Since the C64 only sees the lines when
+    it accesses `$DD00`, the drive is only brought up to date then, and the emulation
+    runs at full speed in between.
+
+        drive = iec.attach(machine, D64("disk.d64"))
+"""
+import typing as t
+
+from hello64.cia import CIA
+from hello64.kernal import Storage
+from hello64.machine import Machine
+
+if t.TYPE_CHECKING:
+    from hello64.cpu import CPU
+
+# Port A bits of CIA 2.
+ATN_OUT = 0x08
+CLK_OUT = 0x10
+DATA_OUT = 0x20
+CLK_IN = 0x40
+DATA_IN = 0x80
+
+# Commands sent under ATN.
+LISTEN = 0x20
+UNLISTEN = 0x3f
+TALK = 0x40
+UNTALK = 0x5f
+DATA = 0x60
+CLOSE = 0xe0
+OPEN = 0xf0
+
+# Timing, in cycles (about microseconds).
+EOI_TIMEOUT = 200  # A talker not starting a byte for this long signals EOI.
+EOI_ACK = 60  # How long a listener acknowledges EOI.
+BIT_SETUP = 40  # A bit is on DATA this long before the talker releases CLK.
+BIT_VALID = 40  # How long the talker releases CLK for each bit.
+FRAME_TIMEOUT = 1000  # How long a talker waits for the listener to accept a byte.
+BYTE_GAP = 100
+
+OK = b"00, OK,00,00\r"
+FILE_NOT_FOUND = b"62,FILE NOT FOUND,00,00\r"
+WRITE_ERROR = b"25,WRITE ERROR,00,00\r"
+
+# A drive process yields what it waits for: a condition (or `None`) and a deadline (or
+# `None`). It is sent whether the condition was met before the deadline.
+Wait = t.Tuple[t.Optional[t.Callable[[], bool]], t.Optional[int]]
+Process = t.Generator[Wait, bool, None]
+
+
+class IECBus:
+    """ The lines of the bus. `atn`, `clk` and `data` are the ones the C64 pulls.
+    """
+    __slots__ = ["cpu", "atn", "clk", "data", "drives"]
+
+    def __init__(self, cpu: t.Optional["CPU"] = None) -> None:
+        # The clock of the drives.
+        self.cpu = cpu
+        self.atn = self.clk = self.data = False
+        self.drives: t.List["Drive1541"] = []
+
+    @property
+    def clk_line(self) -> bool:
+        """ Whether CLK is pulled by anyone.
+        """
+        return self.clk or any(d.clk for d in self.drives)
+
+    @property
+    def data_line(self) -> bool:
+        return self.data or any(d.data for d in self.drives)
+
+    def advance(self):
+        """ Let the drives catch up to the current cycle.
+        """
+        now = 0 if self.cpu is None else self.cpu.cycles
+        for drive in self.drives:
+            drive.advance(now)
+
+    def pull(self, atn: bool, clk: bool, data: bool):
+        """ Set the lines pulled by the C64.
+        """
+        self.advance()
+        self.atn, self.clk, self.data = atn, clk, data
+        self.advance()
+
+
+class CIA2(CIA):
+    """ CIA 2 with the serial bus behind port A. The other port A bits (the VIC bank and
+        the RS-232 output) are plain register bits, port B is not connected.
+    """
+    __slots__ = ["bus"]
+
+    def __init__(self, bus: t.Optional[IECBus] = None) -> None:
+        super().__init__()
+        self.bus = bus or IECBus()
+
+    def attach(self, machine: Machine, address: int = 0xdd00):
+        super().attach(machine, address)
+        self.bus.cpu = machine.cpu
+
+    def read(self, address: int) -> int:
+        if address & 0x0f:
+            return super().read(address)
+        bus = self.bus
+        bus.advance()
+        # The outputs read back their value, the inputs see the (inverted) lines.
+        return (self.regs[0] | ~self.regs[2]) & 0x3f | \
+            (0 if bus.clk_line else CLK_IN) | (0 if bus.data_line else DATA_IN)
+
+    def write(self, address: int, value: int):
+        reg = address & 0x0f
+        if reg not in (0, 2):
+            super().write(address, value)
+            return
+        self.regs[reg] = value
+        # Through inverters: a 1 on an output pulls the line.
+        out = self.regs[0] & self.regs[2]
+        self.bus.pull(bool(out & ATN_OUT), bool(out & CLK_OUT), bool(out & DATA_OUT))
+
+
+class Channel:
+    """ A file opened on a secondary address of a drive.
+    """
+    __slots__ = ["name", "data", "pos", "written"]
+
+    def __init__(self, name: bytes, data: bytes = b"",
+                 written: t.Optional[bytearray] = None) -> None:
+        self.name = name
+        # What is read from the channel, and how much of it was read.
+        self.data = data
+        self.pos = 0
+        # What was written to it, if it was opened for writing.
+        self.written = written
+
+
+class Drive1541:
+    """ A disk drive with the device number `device` on `bus`, reading and writing the
+        files of `storage` (e.g. a `hello64.d64.D64`).
+    """
+    __slots__ = [
+        "bus", "storage", "device", "clk", "data", "time", "attention", "listening",
+        "talking", "channel", "opening", "name", "channels", "status", "_process", "_wait"
+    ]
+
+    def __init__(self, bus: IECBus, storage: Storage, device: int = 8) -> None:
+        self.bus = bus
+        self.storage = storage
+        self.device = device
+        # The lines pulled by the drive.
+        self.clk = self.data = False
+        # The cycle the drive has caught up to.
+        self.time = 0
+        # ATN as last seen, and what the commands sent under it told the drive to do.
+        self.attention = False
+        self.listening = self.talking = self.opening = False
+        self.channel = 0
+        self.name = bytearray()
+        self.channels: t.Dict[int, Channel] = {}
+        # The answer to reading the command channel (15).
+        self.status = b"73,CBM DOS V2.6 1541,00,00\r"
+        self._process: Process = self._idle()
+        self._wait: Wait = next(self._process)
+        bus.drives.append(self)
+
+    def advance(self, now: int):
+        """ Run the drive up to cycle `now`.
+        """
+        if self.bus.atn != self.attention:
+            self.attention = self.bus.atn
+            self.time = max(self.time, now)
+            self._start(self._command() if self.attention else self._after_command())
+        while True:
+            condition, deadline = self._wait
+            if condition is not None and condition():
+                met = True
+            elif deadline is not None and deadline <= now:
+                self.time = max(self.time, deadline)
+                met = False
+            else:
+                self.time = now
+                return
+            try:
+                self._wait = self._process.send(met)
+            except StopIteration:
+                self._start(self._idle())
+
+    def _start(self, process: Process):
+        try:
+            self._wait = next(process)
+        except StopIteration:
+            process = self._idle()
+            self._wait = next(process)
+        self._process = process
+
+    def _until(self, condition: t.Optional[t.Callable[[], bool]],
+               timeout: t.Optional[int] = None) -> t.Generator[Wait, bool, bool]:
+        """ Wait for `condition`, at most `timeout` cycles.
+        """
+        return (yield condition, None if timeout is None else self.time + timeout)
+
+    def _sleep(self, cycles: int) -> t.Generator[Wait, bool, bool]:
+        return (yield None, self.time + cycles)
+
+    def _idle(self) -> Process:
+        while True:
+            yield None, None
+
+    def _command(self) -> Process:
+        """ Listen to the commands sent under ATN.
+        """
+        self.clk, self.data = False, True
+        while True:
+            byte, _ = yield from self._receive()
+            self._execute(byte)
+
+    def _after_command(self) -> Process:
+        if self.talking:
+            yield from self._talk()
+        elif self.listening:
+            while True:
+                byte, _ = yield from self._receive()
+                if self.opening:
+                    self.name.append(byte)
+                elif self.channel in self.channels:
+                    written = self.channels[self.channel].written
+                    if written is not None:
+                        written.append(byte)
+        else:
+            self.clk = self.data = False
+
+    def _execute(self, byte: int):
+        if byte == UNLISTEN:
+            if self.listening and self.opening:
+                self._open(self.channel, bytes(self.name))
+            self.listening = self.opening = False
+        elif byte == UNTALK:
+            self.talking = False
+        elif byte & 0xe0 == LISTEN:
+            self.listening = byte & 0x1f == self.device
+        elif byte & 0xe0 == TALK:
+            self.talking = byte & 0x1f == self.device
+        elif self.listening or self.talking:
+            self.channel = byte & 0x0f
+            self.opening = byte & 0xf0 == OPEN
+            if self.opening:
+                self.name = bytearray()
+            elif byte & 0xf0 == CLOSE:
+                self._close(self.channel)
+
+    def _open(self, channel: int, name: bytes):
+        if channel == 15:
+            # Disk commands are not supported, but accepted.
+            self.status = OK
+            return
+        filename, *options = name.split(b",")
+        if channel == 1 or b"W" in options:
+            self.channels[channel] = Channel(filename, written=bytearray())
+            self.status = OK
+            return
+        data = self.storage.load(filename)
+        self.channels[channel] = Channel(filename, data or b"")
+        self.status = OK if data is not None else FILE_NOT_FOUND
+
+    def _close(self, channel: int):
+        closed = self.channels.pop(channel, None)
+        if closed is not None and closed.written is not None:
+            ok = self.storage.save(closed.name, bytes(closed.written))
+            self.status = OK if ok else WRITE_ERROR
+
+    def _talk(self) -> Process:
+        # Turn around: the C64 releases CLK and pulls DATA as the listener.
+        yield from self._until(lambda: not self.bus.clk)
+        self.clk, self.data = True, False
+        yield from self._sleep(BYTE_GAP)
+        if self.channel == 15:
+            channel = Channel(b"", self.status)
+            self.status = OK
+        else:
+            channel = self.channels.get(self.channel, Channel(b""))
+        while channel.pos < len(channel.data):
+            last = channel.pos == len(channel.data) - 1
+            if not (yield from self._send(channel.data[channel.pos], last)):
+                return
+            channel.pos += 1
+            yield from self._sleep(BYTE_GAP)
+        # Nothing (more) to send: ready to talk, but never starting a byte times the
+        # listener out.
+        self.clk = False
+
+    def _receive(self) -> t.Generator[Wait, bool, t.Tuple[int, bool]]:
+        """ Receive a byte, the C64 being the talker.
+
+            :return: the byte and whether it was the last one (EOI).
+        """
+        bus = self.bus
+        # Ready to send? Wait for the talker to hold CLK first, after ATN it may not yet.
+        yield from self._until(lambda: bus.clk)
+        yield from self._until(lambda: not bus.clk)
+        self.data = False
+        eoi = not (yield from self._until(lambda: bus.clk, EOI_TIMEOUT))
+        if eoi:
+            self.data = True
+            yield from self._sleep(EOI_ACK)
+            self.data = False
+            yield from self._until(lambda: bus.clk)
+        byte = 0
+        for i in range(8):
+            yield from self._until(lambda: not bus.clk)
+            if not bus.data:
+                byte |= 1 << i
+            yield from self._until(lambda: bus.clk)
+        # Frame accepted.
+        self.data = True
+        return byte, eoi
+
+    def _send(self, byte: int, eoi: bool) -> t.Generator[Wait, bool, bool]:
+        """ Send a byte, the C64 being the listener, with EOI if `eoi`.
+
+            :return: whether the listener accepted it.
+        """
+        bus = self.bus
+        self.clk = False
+        yield from self._until(lambda: not bus.data_line)
+        if eoi:
+            yield from self._until(lambda: bus.data_line)
+            yield from self._until(lambda: not bus.data_line)
+        self.clk = True
+        for i in range(8):
+            self.data = not byte & (1 << i)
+            yield from self._sleep(BIT_SETUP)
+            self.clk = False
+            yield from self._sleep(BIT_VALID)
+            self.clk = True
+            self.data = False
+        return (yield from self._until(lambda: bus.data_line, FRAME_TIMEOUT))
+
+
+def attach(machine: Machine, storage: Storage, device: int = 8,
+           cia2: t.Optional[CIA2] = None) -> Drive1541:
+    """ Connect a 1541 serving `storage` as `device` to the serial bus of `machine`,
+        mapping CIA 2 to `$DD00` unless it is passed as `cia2`.
+    """
+    if cia2 is None:
+        cia2 = CIA2()
+        cia2.attach(machine)
+    return Drive1541(cia2.bus, storage, device)
@@ -0,0 +1,161 @@
+""" Deterministic re-execution: snapshots of the machine state plus a journal of all
+    external inputs, timestamped by cycle.
+
+    Inputs are fed through `Recorder.input()` instead of poking the devices directly.
+    The recorder applies them at an instruction boundary, notes the cycle and takes a
+    snapshot every `interval` cycles. A `Replayer` restores the snapshot closest to a
+    given cycle and re-applies the inputs at exactly the same cycles, so any point of
+    a long run can be reached again without emulating it from the start.
+"""
+import pickle
+import typing as t
+import zlib
+from bisect import bisect_right
+
+from hello64.conditions import BatchedRun, CycleBudget, RunResult, StopCondition
+from hello64.machine import Machine
+from hello64.memory import Device
+
+# (cycle, input, value)
+InputEvent = t.Tuple[int, str, t.Any]
+
+
+class Snapshot:
+    """ The complete state of a `Machine`: registers, RAM and the state of its devices
+        (see `Device.snapshot()`), e.g. the keys held down.
+    """
+    __slots__ = ["cycles", "regs", "ram", "devices"]
+
+    REGS = ("pc", "sp", "acc", "idx", "idy", "sr", "ins")
+
+    def __init__(self, cycles: int, regs: t.Tuple[int, ...], ram: bytes,
+                 devices: t.Tuple[t.Any, ...] = ()) -> None:
+        self.cycles = cycles
+        self.regs = regs
+        # Compressed, a mostly empty 64 KB RAM shrinks to a few hundred bytes.
+        self.ram = ram
+        # The state of each device in the order of `_devices()`.
+        self.devices = devices
+
+    @classmethod
+    def take(cls, machine: Machine) -> "Snapshot":
+        cpu = machine.cpu
+        return cls(cpu.cycles, tuple(getattr(cpu, r) for r in cls.REGS),
+                   zlib.compress(machine.memory.ram, 1),
+                   tuple(d.snapshot() for d in _devices(machine)))
+
+    def restore(self, machine: Machine):
+        cpu = machine.cpu
+        for r, v in zip(self.REGS, self.regs):
+            setattr(cpu, r, v)
+        cpu.cycles = self.cycles
+        machine.memory.ram[:] = zlib.decompress(self.ram)
+        for device, state in zip(_devices(machine), self.devices):
+            device.restore(state)
+
+
+def _devices(machine: Machine) -> t.List[Device]:
+    """ The devices mapped into the memory of `machine`, each once, by their first page.
+    """
+    return list({id(d): d for d in machine.memory.devices if d is not None}.values())
+
+
+class Journal:
+    """ All inputs of a run along with the snapshots taken, both ordered by cycle.
+    """
+    __slots__ = ["events", "snapshots"]
+
+    def __init__(self) -> None:
+        self.events: t.List[InputEvent] = []
+        self.snapshots: t.List[Snapshot] = []
+
+    def snapshot_before(self, cycle: int) -> Snapshot:
+        """ The latest snapshot taken at or before `cycle`.
+        """
+        i = bisect_right([s.cycles for s in self.snapshots], cycle) - 1
+        if i < 0:
+            raise ValueError(f"No snapshot before cycle {cycle}")
+        return self.snapshots[i]
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(
+                (self.events, [(s.cycles, s.regs, s.ram, s.devices) for s in self.snapshots]),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "Journal":
+        journal = cls()
+        with open(path, "rb") as f:
+            events, snapshots = pickle.load(f)
+        journal.events = events
+        journal.snapshots = [Snapshot(*s) for s in snapshots]
+        return journal
+
+
+class Recorder:
+    """ Run `machine` while recording its inputs and taking a snapshot every `interval` cycles.
+    """
+    __slots__ = ["machine", "journal", "interval", "_next_snapshot"]
+
+    def __init__(self, machine: Machine, interval: int = 1_000_000) -> None:
+        self.machine = machine
+        self.journal = Journal()
+        self.interval = interval
+        self.journal.snapshots.append(Snapshot.take(machine))
+        self._next_snapshot = machine.cycles + interval
+
+    def input(self, name: str, value: t.Any):
+        """ Feed `value` to the machine input `name` (see `Machine.inputs`) and record it.
+        """
+        self.journal.events.append((self.machine.cycles, name, value))
+        self.machine.inputs[name](value)
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        machine = self.machine
+        run = BatchedRun(machine.cpu, *conditions)
+        while True:
+            res = run.run(self._next_snapshot - machine.cycles)
+            if machine.cycles >= self._next_snapshot:
+                self.journal.snapshots.append(Snapshot.take(machine))
+                self._next_snapshot = machine.cycles + self.interval
+            if res is not None:
+                return res
+
+
+class Replayer:
+    """ Re-execute a recorded run on `machine`.
+    """
+    __slots__ = ["machine", "journal", "_next_event"]
+
+    def __init__(self, machine: Machine, journal: Journal) -> None:
+        self.machine = machine
+        self.journal = journal
+        self._next_event = 0
+
+    def seek(self, cycle: int):
+        """ Bring the machine to the first instruction boundary at or after `cycle`,
+            starting from the closest snapshot.
+        """
+        snapshot = self.journal.snapshot_before(cycle)
+        snapshot.restore(self.machine)
+        self._next_event = bisect_right([e[0] for e in self.journal.events], snapshot.cycles - 1)
+        if cycle > self.machine.cycles:
+            self.run_until(CycleBudget(cycle - self.machine.cycles))
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        machine = self.machine
+        events = self.journal.events
+        run = BatchedRun(machine.cpu, *conditions)
+        while True:
+            while self._next_event < len(events) and events[self._next_event][0] <= machine.cycles:
+                _, name, value = events[self._next_event]
+                machine.inputs[name](value)
+                self._next_event += 1
+            if self._next_event < len(events):
+                res = run.run(events[self._next_event][0] - machine.cycles)
+            else:
+                res = run.run()
+            if res is not None:
+                return res
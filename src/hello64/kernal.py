@@ -0,0 +1,315 @@
+""" Native replacements of C64 KERNAL routines.
+
+    A lot of the time a real ROM spends goes into a few routines: the RAM test at boot
+    (RAMTAS), LOAD and SAVE crawling over the serial bus byte by byte and CHROUT. `Traps`
+    runs a machine with a table of native handlers keyed by the entry address of such
+    routines. When a `JSR` reaches one, the handler does the work in Python (e.g. copies
+    a whole file into `Memory.ram` at once) and the routine returns as if its `RTS` had
+    been executed:
+
+        kernal = Kernal(HostDirectory("prgs"))
+        Traps(machine, kernal.handlers()).run_until(...)
+
+    The trap addresses are single address `PCRange` conditions, which the interpreter
+    loops check with a single dict lookup per instruction, so the code outside of the
+    trapped routines runs at full speed. A handler returns `False` to decline a call
+    (e.g. LOAD from a device it does not serve), then the routine of the ROM runs.
+
+    `fast_load()` loads a .prg file straight into memory without running any code.
+"""
+import os
+import re
+import typing as t
+
+from hello64.conditions import BatchedRun, PCRange, RunResult, StopCondition
+from hello64.cpu import CPU
+from hello64.machine import Machine
+
+# Does the work of the routine at the trapped address and returns whether it did.
+Handler = t.Callable[[Machine], bool]
+
+# Entry points of the KERNAL jump table.
+CHROUT = 0xffd2
+LOAD = 0xffd5
+SAVE = 0xffd8
+# The RAM test and clear called by the reset routine (not through the jump table).
+RAMTAS = 0xfd50
+
+# Zero page and system variables.
+TXTTAB = 0x2b  # Start of the BASIC program.
+VARTAB = 0x2d  # Start of the BASIC variables, i.e. end of the program.
+ARYTAB = 0x2f
+STREND = 0x31
+STATUS = 0x90
+DFLTO = 0x9a  # Output device, 3 is the screen.
+EAL = 0xae  # End address of LOAD and SAVE.
+TAPE1 = 0xb2
+FNLEN = 0xb7
+SA = 0xb9  # Secondary address.
+FA = 0xba  # Device number.
+FNADR = 0xbb
+STAL = 0xc1
+MEMSTR = 0x0281
+MEMSIZ = 0x0283
+HIBASE = 0x0288
+
+# KERNAL error codes, returned in A with the carry set.
+FILE_NOT_FOUND = 4
+MISSING_FILE_NAME = 8
+
+# Status bits.
+EOF = 0x40
+VERIFY_ERROR = 0x10
+
+RTS_CYCLES = 6
+
+_drive = re.compile(rb"^@?\d?:")
+
+
+class Traps:
+    """ Run `machine` with native `handlers` of the routines at their entry addresses.
+
+        `engine` is what executes the instructions in between, by default `machine.cpu`
+        (a `BusEngine` or `CompiledEngine` of it works as well).
+    """
+    __slots__ = ["machine", "handlers", "engine", "calls"]
+
+    def __init__(self, machine: Machine, handlers: t.Optional[t.Dict[int, Handler]] = None,
+                 engine: t.Any = None) -> None:
+        self.machine = machine
+        self.handlers: t.Dict[int, Handler] = dict(handlers or {})
+        self.engine = engine or machine.cpu
+        # Number of calls done natively.
+        self.calls = 0
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        """ Same as `CPU.run_until()`. A native call takes the cycles of an `RTS`.
+        """
+        machine, handlers = self.machine, self.handlers
+        cpu = machine.cpu
+        run = BatchedRun(self.engine, *conditions)
+        points = [PCRange(a, a + 1) for a in handlers]
+        while True:
+            handler = handlers.get(cpu.pc)
+            if handler is None:
+                res = run.run(until=points)
+            elif handler(machine):
+                self.calls += 1
+                return_from_subroutine(cpu)
+                continue
+            else:
+                # Declined, run the routine of the ROM.
+                res = run.run(instructions=1)
+            if res is not None:
+                return res
+
+
+def return_from_subroutine(cpu: CPU):
+    """ Do what an `RTS` does.
+    """
+    v = cpu._pull_stack() + (cpu._pull_stack() << 8)
+    cpu.pc = (v + 1) % 0x10000
+    cpu.cycles += RTS_CYCLES
+
+
+class Storage:
+    """ Where LOAD and SAVE find their files, as .prg files (load address first).
+    """
+    __slots__: t.List[str] = []
+
+    def load(self, name: bytes) -> t.Optional[bytes]:
+        """ The first file matching `name` (see `match()`), if any.
+        """
+        raise NotImplementedError
+
+    def save(self, name: bytes, data: bytes) -> bool:
+        raise NotImplementedError
+
+
+class HostDirectory(Storage):
+    """ The .prg files in a directory of the host. The case of their names does not matter.
+    """
+    __slots__ = ["path"]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def names(self) -> t.List[str]:
+        """ The names of the files without the extension, sorted.
+        """
+        return sorted(f[:-4] for f in os.listdir(self.path) if f.lower().endswith(".prg"))
+
+    def load(self, name: bytes) -> t.Optional[bytes]:
+        for n in self.names():
+            if match(name, n.upper().encode("latin-1")):
+                with open(os.path.join(self.path, n + ".prg"), "rb") as f:
+                    return f.read()
+        return None
+
+    def save(self, name: bytes, data: bytes) -> bool:
+        filename = _drive.sub(b"", name).decode("latin-1").lower()
+        if not filename or any(c in filename for c in "*?/\\\0"):
+            return False
+        try:
+            with open(os.path.join(self.path, filename + ".prg"), "wb") as f:
+                f.write(data)
+        except OSError:
+            return False
+        return True
+
+
+def match(pattern: bytes, name: bytes) -> bool:
+    """ Whether a file `name` matches a `pattern` of the 1541 DOS, i.e. `?` matches any
+        character and `*` the rest of the name. A drive prefix like `0:` is ignored.
+    """
+    pattern = _drive.sub(b"", pattern)
+    for i, c in enumerate(pattern):
+        if c == ord("*"):
+            return True
+        if i >= len(name) or c not in (ord("?"), name[i]):
+            return False
+    return len(pattern) == len(name)
+
+
+class Kernal:
+    """ Native versions of KERNAL routines, see `handlers()`.
+
+        LOAD and SAVE of device `device` use `storage`, CHROUT to the screen appends to
+        `output` (if it is not `None`) instead of printing. Memory is accessed through
+        `Memory.ram`, so mapped devices and write observers do not see these accesses.
+    """
+    __slots__ = ["storage", "device", "output"]
+
+    def __init__(self, storage: t.Optional[Storage] = None, device: int = 8,
+                 capture: bool = False) -> None:
+        self.storage = storage
+        self.device = device
+        self.output: t.Optional[bytearray] = bytearray() if capture else None
+
+    def handlers(self) -> t.Dict[int, Handler]:
+        """ The trap table for `Traps`: RAMTAS always, LOAD and SAVE with a `storage`,
+            CHROUT when capturing the output.
+        """
+        handlers: t.Dict[int, Handler] = {RAMTAS: ramtas}
+        if self.storage is not None:
+            handlers[LOAD] = self.load
+            handlers[SAVE] = self.save
+        if self.output is not None:
+            handlers[CHROUT] = self.chrout
+        return handlers
+
+    def chrout(self, machine: Machine) -> bool:
+        if machine.memory.ram[DFLTO] != 3 or self.output is None:
+            return False
+        self.output.append(machine.cpu.acc)
+        machine.cpu.sr_c = False
+        return True
+
+    def load(self, machine: Machine) -> bool:
+        """ LOAD (A = 0) or VERIFY the file named by SETNAM, to its own load address if the
+            secondary address is not 0, else to X/Y. Returns the end address in X/Y.
+        """
+        ram, cpu = machine.memory.ram, machine.cpu
+        if ram[FA] != self.device or self.storage is None:
+            return False
+        data = self.storage.load(_filename(ram))
+        if data is None or len(data) < 2:
+            return _error(cpu, FILE_NOT_FOUND)
+        start = _word(data, 0) if ram[SA] else cpu.idx | cpu.idy << 8
+        body = data[2:0x10002 - start]
+        end = start + len(body)
+        status = EOF
+        if cpu.acc == 0:
+            ram[start:end] = body
+        elif ram[start:end] != body:
+            status |= VERIFY_ERROR
+        ram[STATUS] = status
+        _set_word(ram, EAL, end)
+        cpu.idx, cpu.idy = end & 0xff, end >> 8 & 0xff
+        cpu.sr_c = False
+        return True
+
+    def save(self, machine: Machine) -> bool:
+        """ SAVE the memory from the address in the zero page at A up to X/Y (exclusive)
+            as the file named by SETNAM.
+        """
+        ram, cpu = machine.memory.ram, machine.cpu
+        if ram[FA] != self.device or self.storage is None:
+            return False
+        name = _filename(ram)
+        if not name:
+            return _error(cpu, MISSING_FILE_NAME)
+        start, end = _word(ram, cpu.acc), cpu.idx | cpu.idy << 8
+        _set_word(ram, STAL, start)
+        _set_word(ram, EAL, end)
+        if not self.storage.save(name, header(start) + bytes(ram[start:end])):
+            return _error(cpu, FILE_NOT_FOUND)
+        ram[STATUS] = 0
+        cpu.sr_c = False
+        return True
+
+
+def ramtas(machine: Machine) -> bool:
+    """ Clear $0002-$0101 and the pages 2 and 3 and set the memory bounds to what the RAM
+        test finds on a C64 with the BASIC ROM banked in (RAM from $0800 to $A000), without
+        testing anything.
+    """
+    ram, cpu = machine.memory.ram, machine.cpu
+    ram[0x0002:0x0102] = bytes(0x100)
+    ram[0x0200:0x0400] = bytes(0x200)
+    _set_word(ram, TAPE1, 0x033c)
+    _set_word(ram, STAL, 0xa000)
+    _set_word(ram, MEMSTR, 0x0800)
+    _set_word(ram, MEMSIZ, 0xa000)
+    ram[HIBASE] = 0x04
+    cpu.acc, cpu.idx, cpu.idy = 0x04, 0x00, 0xa0
+    cpu.sr_c = cpu.sr_n = cpu.sr_z = False
+    return True
+
+
+def fast_load(machine: Machine, prg: t.Union[str, bytes],
+              address: t.Optional[int] = None) -> t.Tuple[int, int]:
+    """ Copy a .prg file (its path or its contents) straight into memory, to its own load
+        address or to `address`. When it ends up at the start of the BASIC program, the
+        pointers are set like after a LOAD in BASIC, so it can be `RUN` right away.
+
+        :return: the start and end address (exclusive).
+    """
+    if isinstance(prg, str):
+        with open(prg, "rb") as f:
+            prg = f.read()
+    ram = machine.memory.ram
+    start = _word(prg, 0) if address is None else address
+    body = prg[2:0x10002 - start]
+    end = start + len(body)
+    ram[start:end] = body
+    if start == _word(ram, TXTTAB):
+        for pointer in (VARTAB, ARYTAB, STREND):
+            _set_word(ram, pointer, end)
+    return start, end
+
+
+def header(address: int) -> bytes:
+    """ The load address header of a .prg file.
+    """
+    return bytes((address & 0xff, address >> 8))
+
+
+def _filename(ram: t.Any) -> bytes:
+    start = _word(ram, FNADR)
+    return bytes(ram[start:start + ram[FNLEN]])
+
+
+def _error(cpu: CPU, code: int) -> bool:
+    cpu.acc = code
+    cpu.sr_c = True
+    return True
+
+
+def _word(data: t.Any, address: int) -> int:
+    return data[address] | data[address + 1] << 8
+
+
+def _set_word(ram: t.Any, address: int, value: int):
+    ram[address] = value & 0xff
+    ram[address + 1] = value >> 8 & 0xff
@@ -0,0 +1,184 @@
+""" The keyboard matrix and the joystick ports of the C64, behind the data ports of CIA 1.
+
+    The KERNAL scans the keyboard by pulling one column line low at a time through port A
+    (`$DC00`) and reading the row lines of the pressed keys of that column as 0 bits from
+    port B (`$DC01`). Joystick 2 pulls port A lines low, joystick 1 port B lines. The
+    other registers, e.g. the timers, are those of `hello64.cia.CIA`.
+
+    Host input never calls into the emulation while it runs. The state of the keys and
+    the joysticks are machine inputs (see `Machine.inputs`), and scripted input is a
+    batch of timestamped events built in advance with `InputScript`:
+
+        script = InputScript(machine.cycles).type("10 PRINT \\"HELLO\\"\\nRUN\\n")
+        script.play(machine).run_until(...)
+
+    The events are applied at instruction boundaries by `hello64.journal.Replayer`, so
+    the emulation runs at full speed in between. Whenever the keys change, what each
+    port reads for any value of the other one is precomputed, so a read of a port is a
+    single table lookup.
+"""
+import typing as t
+
+from hello64.cia import CIA
+from hello64.journal import InputEvent, Journal, Replayer
+from hello64.machine import Machine
+
+# The keys in each column of the matrix (port A bit), ordered by row (port B bit).
+COLUMNS = (
+    ("DEL", "RETURN", "CRSR RIGHT", "F7", "F1", "F3", "F5", "CRSR DOWN"),
+    ("3", "W", "A", "4", "Z", "S", "E", "LSHIFT"),
+    ("5", "R", "D", "6", "C", "F", "T", "X"),
+    ("7", "Y", "G", "8", "B", "H", "U", "V"),
+    ("9", "I", "J", "0", "M", "K", "O", "N"),
+    ("+", "P", "L", "-", ".", ":", "@", ","),
+    ("£", "*", ";", "HOME", "RSHIFT", "=", "↑", "/"),
+    ("1", "←", "CTRL", "2", "SPACE", "C=", "Q", "RUN/STOP"),
+)
+
+# Key name -> (column, row).
+MATRIX = {key: (c, r) for c, keys in enumerate(COLUMNS) for r, key in enumerate(keys)}
+
+# The keys typing a character. Letters give the upper case (unshifted) characters of the
+# C64 character set whatever their case.
+CHARS: t.Dict[str, t.Tuple[str, ...]] = {
+    **{k: (k, ) for k in MATRIX if len(k) == 1},
+    **{k.lower(): (k, ) for k in MATRIX if k.isalpha() and len(k) == 1},
+    " ": ("SPACE", ),
+    "\n": ("RETURN", ),
+    "^": ("↑", ),
+    **{c: ("LSHIFT", k) for c, k in zip("!\"#$%&'()", "123456789")},
+    **{c: ("LSHIFT", k) for c, k in zip("[]<>?", ":;,./")},
+}
+
+# Joystick directions, as bits of the port pulled low.
+UP, DOWN, LEFT, RIGHT, FIRE = 0x01, 0x02, 0x04, 0x08, 0x10
+
+# How long a typed key is held and released: the KERNAL scans the keyboard once per
+# interrupt (every 1/60 s) and needs to see each key down and up.
+HOLD = 20_000
+GAP = 20_000
+
+
+class CIA1(CIA):
+    """ CIA 1 with the keyboard and the joysticks behind its ports.
+    """
+    __slots__ = ["keys", "joysticks", "_rows", "_columns"]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.keys: t.Tuple[str, ...] = ()
+        # The directions pressed on joystick 1 and 2.
+        self.joysticks = [0, 0]
+        # The port B rows (port A columns) read for each value on port A (port B).
+        self._rows = self._columns = b""
+        self.press()
+
+    def attach(self, machine: Machine, address: int = 0xdc00):
+        """ Map the registers to the page at `address` and register the inputs `keyboard`
+            (the names of the keys held down) and `joystick1`/`joystick2` (the directions).
+        """
+        super().attach(machine, address)
+        machine.inputs["keyboard"] = lambda keys: self.press(*keys)
+        machine.inputs["joystick1"] = lambda v: self.joystick(1, v)
+        machine.inputs["joystick2"] = lambda v: self.joystick(2, v)
+
+    def press(self, *keys: str):
+        """ Hold down exactly `keys`.
+        """
+        rows = [0] * 8
+        for key in keys:
+            c, r = MATRIX[key]
+            rows[c] |= 1 << r
+        self.keys = keys
+        self._rows = _lines(rows)
+        self._columns = _lines([sum(1 << c for c in range(8) if rows[c] & (1 << r))
+                                for r in range(8)])
+
+    def joystick(self, port: int, directions: int):
+        self.joysticks[port - 1] = directions
+
+    def snapshot(self) -> t.Any:
+        return super().snapshot(), self.keys, tuple(self.joysticks)
+
+    def restore(self, state: t.Any):
+        timers, keys, joysticks = state
+        super().restore(timers)
+        self.press(*keys)
+        self.joysticks = list(joysticks)
+
+    def read(self, address: int) -> int:
+        reg = address & 0x0f
+        if reg > 1:
+            return super().read(address)
+        regs = self.regs
+        # Outputs drive their value, inputs float high.
+        a = (regs[0] | ~regs[2]) & ~self.joysticks[1] & 0xff
+        b = (regs[1] | ~regs[3]) & ~self.joysticks[0] & 0xff
+        if reg == 0:
+            return a & self._columns[b]
+        return b & self._rows[a]
+
+
+def _lines(connected: t.List[int]) -> bytes:
+    """ What one port reads for each value of the other one, whose line `i` is connected
+        to the lines `connected[i]` by pressed keys. A low line pulls those low.
+    """
+    pulled = [0] * 0x100
+    for v in range(0xfe, -1, -1):
+        # Add the lowest low line to a value with one less.
+        low = ~v & (v + 1)
+        pulled[v] = pulled[v | low] | connected[low.bit_length() - 1]
+    return bytes(0xff & ~p for p in pulled)
+
+
+class InputScript:
+    """ Build a batch of input events starting at cycle `start`, each step starting when
+        the previous one ends.
+    """
+    __slots__ = ["events", "cycle"]
+
+    def __init__(self, start: int = 0) -> None:
+        self.events: t.List[InputEvent] = []
+        self.cycle = start
+
+    def wait(self, cycles: int) -> "InputScript":
+        self.cycle += cycles
+        return self
+
+    def press(self, *keys: str, hold: int = HOLD, gap: int = GAP) -> "InputScript":
+        """ Hold `keys` down for `hold` cycles, then release all keys for `gap` cycles.
+        """
+        for key in keys:
+            if key not in MATRIX:
+                raise ValueError(f"Unknown key {key!r}")
+        self.events.append((self.cycle, "keyboard", keys))
+        self.events.append((self.cycle + hold, "keyboard", ()))
+        self.cycle += hold + gap
+        return self
+
+    def type(self, text: str, hold: int = HOLD, gap: int = GAP) -> "InputScript":
+        """ Type `text` key by key, see `CHARS` for the characters available.
+        """
+        for char in text:
+            if char not in CHARS:
+                raise ValueError(f"Cannot type {char!r}")
+            self.press(*CHARS[char], hold=hold, gap=gap)
+        return self
+
+    def joystick(self, port: int, directions: int, duration: int) -> "InputScript":
+        """ Push joystick `port` (1 or 2) into `directions` for `duration` cycles.
+        """
+        self.events.append((self.cycle, f"joystick{port}", directions))
+        self.events.append((self.cycle + duration, f"joystick{port}", 0))
+        self.cycle += duration
+        return self
+
+    def journal(self) -> Journal:
+        journal = Journal()
+        journal.events = sorted(self.events, key=lambda e: e[0])
+        return journal
+
+    def play(self, machine: Machine) -> Replayer:
+        """ A `Replayer` feeding the events to `machine` while it runs.
+        """
+        return Replayer(machine, self.journal())
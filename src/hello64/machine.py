@@ -0,0 +1,105 @@
+import typing as t
+from contextlib import contextmanager
+
+from hello64.conditions import BatchedRun, RunResult, StopCondition
+from hello64.cpu import CPU
+from hello64.memory import Memory
+
+if t.TYPE_CHECKING:
+    from hello64.clock import AsyncClock
+
+
+class Machine:
+    """ A `CPU` along with its `Memory` that can be reset in place and reused.
+    """
+    __slots__ = ["memory", "cpu", "inputs"]
+
+    def __init__(self, memory: t.Optional[Memory] = None, cpu_class: t.Type[CPU] = CPU,
+                 unknown: t.Optional[str] = None) -> None:
+        self.memory = memory or Memory()
+        # `cpu_class` selects the variant (see `hello64.variants`).
+        self.cpu = cpu_class(self.memory, unknown)
+        self.cpu.reset(extended=True)
+        # External inputs by name, each taking a single value. Devices register theirs
+        # here so that `hello64.journal` can record and replay them.
+        self.inputs: t.Dict[str, t.Callable[[t.Any], None]] = {"poke": self._poke}
+
+    def reset(self):
+        """ Bring the machine back into the state of a new one: the memory cleared, with
+            nothing mapped or observing it, and the CPU in a well-defined state.
+        """
+        self.memory.reset()
+        self.cpu.reset(extended=True)
+        self.cpu.symbols = None
+        self.cpu.skip_idle = True
+        self.inputs = {"poke": self._poke}
+
+    @property
+    def cycles(self) -> int:
+        """ Total number of cycles executed since the last reset.
+        """
+        return self.cpu.cycles
+
+    def load(self, address: int, data: t.Union[bytes, bytearray, t.Sequence[int]]):
+        """ Copy `data` into memory starting at `address`.
+        """
+        self.memory.ram[address:address + len(data)] = bytes(data)
+
+    def run_until(self, *conditions: StopCondition) -> RunResult:
+        return self.cpu.run_until(*conditions)
+
+    async def run(self, *conditions: StopCondition, clock: t.Optional["AsyncClock"] = None,
+                  batch: int = 10_000) -> RunResult:
+        """ Run until one of `conditions` is met, in batches of `batch` cycles, giving
+            the event loop a chance to run other coroutines after each batch.
+
+            With a `clock` the run is paced to its frequency, otherwise it runs as fast
+            as possible.
+        """
+        # Only needed here, `asyncio` is slow to import.
+        import asyncio
+        run = BatchedRun(self.cpu, *conditions)
+        if clock is not None:
+            clock.start()
+        while True:
+            start = self.cycles
+            res = run.run(batch)
+            if clock is not None:
+                await clock.advance(self.cycles - start)
+            else:
+                await asyncio.sleep(0)
+            if res is not None:
+                return res
+
+    def _poke(self, value: t.Tuple[int, int]):
+        address, byte = value
+        self.memory.write(address, byte)
+
+
+class MachinePool:
+    """ Hand out reset `Machine`s instead of building new ones for every short-lived run.
+
+        Building a `CPU` (and its opcode table) costs far more than running a small
+        snippet, so released machines are reset in place and kept for the next user.
+    """
+    __slots__ = ["_free"]
+
+    def __init__(self) -> None:
+        self._free: t.List[Machine] = []
+
+    def acquire(self) -> Machine:
+        if self._free:
+            return self._free.pop()
+        return Machine()
+
+    def release(self, machine: Machine):
+        machine.reset()
+        self._free.append(machine)
+
+    @contextmanager
+    def machine(self) -> t.Iterator[Machine]:
+        m = self.acquire()
+        try:
+            yield m
+        finally:
+            self.release(m)
@@ -1,19 +1,246 @@
+import mmap
+import typing as t
+
 from hello64.dump import hexdump
+from hello64.heatmap import AccessCounters
+
+if t.TYPE_CHECKING:
+    from multiprocessing import shared_memory
+
+# Called with `(address, value)` right before `value` is written to `address`.
+WriteObserver = t.Callable[[int, int], None]
+
+
+# Anything writable that can stand in for the RAM `bytearray`, e.g. a `memoryview`
+# of a shared memory block or an `mmap`.
+RAM = t.Union[bytearray, memoryview, mmap.mmap]
+
+SIZE = 0x10000
+
+
+class Device:
+    """ A memory mapped device, see `Memory.map_device()`.
+    """
+    __slots__: t.List[str] = []
+
+    def read(self, address: int) -> int:
+        raise NotImplementedError
+
+    def write(self, address: int, value: int):
+        raise NotImplementedError
+
+    def snapshot(self) -> t.Any:
+        """ The state `hello64.journal.Snapshot` keeps of the device besides the RAM, as a
+            picklable value.
+        """
+        return None
+
+    def restore(self, state: t.Any):
+        """ Go back to the `state` returned by `snapshot()`.
+        """
 
 
 class Memory:
-    __slots__ = ["ram"]
+    __slots__ = ["ram", "write_observers", "backing", "counters", "devices", "generations"]
     """ We use a seperate Memory implementation to later on add things
         like special addresses (VIC, I/O, etc.) and RAM/ROM switching.
     """
-    def __init__(self) -> None:
-        self.ram = bytearray(0x10000)
+    def __init__(self, ram: t.Optional[RAM] = None) -> None:
+        """ By default the RAM is a private `bytearray`. Pass a 64 KB buffer as `ram` (or
+            use `shared()` or `mapped()`) to let other processes see the memory without
+            copying it. `read()` and `write()` are the same either way.
+        """
+        if ram is not None and len(ram) != SIZE:
+            raise ValueError(f"RAM must be {SIZE} bytes, got {len(ram)}")
+        self.ram = bytearray(SIZE) if ram is None else ram
+        self.write_observers: t.List[WriteObserver] = []
+        # The object owning the buffer of `ram` (if not `ram` itself), closed by `close()`.
+        self.backing: t.Optional[t.Union["shared_memory.SharedMemory", mmap.mmap]] = None
+        self.counters: t.Optional[AccessCounters] = None
+        # The device mapped to each page, if any.
+        self.devices: t.List[t.Optional[Device]] = [None] * 0x100
+        # Counts the `write()`s to each page, so that code decoded from a page notices when
+        # it changes (see `CPU.run_until()`).
+        self.generations = [0] * 0x100
+
+    @classmethod
+    def shared(cls, name: t.Optional[str] = None, create: bool = True) -> "Memory":
+        """ RAM in a `multiprocessing.shared_memory` block. Other processes attach to it
+            with `Memory.shared(memory.backing.name, create=False)` or plain
+            `SharedMemory(name)`. The creator should `unlink()` it when done.
+        """
+        # Imported on demand, `multiprocessing` is slow to import.
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(name, create=create, size=SIZE if create else 0)
+        assert shm.buf is not None
+        memory = cls(shm.buf[:SIZE])
+        memory.backing = shm
+        return memory
+
+    @classmethod
+    def mapped(cls, path: str) -> "Memory":
+        """ RAM in a memory mapped file, which is created or extended to 64 KB if needed.
+        """
+        with open(path, "a+b") as f:
+            if f.seek(0, 2) < SIZE:
+                f.truncate(SIZE)
+            mapping = mmap.mmap(f.fileno(), SIZE)
+        memory = cls(mapping)
+        memory.backing = mapping
+        return memory
+
+    def close(self):
+        """ Release a shared or mapped RAM. The memory must not be used afterwards.
+        """
+        if isinstance(self.ram, memoryview):
+            self.ram.release()
+        if self.backing is not None:
+            self.backing.close()
+            self.backing = None
+
+    def unlink(self):
+        """ Close and remove a shared memory block created by `shared()`.
+        """
+        backing = self.backing
+        self.close()
+        if backing is not None and not isinstance(backing, mmap.mmap):
+            backing.unlink()
 
     def read(self, address: int) -> int:
         return self.ram[address]
 
     def write(self, address: int, value: int):
         self.ram[address] = value
+        self.generations[address >> 8] += 1
+
+    def fetch(self, address: int) -> int:
+        """ Read an opcode. The same as `read()` unless accesses are counted.
+        """
+        return self.ram[address]
+
+    def clear(self):
+        """ Zero the RAM in place.
+        """
+        self.ram[:] = bytes(SIZE)
+        self.generations = [0] * 0x100
+
+    def reset(self):
+        """ Zero the RAM and remove all write observers, devices and counters.
+        """
+        self.clear()
+        self.write_observers = []
+        self.devices = [None] * 0x100
+        self.counters = None
+        self._select_class()
 
     def dump(self, start: int, length: int):
         return hexdump(self.ram, start, length)
+
+    def add_write_observer(self, observer: WriteObserver):
+        """ Call `observer` on every `write()`. Writes made directly to `ram` are not observed.
+
+            As long as there are no observers the plain `write()` is used, so observing
+            costs nothing while it is not used.
+        """
+        self.write_observers.append(observer)
+        self._select_class()
+
+    def remove_write_observer(self, observer: WriteObserver):
+        self.write_observers.remove(observer)
+        self._select_class()
+
+    def map_device(self, device: Device, start: int, end: int):
+        """ Let `device` handle `read()` and `write()` of the pages from `start` up to `end`
+            instead of the RAM. Opcode fetches and direct accesses of `ram` are not mapped.
+
+            Like write observers, mapping costs nothing until a device is mapped.
+        """
+        if start % 0x100 or end % 0x100 or not 0 <= start < end <= SIZE:
+            raise ValueError(f"Cannot map {start:04x}-{end:04x}, only whole pages can be mapped")
+        for page in range(start >> 8, end >> 8):
+            self.devices[page] = device
+        self._select_class()
+
+    def unmap_device(self, device: Device):
+        self.devices = [None if d is device else d for d in self.devices]
+        self._select_class()
+
+    def enable_counters(self) -> AccessCounters:
+        """ Count reads, writes and opcode fetches per address (see `hello64.heatmap`).
+
+            Like write observers, counting costs nothing until it is enabled.
+        """
+        if self.counters is None:
+            self.counters = AccessCounters()
+            self._select_class()
+        return self.counters
+
+    def disable_counters(self) -> t.Optional[AccessCounters]:
+        """ Stop counting and return the counters collected so far.
+        """
+        counters, self.counters = self.counters, None
+        self._select_class()
+        return counters
+
+    def _select_class(self):
+        if self.counters is not None:
+            self.__class__ = CountedMemory
+        elif any(self.devices):
+            self.__class__ = MappedMemory
+        elif self.write_observers:
+            self.__class__ = ObservedMemory
+        else:
+            self.__class__ = Memory
+
+
+class ObservedMemory(Memory):
+    """ The class a `Memory` switches to while it has write observers.
+    """
+    __slots__: t.List[str] = []
+
+    def write(self, address: int, value: int):
+        for observer in self.write_observers:
+            observer(address, value)
+        self.ram[address] = value
+        self.generations[address >> 8] += 1
+
+
+class MappedMemory(ObservedMemory):
+    """ The class a `Memory` switches to while devices are mapped.
+    """
+    __slots__: t.List[str] = []
+
+    def read(self, address: int) -> int:
+        device = self.devices[address >> 8]
+        if device is None:
+            return self.ram[address]
+        return device.read(address)
+
+    def write(self, address: int, value: int):
+        for observer in self.write_observers:
+            observer(address, value)
+        page = address >> 8
+        self.generations[page] += 1
+        device = self.devices[page]
+        if device is None:
+            self.ram[address] = value
+        else:
+            device.write(address, value)
+
+
+class CountedMemory(MappedMemory):
+    """ The class a `Memory` switches to while accesses are counted.
+    """
+    __slots__: t.List[str] = []
+
+    def read(self, address: int) -> int:
+        self.counters.reads[address] += 1  # type: ignore
+        return MappedMemory.read(self, address)
+
+    def fetch(self, address: int) -> int:
+        self.counters.executes[address] += 1  # type: ignore
+        return self.ram[address]
+
+    def write(self, address: int, value: int):
+        self.counters.writes[address] += 1  # type: ignore
+        MappedMemory.write(self, address, value)
@@ -0,0 +1,154 @@
+""" Host many machines in one process.
+
+    `Multiplexer` runs its machines round-robin, handing each one a time slice of
+    `quantum` cycles per round. Large slices amortize the interpreter overhead of
+    switching between machines. The cycles a machine runs past its slice (instructions
+    are never split) are deducted from its next one, so all machines advance at the same
+    rate. A machine with a `frequency` is paced like an `AsyncClock`: it waits until a whole
+    slice is due in real time and then runs it at once.
+
+    `run_parallel()` spreads groups of machines across worker processes to use every core.
+"""
+import os
+import typing as t
+from multiprocessing import Pool
+from time import monotonic, sleep
+
+from hello64.conditions import BatchedRun, RunResult, StopCondition
+from hello64.machine import Machine
+
+
+class Slot:
+    """ A machine scheduled by a `Multiplexer`.
+    """
+    __slots__ = ["machine", "frequency", "run", "credit", "result", "batches", "_start",
+                 "_cycles"]
+
+    def __init__(self, machine: Machine, conditions: t.Sequence[StopCondition],
+                 frequency: t.Optional[int] = None) -> None:
+        self.machine = machine
+        self.frequency = frequency
+        self.run = BatchedRun(machine.cpu, *conditions)
+        # Cycles this machine may still run in the current round, negative if it ran over.
+        self.credit = 0
+        self.result: t.Optional[RunResult] = None
+        # The number of times the machine was run.
+        self.batches = 0
+        self._start: t.Optional[float] = None
+        self._cycles = 0
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def due(self, now: float) -> float:
+        """ The number of cycles a paced machine is behind real time.
+        """
+        if self._start is None:
+            self._start = now
+        return (now - self._start) * self.frequency - self._cycles  # type: ignore
+
+    def next_deadline(self, cycles: int) -> float:
+        """ When the next `cycles` cycles of a paced machine are due.
+        """
+        return self._start + (self._cycles + cycles) / self.frequency  # type: ignore
+
+    def execute(self, cycles: int) -> int:
+        """ Run for (at least) `cycles` cycles and return the cycles actually executed.
+        """
+        start = self.machine.cycles
+        self.result = self.run.run(cycles)
+        self.batches += 1
+        executed = self.machine.cycles - start
+        self._cycles += executed
+        return executed
+
+
+class Multiplexer:
+    """ Round-robin scheduler for several machines.
+    """
+    __slots__ = ["quantum", "slots"]
+
+    def __init__(self, quantum: int = 10_000) -> None:
+        self.quantum = quantum
+        self.slots: t.List[Slot] = []
+
+    def add(self, machine: Machine, *conditions: StopCondition,
+            frequency: t.Optional[int] = None) -> Slot:
+        """ Schedule `machine` until one of `conditions` is met.
+        """
+        slot = Slot(machine, conditions, frequency)
+        self.slots.append(slot)
+        return slot
+
+    def step(self) -> int:
+        """ Run a single round over all machines that are not done yet.
+
+            :return: the number of cycles executed in this round.
+        """
+        total = 0
+        for slot in self.slots:
+            if slot.done:
+                continue
+            slot.credit = min(slot.credit + self.quantum, self.quantum)
+            budget = slot.credit
+            if slot.frequency is not None:
+                # Only whole slices, running a few cycles at a time defeats the batching.
+                due = slot.due(monotonic())
+                budget = min(budget, int(due)) if due >= self.quantum else 0
+            if budget <= 0:
+                continue
+            executed = slot.execute(budget)
+            slot.credit -= executed
+            total += executed
+        return total
+
+    def run(self) -> t.List[RunResult]:
+        """ Run all machines until they are done and return their results.
+        """
+        while True:
+            pending = [s for s in self.slots if not s.done]
+            if not pending:
+                return [s.result for s in self.slots]  # type: ignore
+            paced = [s for s in pending if s.frequency is not None]
+            if not self.step() and len(paced) == len(pending):
+                # All remaining machines are ahead of time.
+                delay = min(s.next_deadline(self.quantum) for s in paced) - monotonic()
+                if delay > 0:
+                    sleep(delay)
+
+
+# Builds the machine with the given index in a worker process, must be picklable.
+MachineFactory = t.Callable[[int], Machine]
+
+
+def run_group(
+    args: t.Tuple[MachineFactory, t.Sequence[int], t.Sequence[StopCondition], int,
+                  t.Optional[int]]
+) -> t.List[t.Tuple[int, RunResult]]:
+    """ Run the machines `indices` in a single multiplexer.
+    """
+    factory, indices, conditions, quantum, frequency = args
+    mux = Multiplexer(quantum)
+    for i in indices:
+        mux.add(factory(i), *conditions, frequency=frequency)
+    return list(zip(indices, mux.run()))
+
+
+def run_parallel(factory: MachineFactory, count: int, *conditions: StopCondition,
+                 processes: t.Optional[int] = None, quantum: int = 10_000,
+                 frequency: t.Optional[int] = None) -> t.List[RunResult]:
+    """ Run `count` machines built by `factory` spread over `processes` worker processes,
+        each hosting its group of machines in a `Multiplexer`.
+
+        :return: the results ordered by machine index.
+    """
+    processes = min(processes or os.cpu_count() or 1, count)
+    groups = [(factory, range(i, count, processes), conditions, quantum, frequency)
+              for i in range(processes)]
+    results: t.List[t.Optional[RunResult]] = [None] * count
+    with Pool(processes) as pool:
+        for group in pool.imap_unordered(run_group, groups):
+            for i, res in group:
+                results[i] = res
+    return results  # type: ignore
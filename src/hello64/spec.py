@@ -0,0 +1,443 @@
+""" The declarative specification of all opcodes.
+
+    Each line of a table describes one opcode:
+
+        opcode  mnemonic  addressing mode  cycles  bus pattern
+
+    `cycles` include the opcode fetch. A `*` adds a cycle if indexing crosses a page, a
+    `**` marks a branch, which takes one more cycle if taken and another one if it lands
+    in a different page. The bus pattern tells what the cycles after the addressing do:
+
+        read        read the operand
+        write       write the operand
+        rmw         read, write back unmodified and write the result
+        internal    no memory operand (implied and accumulator)
+        branch      relative branch
+        push, pull  push or pull a register
+        jump, jsr, rts, rti, brk, jam
+
+    The CPU classes (`CPU.SPEC`), their dispatch tables and timing, the bus microcode
+    (`hello64.bus`), the disassembler and the assembler used by the tests are all
+    generated from these tables.
+"""
+import typing as t
+from enum import IntEnum
+
+
+class AddrMode(IntEnum):
+    implied = 1
+    immed = 2
+    accum = 4
+    zerop = 8
+    zerop_x = 16
+    zerop_y = 32
+    abs = 64
+    abs_x = 128
+    abs_y = 256
+    indirect = 512
+    indirect_x = 1024
+    indirect_y = 2048
+    page_boundary_crossed = 4096
+    # 65C02 only, see `hello64.variants`.
+    zerop_indirect = 8192
+    abs_indirect_x = 16384
+
+
+# Number of operand bytes following the opcode for each addressing mode.
+OPERAND_SIZE = {
+    AddrMode.implied: 0,
+    AddrMode.accum: 0,
+    AddrMode.immed: 1,
+    AddrMode.zerop: 1,
+    AddrMode.zerop_x: 1,
+    AddrMode.zerop_y: 1,
+    AddrMode.indirect_x: 1,
+    AddrMode.indirect_y: 1,
+    AddrMode.abs: 2,
+    AddrMode.abs_x: 2,
+    AddrMode.abs_y: 2,
+    AddrMode.indirect: 2,
+    AddrMode.zerop_indirect: 1,
+    AddrMode.abs_indirect_x: 2,
+}
+
+# Mnemonics whose handler name is a Python keyword.
+_KEYWORDS = {"AND"}
+
+
+class OpcodeSpec:
+    """ A single opcode, see the module documentation.
+    """
+    __slots__ = ["opcode", "mnemonic", "mode", "cycles", "penalty", "bus"]
+
+    def __init__(self, opcode: int, mnemonic: str, mode: AddrMode, cycles: int, penalty: str,
+                 bus: str) -> None:
+        self.opcode = opcode
+        self.mnemonic = mnemonic
+        self.mode = mode
+        self.cycles = cycles
+        # "", "page" or "branch".
+        self.penalty = penalty
+        self.bus = bus
+
+    @property
+    def size(self) -> int:
+        """ The length of the instruction in bytes.
+        """
+        return 1 + OPERAND_SIZE[self.mode]
+
+    @property
+    def handler(self) -> str:
+        """ The name of the `CPU` method executing the instruction.
+        """
+        return self.mnemonic.lower() + ("_" if self.mnemonic in _KEYWORDS else "")
+
+    @property
+    def addr_mode(self) -> str:
+        """ The name of the `CPU` method decoding the addressing mode.
+        """
+        return f"addr_{self.mode.name}"
+
+    def __repr__(self) -> str:
+        return f"OpcodeSpec({self.opcode:02x}, {self.mnemonic}, {self.mode.name}, " \
+            f"{self.cycles}{dict(page='*', branch='**').get(self.penalty, '')}, {self.bus})"
+
+
+Spec = t.Dict[int, OpcodeSpec]
+
+
+def parse(table: str) -> Spec:
+    spec = {}
+    for line in table.strip().splitlines():
+        op, mnemonic, mode, cycles, bus = line.split()
+        penalty = {0: "", 1: "page", 2: "branch"}[cycles.count("*")]
+        spec[int(op, 16)] = OpcodeSpec(int(op, 16), mnemonic, AddrMode[mode],
+                                       int(cycles.rstrip("*")), penalty, bus)
+    return spec
+
+
+# The documented opcodes of the NMOS 6502, see https://www.nesdev.com/6502.txt
+DOCUMENTED = parse("""
+    00  BRK  implied         7    brk
+    01  ORA  indirect_x      6    read
+    05  ORA  zerop           3    read
+    06  ASL  zerop           5    rmw
+    08  PHP  implied         3    push
+    09  ORA  immed           2    read
+    0a  ASL  accum           2    internal
+    0d  ORA  abs             4    read
+    0e  ASL  abs             6    rmw
+    10  BPL  immed           2**  branch
+    11  ORA  indirect_y      5*   read
+    15  ORA  zerop_x         4    read
+    16  ASL  zerop_x         6    rmw
+    18  CLC  implied         2    internal
+    19  ORA  abs_y           4*   read
+    1d  ORA  abs_x           4*   read
+    1e  ASL  abs_x           7    rmw
+    20  JSR  abs             6    jsr
+    21  AND  indirect_x      6    read
+    24  BIT  zerop           3    read
+    25  AND  zerop           3    read
+    26  ROL  zerop           5    rmw
+    28  PLP  implied         4    pull
+    29  AND  immed           2    read
+    2a  ROL  accum           2    internal
+    2c  BIT  abs             4    read
+    2d  AND  abs             4    read
+    2e  ROL  abs             6    rmw
+    30  BMI  immed           2**  branch
+    31  AND  indirect_y      5*   read
+    35  AND  zerop_x         4    read
+    36  ROL  zerop_x         6    rmw
+    38  SEC  implied         2    internal
+    39  AND  abs_y           4*   read
+    3d  AND  abs_x           4*   read
+    3e  ROL  abs_x           7    rmw
+    40  RTI  implied         6    rti
+    41  EOR  indirect_x      6    read
+    45  EOR  zerop           3    read
+    46  LSR  zerop           5    rmw
+    48  PHA  implied         3    push
+    49  EOR  immed           2    read
+    4a  LSR  accum           2    internal
+    4c  JMP  abs             3    jump
+    4d  EOR  abs             4    read
+    4e  LSR  abs             6    rmw
+    50  BVC  immed           2**  branch
+    51  EOR  indirect_y      5*   read
+    55  EOR  zerop_x         4    read
+    56  LSR  zerop_x         6    rmw
+    58  CLI  implied         2    internal
+    59  EOR  abs_y           4*   read
+    5d  EOR  abs_x           4*   read
+    5e  LSR  abs_x           7    rmw
+    60  RTS  implied         6    rts
+    61  ADC  indirect_x      6    read
+    65  ADC  zerop           3    read
+    66  ROR  zerop           5    rmw
+    68  PLA  implied         4    pull
+    69  ADC  immed           2    read
+    6a  ROR  accum           2    internal
+    6c  JMP  indirect        5    jump
+    6d  ADC  abs             4    read
+    6e  ROR  abs             6    rmw
+    70  BVS  immed           2**  branch
+    71  ADC  indirect_y      5*   read
+    75  ADC  zerop_x         4    read
+    76  ROR  zerop_x         6    rmw
+    78  SEI  implied         2    internal
+    79  ADC  abs_y           4*   read
+    7d  ADC  abs_x           4*   read
+    7e  ROR  abs_x           7    rmw
+    81  STA  indirect_x      6    write
+    84  STY  zerop           3    write
+    85  STA  zerop           3    write
+    86  STX  zerop           3    write
+    88  DEY  implied         2    internal
+    8a  TXA  implied         2    internal
+    8c  STY  abs             4    write
+    8d  STA  abs             4    write
+    8e  STX  abs             4    write
+    90  BCC  immed           2**  branch
+    91  STA  indirect_y      6    write
+    94  STY  zerop_x         4    write
+    95  STA  zerop_x         4    write
+    96  STX  zerop_y         4    write
+    98  TYA  implied         2    internal
+    99  STA  abs_y           5    write
+    9a  TXS  implied         2    internal
+    9d  STA  abs_x           5    write
+    a0  LDY  immed           2    read
+    a1  LDA  indirect_x      6    read
+    a2  LDX  immed           2    read
+    a4  LDY  zerop           3    read
+    a5  LDA  zerop           3    read
+    a6  LDX  zerop           3    read
+    a8  TAY  implied         2    internal
+    a9  LDA  immed           2    read
+    aa  TAX  implied         2    internal
+    ac  LDY  abs             4    read
+    ad  LDA  abs             4    read
+    ae  LDX  abs             4    read
+    b0  BCS  immed           2**  branch
+    b1  LDA  indirect_y      5*   read
+    b4  LDY  zerop_x         4    read
+    b5  LDA  zerop_x         4    read
+    b6  LDX  zerop_y         4    read
+    b8  CLV  implied         2    internal
+    b9  LDA  abs_y           4*   read
+    ba  TSX  implied         2    internal
+    bc  LDY  abs_x           4*   read
+    bd  LDA  abs_x           4*   read
+    be  LDX  abs_y           4*   read
+    c0  CPY  immed           2    read
+    c1  CMP  indirect_x      6    read
+    c4  CPY  zerop           3    read
+    c5  CMP  zerop           3    read
+    c6  DEC  zerop           5    rmw
+    c8  INY  implied         2    internal
+    c9  CMP  immed           2    read
+    ca  DEX  implied         2    internal
+    cc  CPY  abs             4    read
+    cd  CMP  abs             4    read
+    ce  DEC  abs             6    rmw
+    d0  BNE  immed           2**  branch
+    d1  CMP  indirect_y      5*   read
+    d5  CMP  zerop_x         4    read
+    d6  DEC  zerop_x         6    rmw
+    d8  CLD  implied         2    internal
+    d9  CMP  abs_y           4*   read
+    dd  CMP  abs_x           4*   read
+    de  DEC  abs_x           7    rmw
+    e0  CPX  immed           2    read
+    e1  SBC  indirect_x      6    read
+    e4  CPX  zerop           3    read
+    e5  SBC  zerop           3    read
+    e6  INC  zerop           5    rmw
+    e8  INX  implied         2    internal
+    e9  SBC  immed           2    read
+    ea  NOP  implied         2    internal
+    ec  CPX  abs             4    read
+    ed  SBC  abs             4    read
+    ee  INC  abs             6    rmw
+    f0  BEQ  immed           2**  branch
+    f1  SBC  indirect_y      5*   read
+    f5  SBC  zerop_x         4    read
+    f6  INC  zerop_x         6    rmw
+    f8  SED  implied         2    internal
+    f9  SBC  abs_y           4*   read
+    fd  SBC  abs_x           4*   read
+    fe  INC  abs_x           7    rmw
+""")
+
+# The stable undocumented opcodes of the NMOS 6502, see
+# http://www.oxyron.de/html/opcodes02.html
+NMOS_UNDOCUMENTED = parse("""
+    02  JAM  implied         2    jam
+    03  SLO  indirect_x      8    rmw
+    04  NOP  zerop           3    read
+    07  SLO  zerop           5    rmw
+    0b  ANC  immed           2    read
+    0c  NOP  abs             4    read
+    0f  SLO  abs             6    rmw
+    12  JAM  implied         2    jam
+    13  SLO  indirect_y      8    rmw
+    14  NOP  zerop_x         4    read
+    17  SLO  zerop_x         6    rmw
+    1a  NOP  implied         2    internal
+    1b  SLO  abs_y           7    rmw
+    1c  NOP  abs_x           4*   read
+    1f  SLO  abs_x           7    rmw
+    22  JAM  implied         2    jam
+    23  RLA  indirect_x      8    rmw
+    27  RLA  zerop           5    rmw
+    2b  ANC  immed           2    read
+    2f  RLA  abs             6    rmw
+    32  JAM  implied         2    jam
+    33  RLA  indirect_y      8    rmw
+    34  NOP  zerop_x         4    read
+    37  RLA  zerop_x         6    rmw
+    3a  NOP  implied         2    internal
+    3b  RLA  abs_y           7    rmw
+    3c  NOP  abs_x           4*   read
+    3f  RLA  abs_x           7    rmw
+    42  JAM  implied         2    jam
+    43  SRE  indirect_x      8    rmw
+    44  NOP  zerop           3    read
+    47  SRE  zerop           5    rmw
+    4b  ALR  immed           2    read
+    4f  SRE  abs             6    rmw
+    52  JAM  implied         2    jam
+    53  SRE  indirect_y      8    rmw
+    54  NOP  zerop_x         4    read
+    57  SRE  zerop_x         6    rmw
+    5a  NOP  implied         2    internal
+    5b  SRE  abs_y           7    rmw
+    5c  NOP  abs_x           4*   read
+    5f  SRE  abs_x           7    rmw
+    62  JAM  implied         2    jam
+    63  RRA  indirect_x      8    rmw
+    64  NOP  zerop           3    read
+    67  RRA  zerop           5    rmw
+    6b  ARR  immed           2    read
+    6f  RRA  abs             6    rmw
+    72  JAM  implied         2    jam
+    73  RRA  indirect_y      8    rmw
+    74  NOP  zerop_x         4    read
+    77  RRA  zerop_x         6    rmw
+    7a  NOP  implied         2    internal
+    7b  RRA  abs_y           7    rmw
+    7c  NOP  abs_x           4*   read
+    7f  RRA  abs_x           7    rmw
+    80  NOP  immed           2    read
+    82  NOP  immed           2    read
+    83  SAX  indirect_x      6    write
+    87  SAX  zerop           3    write
+    89  NOP  immed           2    read
+    8f  SAX  abs             4    write
+    92  JAM  implied         2    jam
+    97  SAX  zerop_y         4    write
+    a3  LAX  indirect_x      6    read
+    a7  LAX  zerop           3    read
+    af  LAX  abs             4    read
+    b2  JAM  implied         2    jam
+    b3  LAX  indirect_y      5*   read
+    b7  LAX  zerop_y         4    read
+    bf  LAX  abs_y           4*   read
+    c2  NOP  immed           2    read
+    c3  DCP  indirect_x      8    rmw
+    c7  DCP  zerop           5    rmw
+    cb  SBX  immed           2    read
+    cf  DCP  abs             6    rmw
+    d2  JAM  implied         2    jam
+    d3  DCP  indirect_y      8    rmw
+    d4  NOP  zerop_x         4    read
+    d7  DCP  zerop_x         6    rmw
+    da  NOP  implied         2    internal
+    db  DCP  abs_y           7    rmw
+    dc  NOP  abs_x           4*   read
+    df  DCP  abs_x           7    rmw
+    e2  NOP  immed           2    read
+    e3  ISC  indirect_x      8    rmw
+    e7  ISC  zerop           5    rmw
+    eb  SBC  immed           2    read
+    ef  ISC  abs             6    rmw
+    f2  JAM  implied         2    jam
+    f3  ISC  indirect_y      8    rmw
+    f4  NOP  zerop_x         4    read
+    f7  ISC  zerop_x         6    rmw
+    fa  NOP  implied         2    internal
+    fb  ISC  abs_y           7    rmw
+    fc  NOP  abs_x           4*   read
+    ff  ISC  abs_x           7    rmw
+""")
+
+# What the 65C02 adds to (or changes in) the documented opcodes, including the unused opcodes
+# that are multi-byte `NOP`s, see
+# http://www.6502.org/tutorials/65c02opcodes.html
+CMOS_CHANGES = parse("""
+    02  NOP  immed           2    read
+    04  TSB  zerop           5    rmw
+    0c  TSB  abs             6    rmw
+    12  ORA  zerop_indirect  5    read
+    14  TRB  zerop           5    rmw
+    1a  INC  accum           2    internal
+    1c  TRB  abs             6    rmw
+    22  NOP  immed           2    read
+    32  AND  zerop_indirect  5    read
+    34  BIT  zerop_x         4    read
+    3a  DEC  accum           2    internal
+    3c  BIT  abs_x           4*   read
+    42  NOP  immed           2    read
+    44  NOP  zerop           3    read
+    52  EOR  zerop_indirect  5    read
+    54  NOP  zerop_x         4    read
+    5a  PHY  implied         3    push
+    5c  NOP  abs             8    read
+    62  NOP  immed           2    read
+    64  STZ  zerop           3    write
+    6c  JMP  indirect        6    jump
+    72  ADC  zerop_indirect  5    read
+    74  STZ  zerop_x         4    write
+    7a  PLY  implied         4    pull
+    7c  JMP  abs_indirect_x  6    jump
+    80  BRA  immed           2**  branch
+    82  NOP  immed           2    read
+    89  BIT  immed           2    read
+    92  STA  zerop_indirect  5    write
+    9c  STZ  abs             4    write
+    9e  STZ  abs_x           5    write
+    b2  LDA  zerop_indirect  5    read
+    c2  NOP  immed           2    read
+    d2  CMP  zerop_indirect  5    read
+    d4  NOP  zerop_x         4    read
+    da  PHX  implied         3    push
+    dc  NOP  abs             4    read
+    e2  NOP  immed           2    read
+    f2  SBC  zerop_indirect  5    read
+    f4  NOP  zerop_x         4    read
+    fa  PLX  implied         4    pull
+    fc  NOP  abs             4    read
+""")
+
+
+def opcodes(spec: Spec) -> t.Dict[int, t.Tuple[str, str]]:
+    """ The dispatch table of `spec`: opcode -> (handler, addressing mode).
+    """
+    return {op: (s.handler, s.addr_mode) for op, s in spec.items()}
+
+
+Busy = t.Tuple[str, ...]
+Timing = t.List[t.Tuple[Busy, Busy]]
+
+
+def timing(spec: Spec) -> Timing:
+    """ The `"busy"` cycles between the opcode fetch and the last cycle for each opcode,
+        without and with a page crossed. Opcodes missing in `spec` have none.
+    """
+    table: Timing = [((), ())] * 0x100
+    for op, s in spec.items():
+        busy = ("busy", ) * (s.cycles - 2)
+        table[op] = (busy, busy + ("busy", ) if s.penalty == "page" else busy)
+    return table
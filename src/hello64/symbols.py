@@ -0,0 +1,132 @@
+""" Map addresses back to symbols and source lines.
+
+    Symbols can be read from AS65 listings (like `tests/6502_functional_test.lst.txt`)
+    and from VICE label files (`al C:0400 .start`).
+"""
+import re
+import typing as t
+from array import array
+from bisect import bisect_right
+
+# `0400 : d8               start   cld` - the source starts at column 24,
+# macro expansions are marked with a `>` in column 23.
+_listing_pat = re.compile(r"^([0-9a-fA-F]{4}) : ([0-9a-fA-F]*)")
+_label_pat = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)")
+_vice_pat = re.compile(r"^al\s+(?:C:)?([0-9a-fA-F]{1,4})\s+\.?(\S+)")
+
+
+class Location:
+    """ Where an address is in the source: the closest symbol at or before it,
+        the offset to that symbol and the line in the listing (if known).
+    """
+    __slots__ = ["address", "symbol", "offset", "line"]
+
+    def __init__(self, address: int, symbol: t.Optional[str], offset: int,
+                 line: t.Optional[int]) -> None:
+        self.address = address
+        self.symbol = symbol
+        self.offset = offset
+        self.line = line
+
+    def __str__(self) -> str:
+        parts = []
+        if self.symbol is not None:
+            parts.append(f"{self.symbol}+0x{self.offset:x}" if self.offset else self.symbol)
+        if self.line is not None:
+            parts.append(f"line {self.line}")
+        return ", ".join(parts)
+
+
+class SymbolTable:
+    """ Sorted address -> (symbol, line) index with `bisect` lookups.
+
+        Add symbols and lines with `add_symbol()` and `add_line()` in any order, lookups
+        build the index on first use.
+    """
+    __slots__ = ["_symbols", "_lines", "_addrs", "_entries"]
+
+    def __init__(self) -> None:
+        self._symbols: t.Dict[int, str] = {}
+        self._lines: t.Dict[int, int] = {}
+        self._addrs: t.Optional[array] = None
+        self._entries: t.List[t.Tuple[t.Optional[str], int, t.Optional[int]]] = []
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def add_symbol(self, address: int, symbol: str):
+        # The first symbol defined for an address wins.
+        self._symbols.setdefault(address, symbol)
+        self._addrs = None
+
+    def add_line(self, address: int, line: int):
+        self._lines[address] = line
+        self._addrs = None
+
+    def address_of(self, symbol: str) -> int:
+        for address, s in self._symbols.items():
+            if s == symbol:
+                return address
+        raise KeyError(symbol)
+
+    def _build(self):
+        entries = []
+        symbol: t.Optional[str] = None
+        symbol_addr = 0
+        line: t.Optional[int] = None
+        for address in sorted(set(self._symbols) | set(self._lines)):
+            if address in self._symbols:
+                symbol, symbol_addr = self._symbols[address], address
+            if address in self._lines:
+                line = self._lines[address]
+            entries.append((symbol, symbol_addr, line))
+        self._entries = entries
+        self._addrs = array("H", sorted(set(self._symbols) | set(self._lines)))
+
+    def lookup(self, address: int) -> Location:
+        """ Find the location of `address`. An address without an entry of its own
+            (e.g. the operand of an instruction) belongs to the closest entry before it.
+        """
+        if self._addrs is None:
+            self._build()
+        i = bisect_right(self._addrs, address) - 1  # type: ignore
+        if i < 0:
+            return Location(address, None, 0, None)
+        symbol, symbol_addr, line = self._entries[i]
+        return Location(address, symbol, address - symbol_addr, line)
+
+    def describe(self, address: int) -> str:
+        """ Format `address` along with its location, e.g. `3469 (success+0x3, line 13377)`.
+        """
+        location = str(self.lookup(address))
+        return f"{address:04x} ({location})" if location else f"{address:04x}"
+
+    def load_listing(self, path: str):
+        """ Add the labels and the line numbers of an AS65 listing.
+        """
+        with open(path, errors="replace") as f:
+            for lineno, text in enumerate(f, 1):
+                m = _listing_pat.match(text)
+                if not m:
+                    continue
+                address = int(m.group(1), 16)
+                if m.group(2):
+                    self.add_line(address, lineno)
+                label = _label_pat.match(text[24:])
+                if label:
+                    self.add_symbol(address, label.group(1))
+
+    def load_vice_labels(self, path: str):
+        """ Add the symbols of a VICE label file (`al C:0400 .start`).
+        """
+        with open(path) as f:
+            for text in f:
+                m = _vice_pat.match(text.strip())
+                if m:
+                    self.add_symbol(int(m.group(1), 16), m.group(2))
+
+    @classmethod
+    def from_listing(cls, path: str) -> "SymbolTable":
+        symbols = cls()
+        symbols.load_listing(path)
+        return symbols
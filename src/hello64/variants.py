@@ -0,0 +1,281 @@
+""" CPU variants.
+
+    Each variant is a subclass of `CPU` composing its `SPEC` (see `hello64.spec`) from the
+    one of its base class when the class is defined, so the dispatch at runtime is the
+    same plain table lookup for all of them.
+
+    - `NMOS6502`: the documented opcodes plus the stable undocumented ones of the NMOS
+      6502/6510 (`LAX`, `SAX`, `DCP`, `ISC`, `SLO`, `RLA`, `SRE`, `RRA`, `ANC`, `ALR`,
+      `ARR`, `SBX`, the multi-byte `NOP`s and `JAM`). The unstable ones (`SHA`, `SHX`,
+      `SHY`, `TAS`, `LAS`, `ANE`, `LXA`) are left to the unknown opcode handling.
+    - `CMOS65C02`: the opcodes the 65C02 added to the NMOS set, without the Rockwell/WDC
+      bit instructions. Unused opcodes are `NOP`s: the ones listed in `CMOS_CHANGES` take
+      two or three bytes and read their operand, the others a single byte and cycle.
+
+    See http://www.oxyron.de/html/opcodes02.html and
+    http://www.6502.org/tutorials/65c02opcodes.html
+"""
+import typing as t
+
+from hello64.cpu import CPU, AddrMode, AddrOrACC
+from hello64.spec import CMOS_CHANGES, NMOS_UNDOCUMENTED, opcodes
+
+
+class NMOS6502(CPU):
+    """ The NMOS 6502 (and the 6510 of the C64) including the undocumented opcodes.
+    """
+    __slots__: t.List[str] = []
+
+    SPEC = {**CPU.SPEC, **NMOS_UNDOCUMENTED}
+    OPCODES = opcodes(SPEC)
+
+    def slo(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = self._read(addr)
+        self.sr_c = bool(v & 0x80)
+        v = (v << 1) % 0x100
+        self._write(addr, v)
+        self._set_acc(self.acc | v)
+        yield "idle"
+
+    def rla(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = (self._read(addr) << 1) | self.sr_c
+        self.sr_c = v > 0xff
+        v &= 0xff
+        self._write(addr, v)
+        self._set_acc(self.acc & v)
+        yield "idle"
+
+    def sre(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = self._read(addr)
+        self.sr_c = bool(v & 0x01)
+        v >>= 1
+        self._write(addr, v)
+        self._set_acc(self.acc ^ v)
+        yield "idle"
+
+    def rra(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = self._read(addr) | (0x100 if self.sr_c else 0)
+        self.sr_c = bool(v & 0x01)
+        v >>= 1
+        self._write(addr, v)
+        self._adc(v)
+        yield "idle"
+
+    def sax(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        self._write(addr, self.acc & self.idx)
+        yield "idle"
+
+    def lax(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        self._set_acc(self._read(addr))
+        self.idx = self.acc
+        yield "idle"
+
+    def dcp(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = (self._read(addr) - 1) % 0x100
+        self._write(addr, v)
+        diff = self.acc - v
+        self.sr_c = diff >= 0
+        self.sr_z = diff == 0
+        self.sr_n = bool(diff & 0x80)
+        yield "idle"
+
+    def isc(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = (self._read(addr) + 1) % 0x100
+        self._write(addr, v)
+        self._sbc(v)
+        yield "idle"
+
+    def anc(self, addr: int, m: AddrMode):
+        self._set_acc(self.acc & self._read(addr))
+        self.sr_c = self.sr_n
+        yield "idle"
+
+    def alr(self, addr: int, m: AddrMode):
+        v = self.acc & self._read(addr)
+        self.sr_c = bool(v & 0x01)
+        self._set_acc(v >> 1)
+        yield "idle"
+
+    def arr(self, addr: int, m: AddrMode):
+        self._arr(self.acc & self._read(addr))
+        yield "idle"
+
+    def _arr(self, v: int):
+        res = (v >> 1) | (0x80 if self.sr_c else 0)
+        if not self.sr_d:
+            self._set_acc(res)
+            self.sr_c = bool(res & 0x40)
+            self.sr_v = bool((res ^ (res << 1)) & 0x40)
+        else:
+            # The decimal correction is applied on the shifted value but based on the
+            # nibbles before the shift.
+            self.sr_n = self.sr_c
+            self.sr_z = res == 0
+            self.sr_v = bool((v ^ res) & 0x40)
+            if (v & 0x0f) + (v & 0x01) > 5:
+                res = (res & 0xf0) | ((res + 6) & 0x0f)
+            self.sr_c = (v & 0xf0) + (v & 0x10) > 0x50
+            if self.sr_c:
+                res = (res + 0x60) % 0x100
+            self.acc = res
+
+    def sbx(self, addr: int, m: AddrMode):
+        v = (self.acc & self.idx) - self._read(addr)
+        self.sr_c = v >= 0
+        v %= 0x100
+        self.sr_z = v == 0
+        self.sr_n = bool(v & 0x80)
+        self.idx = v
+        yield "idle"
+
+    def _set_acc(self, v: int):
+        self.acc = v
+        self.sr_z = v == 0
+        self.sr_n = bool(v & 0x80)
+
+
+class CMOS65C02(CPU):
+    """ The CMOS 65C02.
+    """
+    __slots__: t.List[str] = []
+
+    UNKNOWN = "nop"
+    # The unused opcodes missing in `CMOS_CHANGES` are `NOP`s of a single cycle.
+    UNKNOWN_OPCODES = {**CPU.UNKNOWN_OPCODES, "nop": "nop_unused"}
+
+    SPEC = {**CPU.SPEC, **CMOS_CHANGES}
+    OPCODES = opcodes(SPEC)
+
+    def addr_indirect(self):
+        # Unlike the NMOS 6502, the pointer may cross a page.
+        addr = self.mem.read(self.pc) + (self.mem.read(self.pc + 1) << 8)
+        self._inc_pc(2)
+        addr = self.mem.read(addr) + (self.mem.read((addr + 1) % 0x10000) << 8)
+        return addr, AddrMode.indirect
+
+    def addr_zerop_indirect(self):
+        addr = self.mem.read(self.pc)
+        self._inc_pc()
+        addr = self.mem.read(addr) + (self.mem.read((addr + 1) % 0x100) << 8)
+        return addr, AddrMode.zerop_indirect
+
+    def addr_abs_indirect_x(self):
+        addr = self.mem.read(self.pc) + (self.mem.read(self.pc + 1) << 8)
+        self._inc_pc(2)
+        addr = (addr + self.idx) % 0x10000
+        addr = self.mem.read(addr) + (self.mem.read((addr + 1) % 0x10000) << 8)
+        return addr, AddrMode.abs_indirect_x
+
+    def adc(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        self._adc(self._read(addr))
+        if self.sr_d:
+            # The flags are valid in decimal mode, at the cost of an extra cycle.
+            self.sr_z = self.acc == 0
+            self.sr_n = bool(self.acc & 0x80)
+            yield "busy"
+        yield "idle"
+
+    def sbc(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        self._sbc(self._read(addr))
+        if self.sr_d:
+            self.sr_z = self.acc == 0
+            self.sr_n = bool(self.acc & 0x80)
+            yield "busy"
+        yield "idle"
+
+    def nop_unused(self, *_):
+        # Done with the opcode fetch.
+        yield from ()
+
+    def bit(self, addr: int, m: AddrMode):
+        if m & AddrMode.immed != 0:
+            # Only Z is affected in immediate mode.
+            self.sr_z = self._read(addr) & self.acc == 0
+            yield "idle"
+        else:
+            yield from super().bit(addr, m)
+
+    def brk(self, *_):
+        yield from super().brk()
+        self.sr_d = False
+
+    def bra(self, addr: int, *_):
+        yield from self._jump_relative(True, addr)
+
+    def dec(self, addr: AddrOrACC, m: AddrMode):  # type: ignore
+        if addr != "A":
+            yield from super().dec(addr, m)
+            return
+        v = (self.acc - 1) % 0x100
+        self.sr_z = v == 0
+        self.sr_n = bool(v & 0x80)
+        self.acc = v
+        yield "idle"
+
+    def inc(self, addr: AddrOrACC, m: AddrMode):  # type: ignore
+        if addr != "A":
+            yield from super().inc(addr, m)
+            return
+        v = (self.acc + 1) % 0x100
+        self.sr_z = v == 0
+        self.sr_n = bool(v & 0x80)
+        self.acc = v
+        yield "idle"
+
+    def phx(self, *_):
+        yield from self._timing()
+        self._push_stack(self.idx)
+        yield "idle"
+
+    def phy(self, *_):
+        yield from self._timing()
+        self._push_stack(self.idy)
+        yield "idle"
+
+    def plx(self, *_):
+        yield from self._timing()
+        v = self._pull_stack()
+        self.sr_n = bool(v & 0x80)
+        self.sr_z = not v
+        self.idx = v
+        yield "idle"
+
+    def ply(self, *_):
+        yield from self._timing()
+        v = self._pull_stack()
+        self.sr_n = bool(v & 0x80)
+        self.sr_z = not v
+        self.idy = v
+        yield "idle"
+
+    def stz(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        self._write(addr, 0)
+        yield "idle"
+
+    def trb(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = self._read(addr)
+        self.sr_z = v & self.acc == 0
+        self._write(addr, v & ~self.acc & 0xff)
+        yield "idle"
+
+    def tsb(self, addr: int, m: AddrMode):
+        yield from self._timing(m)
+        v = self._read(addr)
+        self.sr_z = v & self.acc == 0
+        self._write(addr, v | self.acc)
+        yield "idle"
+
+
+VARIANTS: t.Dict[str, t.Type[CPU]] = {"6502": CPU, "nmos": NMOS6502, "65c02": CMOS65C02}
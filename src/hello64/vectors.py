@@ -0,0 +1,208 @@
+""" Replay single-step test vectors, e.g. https://github.com/SingleStepTests/65x02
+
+    Every JSON file holds thousands of cases for a single opcode:
+
+        {"name": "a9 10 ea", "initial": {"pc": .., "s": .., "a": .., "x": .., "y": .., "p": ..,
+                                         "ram": [[addr, value], ...]},
+         "final": {...}, "cycles": [[addr, value, "read"], ...]}
+
+    The cases are loaded into compact arrays (and cached next to the JSON file, because
+    parsing JSON is by far the slowest part). All cases of a file are replayed on a single
+    `CPU` by resetting the registers and only touching the RAM bytes each case needs.
+
+    Run it with:
+
+        python -m hello64.vectors path/to/6502/v1 --jobs 8
+"""
+import argparse
+import glob
+import json
+import os
+import pickle
+import typing as t
+from array import array
+from multiprocessing import Pool
+
+from hello64.conditions import InstructionBudget
+from hello64.cpu import CPU
+from hello64.memory import Memory
+
+REGS = ("pc", "s", "a", "x", "y", "p")
+# Bit 4 (B) and bit 5 are not real flags and are ignored when comparing `p`.
+P_MASK = 0xcf
+CACHE_VERSION = 1
+
+
+class RamSpec:
+    """ The `[addr, value]` lists of all cases, flattened. The bytes of case `i` are
+        `addr[index[i]:index[i + 1]]` and `value[index[i]:index[i + 1]]`.
+    """
+    __slots__ = ["index", "addr", "value"]
+
+    def __init__(self) -> None:
+        self.index = array("I", [0])
+        self.addr = array("H")
+        self.value = array("B")
+
+    def append(self, ram: t.List[t.List[int]]):
+        for a, v in ram:
+            self.addr.append(a)
+            self.value.append(v)
+        self.index.append(len(self.addr))
+
+
+class VectorSet:
+    """ All cases of a single test vector file.
+
+        `initial` and `final` hold the registers of case `i` at `[i * 6:i * 6 + 6]`
+        in the order of `REGS`.
+    """
+    __slots__ = ["name", "initial", "final", "cycles", "ram_in", "ram_out"]
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.initial = array("H")
+        self.final = array("H")
+        self.cycles = array("B")
+        self.ram_in = RamSpec()
+        self.ram_out = RamSpec()
+
+    def __len__(self) -> int:
+        return len(self.cycles)
+
+    def append(self, case: t.Dict[str, t.Any]):
+        self.initial.extend(case["initial"][r] for r in REGS)
+        self.final.extend(case["final"][r] for r in REGS)
+        self.cycles.append(len(case["cycles"]))
+        self.ram_in.append(case["initial"]["ram"])
+        self.ram_out.append(case["final"]["ram"])
+
+    @classmethod
+    def from_json(cls, path: str) -> "VectorSet":
+        vs = cls(os.path.splitext(os.path.basename(path))[0])
+        with open(path) as f:
+            for case in json.load(f):
+                vs.append(case)
+        return vs
+
+
+def load(path: str, cache: bool = True) -> VectorSet:
+    """ Load the test vectors in `path`, using (and creating) a cache file next to it.
+    """
+    cache_path = f"{path}.cache"
+    if cache and os.path.exists(cache_path) and \
+            os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        with open(cache_path, "rb") as f:
+            version, vs = pickle.load(f)
+        if version == CACHE_VERSION:
+            return vs
+    vs = VectorSet.from_json(path)
+    if cache:
+        with open(cache_path, "wb") as f:
+            pickle.dump((CACHE_VERSION, vs), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return vs
+
+
+def replay(vs: VectorSet, cpu: CPU, max_failures: int = 10) -> t.Tuple[int, t.List[str]]:
+    """ Replay all cases of `vs` on `cpu` (whose memory is expected to be all zeros). A
+        case writing any byte its final state does not list fails.
+
+        :return: the number of failed cases and the descriptions of the first
+                 `max_failures` of them.
+    """
+    ram = cpu.mem.ram
+    budget = InstructionBudget(1)
+    initial, final, cycles = vs.initial, vs.final, vs.cycles
+    in_index, in_addr, in_value = vs.ram_in.index, vs.ram_in.addr, vs.ram_in.value
+    out_index, out_addr, out_value = vs.ram_out.index, vs.ram_out.addr, vs.ram_out.value
+    zeros = bytes(len(ram))
+    failed = 0
+    failures: t.List[str] = []
+    for i in range(len(vs)):
+        b = i * 6
+        cpu.pc, cpu.sp, cpu.acc, cpu.idx, cpu.idy, cpu.sr = initial[b:b + 6]
+        in_start, in_end = in_index[i], in_index[i + 1]
+        for j in range(in_start, in_end):
+            ram[in_addr[j]] = in_value[j]
+        try:
+            res_cycles = cpu.run_until(budget).cycles
+            error = None
+        except Exception as ex:
+            res_cycles = 0
+            error = repr(ex)
+        regs = (cpu.pc, cpu.sp, cpu.acc, cpu.idx, cpu.idy, cpu.sr & P_MASK)
+        expected = tuple(final[b:b + 5]) + (final[b + 5] & P_MASK, )
+        out_start, out_end = out_index[i], out_index[i + 1]
+        ok = error is None and regs == expected and res_cycles == cycles[i]
+        for j in range(out_start, out_end):
+            if ram[out_addr[j]] != out_value[j]:
+                ok = False
+                if error is None:
+                    error = f"ram[{out_addr[j]:04x}] = {ram[out_addr[j]]:02x}, " \
+                        f"expected {out_value[j]:02x}"
+            ram[out_addr[j]] = 0
+        for j in range(in_start, in_end):
+            ram[in_addr[j]] = 0
+        if ram != zeros:
+            # Written where the case did not expect it, cleared for the next cases.
+            address = next(a for a, v in enumerate(ram) if v)
+            ok = False
+            if error is None:
+                error = f"ram[{address:04x}] = {ram[address]:02x}, expected 00"
+            ram[:] = zeros
+        if ok:
+            continue
+        failed += 1
+        if len(failures) < max_failures:
+            failures.append(f"{vs.name} #{i}: {error or ''} regs {_fmt(regs)}, "
+                            f"expected {_fmt(expected)}, cycles {res_cycles}/{cycles[i]}")
+    return failed, failures
+
+
+def _fmt(regs: t.Sequence[int]) -> str:
+    return " ".join(f"{r}={v:02x}" for r, v in zip(REGS, regs))
+
+
+_cpu: t.Optional[CPU] = None
+
+
+def replay_file(path: str) -> t.Tuple[str, int, int, t.List[str]]:
+    """ Replay a single file on this process' CPU.
+
+        :return: the name of the set, the number of cases and failures and
+                 the first failure descriptions.
+    """
+    global _cpu
+    if _cpu is None:
+        _cpu = CPU(Memory())
+    vs = load(path)
+    if int(vs.name[:2], 16) not in _cpu.opcodes:
+        return vs.name, 0, 0, []
+    failed, failures = replay(vs, _cpu)
+    return vs.name, len(vs), failed, failures
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay single-step test vectors")
+    parser.add_argument("path", help="directory containing one <opcode>.json per opcode")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    total = total_failed = 0
+    paths = sorted(glob.glob(os.path.join(args.path, "*.json")))
+    with Pool(args.jobs) as pool:
+        for name, cases, failed, failures in pool.imap_unordered(replay_file, paths):
+            if not cases:
+                print(f"{name}: skipped (unsupported opcode)")
+                continue
+            total += cases
+            total_failed += failed
+            print(f"{name}: {cases - failed}/{cases} passed")
+            for failure in failures:
+                print(f"  {failure}")
+    print(f"{total - total_failed}/{total} cases passed")
+    return 1 if total_failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -32,6 +32,8 @@ location of instructions to follow.
 import re
 import sys
 
+from hello64.spec import DOCUMENTED, AddrMode
+
 
 # Exception used for errors
 class AssemblyError(Exception):
@@ -52,284 +54,26 @@ def RELATIVE_ADDR(pc, value):
     return offset & 0xff
 
 
-# Table of 6502 opcodes and supported addressing modes
-opcodes_6502 = {
-    'DATA': {
-        'immed': [VALUE_L],
-    },
-    'ADC': {
-        'immed': [0x69, VALUE_L],
-        'zerop': [0x65, VALUE_L],
-        'zerop_x': [0x75, VALUE_L],
-        'abs': [0x6D, VALUE_L, VALUE_H],
-        'abs_x': [0x7D, VALUE_L, VALUE_H],
-        'abs_y': [0x79, VALUE_L, VALUE_H],
-        'indirect_x': [0x61, VALUE_L],
-        'indirect_y': [0x71, VALUE_L],
-    },
-    'AND': {
-        'immed': [0x29, VALUE_L],
-        'zerop': [0x25, VALUE_L],
-        'zerop_x': [0x35, VALUE_L],
-        'abs': [0x2D, VALUE_L, VALUE_H],
-        'abs_x': [0x3D, VALUE_L, VALUE_H],
-        'abs_y': [0x39, VALUE_L, VALUE_H],
-        'indirect_x': [0x21, VALUE_L],
-        'indirect_y': [0x31, VALUE_L],
-    },
-    'ASL': {
-        'accum': [0x0a],
-        'zerop': [0x06, VALUE_L],
-        'zerop_x': [0x16, VALUE_L],
-        'abs': [0x0e, VALUE_L, VALUE_H],
-        'abs_x': [0x1e, VALUE_L, VALUE_H],
-    },
-    'BIT': {
-        'zerop': [0x24, VALUE_L],
-        'abs': [0x2c, VALUE_L, VALUE_H],
-    },
-    'BPL': {
-        'immed': [0x10, VALUE_L],
-        'abs': [0x10, RELATIVE_ADDR],
-    },
-    'BMI': {
-        'immed': [0x30, VALUE_L],
-        'abs': [0x30, RELATIVE_ADDR],
-    },
-    'BVC': {
-        'immed': [0x50, VALUE_L],
-        'abs': [0x50, RELATIVE_ADDR],
-    },
-    'BVS': {
-        'immed': [0x70, VALUE_L],
-        'abs': [0x70, RELATIVE_ADDR],
-    },
-    'BCC': {
-        'immed': [0x90, VALUE_L],
-        'abs': [0x90, RELATIVE_ADDR],
-    },
-    'BCS': {
-        'immed': [0xb0, VALUE_L],
-        'abs': [0xb0, RELATIVE_ADDR],
-    },
-    'BNE': {
-        'immed': [0xd0, VALUE_L],
-        'abs': [0xd0, RELATIVE_ADDR],
-    },
-    'BEQ': {
-        'immed': [0xf0, VALUE_L],
-        'abs': [0xf0, RELATIVE_ADDR],
-    },
-    'BRK': {
-        'accum': [0x00],
-        'immed': [0x00, VALUE_L],
-    },
-    'CMP': {
-        'immed': [0xc9, VALUE_L],
-        'zerop': [0xc5, VALUE_L],
-        'zerop_x': [0xd5, VALUE_L],
-        'abs': [0xcD, VALUE_L, VALUE_H],
-        'abs_x': [0xdD, VALUE_L, VALUE_H],
-        'abs_y': [0xd9, VALUE_L, VALUE_H],
-        'indirect_x': [0xc1, VALUE_L],
-        'indirect_y': [0xd1, VALUE_L],
-    },
-    'CPX': {
-        'immed': [0xe0, VALUE_L],
-        'zerop': [0xe4, VALUE_L],
-        'abs': [0xec, VALUE_L, VALUE_H],
-    },
-    'CPY': {
-        'immed': [0xc0, VALUE_L],
-        'zerop': [0xc4, VALUE_L],
-        'abs': [0xcc, VALUE_L, VALUE_H],
-    },
-    'DEC': {
-        'zerop': [0xc6, VALUE_L],
-        'zerop_x': [0xd6, VALUE_L],
-        'abs': [0xce, VALUE_L, VALUE_H],
-        'abs_x': [0xde, VALUE_L, VALUE_H],
-    },
-    'EOR': {
-        'immed': [0x49, VALUE_L],
-        'zerop': [0x45, VALUE_L],
-        'zerop_x': [0x55, VALUE_L],
-        'abs': [0x4D, VALUE_L, VALUE_H],
-        'abs_x': [0x5D, VALUE_L, VALUE_H],
-        'abs_y': [0x59, VALUE_L, VALUE_H],
-        'indirect_x': [0x41, VALUE_L],
-        'indirect_y': [0x51, VALUE_L],
-    },
-    'CLC': {
-        'accum': [0x18],
-    },
-    'SEC': {
-        'accum': [0x38],
-    },
-    'CLI': {
-        'accum': [0x58],
-    },
-    'SEI': {
-        'accum': [0x78],
-    },
-    'CLV': {
-        'accum': [0xb8],
-    },
-    'CLD': {
-        'accum': [0xd8],
-    },
-    'SED': {
-        'accum': [0xf8],
-    },
-    'INC': {
-        'zerop': [0xe6, VALUE_L],
-        'zerop_x': [0xf6, VALUE_L],
-        'abs': [0xee, VALUE_L, VALUE_H],
-        'abs_x': [0xfe, VALUE_L, VALUE_H],
-    },
-    'JMP': {
-        'abs': [0x4c, VALUE_L, VALUE_H],
-        'indirect': [0x6c, VALUE_L, VALUE_H]
-    },
-    'JSR': {
-        'abs': [0x20, VALUE_L, VALUE_H],
-    },
-    'LDA': {
-        'immed': [0xA9, VALUE_L],
-        'zerop': [0xA5, VALUE_L],
-        'zerop_x': [0xB5, VALUE_L],
-        'abs': [0xAD, VALUE_L, VALUE_H],
-        'abs_x': [0xBD, VALUE_L, VALUE_H],
-        'abs_y': [0xB9, VALUE_L, VALUE_H],
-        'indirect_x': [0xA1, VALUE_L],
-        'indirect_y': [0xB1, VALUE_L],
-    },
-    'LDX': {
-        'immed': [0xa2, VALUE_L],
-        'zerop': [0xa6, VALUE_L],
-        'zerop_y': [0xb6, VALUE_L],
-        'abs': [0xae, VALUE_L, VALUE_H],
-        'abs_y': [0xbe, VALUE_L, VALUE_H],
-    },
-    'LDY': {
-        'immed': [0xa0, VALUE_L],
-        'zerop': [0xa4, VALUE_L],
-        'zerop_x': [0xb4, VALUE_L],
-        'abs': [0xac, VALUE_L, VALUE_H],
-        'abs_x': [0xbc, VALUE_L, VALUE_H],
-    },
-    'LSR': {
-        'accum': [0x4a],
-        'zerop': [0x46, VALUE_L],
-        'zerop_x': [0x56, VALUE_L],
-        'abs': [0x4e, VALUE_L, VALUE_H],
-        'abs_x': [0x5e, VALUE_L, VALUE_H],
-    },
-    'NOP': {
-        'accum': [0xea],
-    },
-    'ORA': {
-        'immed': [0x09, VALUE_L],
-        'zerop': [0x05, VALUE_L],
-        'zerop_x': [0x15, VALUE_L],
-        'abs': [0x0D, VALUE_L, VALUE_H],
-        'abs_x': [0x1D, VALUE_L, VALUE_H],
-        'abs_y': [0x19, VALUE_L, VALUE_H],
-        'indirect_x': [0x01, VALUE_L],
-        'indirect_y': [0x11, VALUE_L],
-    },
-    'TAX': {
-        'accum': [0xaa],
-    },
-    'TXA': {
-        'accum': [0x8a],
-    },
-    'DEX': {
-        'accum': [0xca],
-    },
-    'INX': {
-        'accum': [0xe8],
-    },
-    'TAY': {
-        'accum': [0xa8],
-    },
-    'TYA': {
-        'accum': [0x98],
-    },
-    'DEY': {
-        'accum': [0x88],
-    },
-    'INY': {
-        'accum': [0xc8],
-    },
-    'ROL': {
-        'accum': [0x2a],
-        'zerop': [0x26, VALUE_L],
-        'zerop_x': [0x36, VALUE_L],
-        'abs': [0x2e, VALUE_L, VALUE_H],
-        'abs_x': [0x3e, VALUE_L, VALUE_H],
-    },
-    'ROR': {
-        'accum': [0x6a],
-        'zerop': [0x66, VALUE_L],
-        'zerop_x': [0x76, VALUE_L],
-        'abs': [0x6e, VALUE_L, VALUE_H],
-        'abs_x': [0x7e, VALUE_L, VALUE_H],
-    },
-    'RTI': {
-        'accum': [0x40],
-    },
-    'RTS': {
-        'accum': [0x60],
-    },
-    'SBC': {
-        'immed': [0xe9, VALUE_L],
-        'zerop': [0xe5, VALUE_L],
-        'zerop_x': [0xf5, VALUE_L],
-        'abs': [0xeD, VALUE_L, VALUE_H],
-        'abs_x': [0xfD, VALUE_L, VALUE_H],
-        'abs_y': [0xf9, VALUE_L, VALUE_H],
-        'indirect_x': [0xe1, VALUE_L],
-        'indirect_y': [0xf1, VALUE_L],
-    },
-    'STA': {
-        'zerop': [0x85, VALUE_L],
-        'zerop_x': [0x95, VALUE_L],
-        'abs': [0x8D, VALUE_L, VALUE_H],
-        'abs_x': [0x9D, VALUE_L, VALUE_H],
-        'abs_y': [0x99, VALUE_L, VALUE_H],
-        'indirect_x': [0x81, VALUE_L],
-        'indirect_y': [0x91, VALUE_L],
-    },
-    'TXS': {
-        'accum': [0x9a],
-    },
-    'TSX': {
-        'accum': [0xba],
-    },
-    'PHA': {
-        'accum': [0x48],
-    },
-    'PLA': {
-        'accum': [0x68],
-    },
-    'PHP': {
-        'accum': [0x08],
-    },
-    'PLP': {
-        'accum': [0x28],
-    },
-    'STX': {
-        'zerop': [0x86, VALUE_L],
-        'zerop_y': [0x96, VALUE_L],
-        'abs': [0x8e, VALUE_L, VALUE_H],
-    },
-    'STY': {
-        'zerop': [0x84, VALUE_L],
-        'zerop_x': [0x94, VALUE_L],
-        'abs': [0x8c, VALUE_L, VALUE_H],
-    },
-}
+# Table of 6502 opcodes and supported addressing modes, generated from the
+# opcode specification of the emulator. Implied instructions use the "accum"
+# mode, branches take either an offset ("immed") or a target ("abs").
+def make_opcodes(spec):
+    table = {'DATA': {'immed': [VALUE_L]}}
+    for op, s in sorted(spec.items()):
+        modes = table.setdefault(s.mnemonic, {})
+        if s.penalty == 'branch':
+            modes['immed'] = [op, VALUE_L]
+            modes['abs'] = [op, RELATIVE_ADDR]
+        elif s.mode in (AddrMode.implied, AddrMode.accum):
+            modes['accum'] = [op]
+        else:
+            modes[s.mode.name] = [op] + [VALUE_L, VALUE_H][:s.size - 1]
+    # BRK followed by a signature byte.
+    table['BRK']['immed'] = [0x00, VALUE_L]
+    return table
+
+
+opcodes_6502 = make_opcodes(DOCUMENTED)
 
 
 # Parse address modes for various 6502 instructions
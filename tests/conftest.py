@@ -1,21 +1,43 @@
 import logging
+import typing as t
+
 import pytest
 
+from hello64 import cache
+from hello64.conditions import CycleBudget, Opcode, PCRange
 from hello64.cpu import CPU
+from hello64.machine import Machine, MachinePool
 from hello64.memory import Memory
-from .assembler import assemble_6502
+from .assembler import assemble_6502, strip_lines
 
 logger = logging.getLogger("test")
 
+machine_pool = MachinePool()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_directory(tmp_path_factory: pytest.TempPathFactory):
+    """ Keep the generated code of the test run out of the user's cache.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv(cache.ENV, str(tmp_path_factory.mktemp("cache")))
+        yield
+
 
 @pytest.fixture
-def memory():
-    return Memory()
+def machine():
+    with machine_pool.machine() as m:
+        yield m
 
 
 @pytest.fixture
-def cpu(memory: Memory):
-    return CPU(memory=memory)
+def memory(machine: Machine):
+    return machine.memory
+
+
+@pytest.fixture
+def cpu(machine: Machine):
+    return machine.cpu
 
 
 @pytest.fixture(name="asm")
@@ -48,14 +70,58 @@ def run_(cpu: CPU, memory: Memory, asm):
         memory.ram[cpu.RESET_VECTOR] = 0x00
         memory.ram[cpu.RESET_VECTOR + 1] = 0x80
         cpu.reset(extended=True)
-        cycles = 0
-        for state in cpu.start():
-            cycles += 1
-            if state == "idle" and logger.isEnabledFor(logging.DEBUG):
-                logger.debug(str(cpu.dump(cycles)))
-            if (cpu.pc >= end and state == "idle") or cpu.ins == 0xff:
-                break
-            assert cycles < 1000, "Infinite loop or illegal jump detected"
-        return cpu.dump(cycles)
+        res = cpu.run_until(PCRange(end), Opcode(0xff), CycleBudget(1000))
+        assert not isinstance(res.condition, CycleBudget), "Infinite loop or illegal jump detected"
+        return cpu.dump(res.cycles)
 
     return run
+
+
+@pytest.fixture(name="make_machine")
+def make_machine_():
+    """ Build new `Machine`s with `program` (assembler source or machine code) loaded, the
+        PC at `origin` and the CPU registers given as keywords set.
+    """
+    def make_machine(program: t.Union[str, t.Sequence[int]], origin: int = 0x1000,
+                     cpu_class: t.Type[CPU] = CPU, unknown: t.Optional[str] = None,
+                     **regs: int) -> Machine:
+        machine = Machine(cpu_class=cpu_class, unknown=unknown)
+        if isinstance(program, str):
+            for _, pc, ecode in assemble_6502(strip_lines(program.splitlines())):
+                machine.load(pc, ecode)
+        else:
+            machine.load(origin, program)
+        machine.cpu.pc = origin
+        for r, v in regs.items():
+            setattr(machine.cpu, r, v)
+        return machine
+
+    return make_machine
+
+
+E = t.TypeVar("E")
+
+
+@pytest.fixture(name="make_engine")
+def make_engine_(make_machine):
+    """ Build a new `engine` (e.g. `BusEngine`) for the CPU of a machine built by
+        `make_machine` with the remaining arguments.
+    """
+    def make_engine(engine: t.Callable[[CPU], E], program: t.Union[str, t.Sequence[int]],
+                    origin: int = 0x1000, **kwargs) -> E:
+        return engine(make_machine(program, origin, **kwargs).cpu)
+
+    return make_engine
+
+
+@pytest.fixture(name="machine_state")
+def machine_state_():
+    """ Everything a `Machine` would compute differently after going wrong: its registers,
+        cycles and memory.
+    """
+    def machine_state(machine: Machine) -> tuple:
+        cpu = machine.cpu
+        return (cpu.pc, cpu.sp, cpu.acc, cpu.idx, cpu.idy, cpu.sr, machine.cycles,
+                bytes(machine.memory.ram))
+
+    return machine_state
@@ -0,0 +1,99 @@
+import pytest
+
+from hello64.bus import BusEngine, microcode
+from hello64.conditions import InstructionBudget, PCRange
+from hello64.cpu import CPU
+from hello64.variants import CMOS65C02, NMOS6502
+
+
+def tracing(cpu: CPU) -> BusEngine:
+    return BusEngine(cpu, trace=True)
+
+
+def step(e: BusEngine):
+    assert e.trace is not None
+    e.trace.clear()
+    return e.run_until(InstructionBudget(1)).cycles
+
+
+def test_store_indexed_dummy_read(make_engine):
+    # STA 0x20f0,X reads the unfixed address 0x20 10 before writing 0x21 10.
+    e = make_engine(tracing, [0x9d, 0xf0, 0x20], acc=0x42, idx=0x20)
+    assert step(e) == 5
+    assert e.trace == [(0x1000, 0x9d, "read"), (0x1001, 0xf0, "read"), (0x1002, 0x20, "read"),
+                       (0x2010, 0x00, "read"), (0x2110, 0x42, "write")]
+
+
+@pytest.mark.parametrize("idx, cycles", [(0x0f, 4), (0x10, 5)])
+def test_load_indexed_page_cross(make_engine, idx: int, cycles: int):
+    e = make_engine(tracing, [0xbd, 0xf0, 0x20], idx=idx)
+    e.cpu.mem.ram[0x20f0 + idx] = 0x99
+    assert step(e) == cycles
+    assert e.trace is not None
+    assert e.trace[-1] == (0x20f0 + idx, 0x99, "read")
+    assert e.cpu.acc == 0x99
+    if cycles == 5:
+        assert e.trace[-2] == (0x2000, 0x00, "read")
+
+
+def test_read_modify_write_writes_twice(make_engine):
+    e = make_engine(tracing, [0xe6, 0x80])
+    e.cpu.mem.ram[0x80] = 0x41
+    assert step(e) == 5
+    assert e.trace[2:] == [(0x80, 0x41, "read"), (0x80, 0x41, "write"), (0x80, 0x42, "write")]
+
+
+def test_jsr_rts(make_engine):
+    e = make_engine(tracing, [0x20, 0x00, 0x20], sp=0xff)
+    e.cpu.mem.ram[0x2000] = 0x60
+    assert step(e) == 6
+    assert e.trace[2:] == [(0x1ff, 0x00, "read"), (0x1ff, 0x10, "write"),
+                           (0x1fe, 0x02, "write"), (0x1002, 0x20, "read")]
+    assert step(e) == 6
+    assert e.trace[1:] == [(0x2001, 0x00, "read"), (0x1fd, 0x00, "read"),
+                           (0x1fe, 0x02, "read"), (0x1ff, 0x10, "read"),
+                           (0x1002, 0x20, "read")]
+    assert e.cpu.pc == 0x1003
+
+
+@pytest.mark.parametrize("origin, sr, cycles, pc", [
+    (0x1000, 0x02, 2, 0x1002),
+    (0x1000, 0x00, 3, 0x1022),
+    (0x10f0, 0x00, 4, 0x1112),
+])
+def test_branch(make_engine, origin: int, sr: int, cycles: int, pc: int):
+    e = make_engine(tracing, [0xd0, 0x20], origin, sr=sr)
+    assert step(e) == cycles
+    assert e.cpu.pc == pc
+    assert e.trace is not None
+    if cycles == 4:
+        # The PC is in the wrong page for one cycle.
+        assert e.trace[-1] == (0x1012, 0x00, "read")
+
+
+def test_write_cycle(make_engine):
+    # The write of STA abs happens in the last of its 4 cycles.
+    e = make_engine(tracing, [0x8d, 0x00, 0x20])
+    seen = []
+    e.cpu.mem.add_write_observer(lambda a, v: seen.append(e.cpu.cycles))
+    e.run_until(InstructionBudget(1))
+    assert seen == [3]
+    assert e.cpu.cycles == 4
+
+
+def test_start_matches_run_until(make_engine):
+    program = [0xa2, 0x05, 0xca, 0xd0, 0xfd, 0xee, 0x00, 0x20]
+    e = make_engine(tracing, program)
+    res = e.run_until(PCRange(0x1008))
+    states = []
+    stepper = make_engine(tracing, program).start()
+    while len([s for s in states if s == "idle"]) < res.instructions:
+        states.append(next(stepper))
+    assert len(states) == res.cycles
+
+
+def test_microcode_tables():
+    assert sum(m is not None for m in microcode(CPU)) == len(CPU.OPCODES)
+    assert sum(m is not None for m in microcode(NMOS6502)) == len(NMOS6502.OPCODES)
+    with pytest.raises(ValueError):
+        microcode(CMOS65C02)
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from hello64 import cache
+
+
+def test_load(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv(cache.ENV, str(tmp_path))
+    built = []
+
+    def build():
+        built.append(1)
+        return {"x": (1, 2)}
+
+    assert cache.load("test", "x = 1", build) == {"x": (1, 2)}
+    (path, ) = tmp_path.iterdir()
+    assert path.name.startswith("test-") and f".v{cache.VERSION}." in path.name
+    assert cache.load("test", "x = 1", build) == {"x": (1, 2)}
+    assert len(built) == 1
+    # A different source is a different file.
+    cache.load("test", "x = 2", build)
+    assert len(built) == 2 and len(os.listdir(tmp_path)) == 2
+
+
+def test_disabled(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv(cache.ENV, "")
+    assert cache.load("test", "x = 1", lambda: 1) == 1
+    assert cache.directory() == ""
+
+
+def test_unwritable(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "file").write_bytes(b"")
+    monkeypatch.setenv(cache.ENV, str(tmp_path / "file" / "cache"))
+    assert cache.load("test", "x = 1", lambda: 1) == 1
+
+
+def test_unmarshallable(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv(cache.ENV, str(tmp_path))
+    value = object()
+    assert cache.load("test", "x = 1", lambda: value) is value
+    # No temporary file is left behind.
+    assert os.listdir(tmp_path) == []
+
+
+def test_compile_source(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv(cache.ENV, str(tmp_path))
+    for _ in range(2):
+        namespace: dict = {}
+        exec(cache.compile_source("test", "def f():\n    return 42\n"), namespace)
+        assert namespace["f"]() == 42
@@ -0,0 +1,33 @@
+from hello64.callgraph import CallProfiler
+from hello64.conditions import Trap
+from hello64.cpu import CPU
+from hello64.memory import Memory
+from hello64.symbols import SymbolTable
+
+
+def test_call_profiler(cpu: CPU, memory: Memory, asm):
+    asm("""
+        0x8000: JSR 0x9000
+                JSR 0x9100
+        0x8006: JMP 0x8006
+        0x9000: JSR 0x9100
+                RTS
+        0x9100: NOP
+                RTS
+        """)
+    cpu.pc = 0x8000
+    symbols = SymbolTable()
+    symbols.add_symbol(0x9100, "leaf")
+    opcodes = dict(cpu.opcodes)
+    with CallProfiler(cpu, symbols) as profiler:
+        res = cpu.run_until(Trap())
+    assert cpu.opcodes == opcodes
+    assert res.cycles == 43
+    assert profiler.collapsed() == [
+        "8000 15",
+        "8000;9000 12",
+        "8000;9000;leaf 8",
+        "8000;leaf 8",
+    ]
+    stats = {s.name: (s.calls, s.inclusive, s.exclusive) for s in profiler.stats()}
+    assert stats == {"8000": (0, 43, 15), "9000": (1, 20, 12), "leaf": (2, 16, 16)}
@@ -0,0 +1,97 @@
+from hello64.cia import CIA
+from hello64.conditions import CycleBudget
+from hello64.journal import Recorder, Replayer
+from hello64.machine import Machine
+
+
+def cia() -> CIA:
+    c = CIA()
+    c.attach(Machine(), 0xdc00)
+    return c
+
+
+def test_one_shot():
+    c = cia()
+    c.write(0xdc06, 0x10)
+    c.write(0xdc07, 0x00)
+    c.write(0xdc0f, 0x19)
+    assert c.cpu is not None
+    c.cpu.cycles += 10
+    assert c.read(0xdc06) == 0x06
+    assert not c.read(0xdc0d)
+    c.cpu.cycles += 7
+    assert c.read(0xdc0d) == 0x02
+    # Reading clears the flags, a one-shot timer stops at its latch.
+    assert not c.read(0xdc0d)
+    assert not c.read(0xdc0f) & 0x01
+    c.cpu.cycles += 100
+    assert c.read(0xdc06) == 0x10
+
+
+def test_continuous():
+    c = cia()
+    c.write(0xdc04, 0x09)
+    c.write(0xdc05, 0x00)
+    c.write(0xdc0e, 0x11)
+    assert c.regs[0x0e] == 0x01
+    c.cpu.cycles += 10 + 10 * 5 + 3  # type: ignore
+    assert c.read(0xdc04) == 0x06
+    # With the mask set, bit 7 tells that the CIA interrupts.
+    c.write(0xdc0d, 0x81)
+    assert c.read(0xdc0d) == 0x81
+    # Stopped, it keeps its value.
+    c.write(0xdc0e, 0x00)
+    c.cpu.cycles += 5  # type: ignore
+    assert c.read(0xdc04) == 0x06
+
+
+def test_without_clock():
+    c = CIA()
+    c.write(0xdc0e, 0x11)
+    assert c.read(0xdc04) == 0xff and c.read(0xdc05) == 0xff
+
+
+def test_cycles_going_back():
+    c = cia()
+    assert c.cpu is not None
+    c.cpu.cycles = 200_000
+    c.write(0xdc04, 0x10)
+    c.write(0xdc05, 0x00)
+    c.write(0xdc0e, 0x11)
+    c.cpu.cycles = 0
+    assert c.read(0xdc04) == 0x10 and c.read(0xdc05) == 0x00
+    c.cpu.cycles += 3
+    assert c.read(0xdc04) == 0x0d
+
+
+timer = """
+0x8000: LDA #0x00
+        STA 0xdc04
+        LDA #0x01
+        STA 0xdc05
+        LDA #0x11
+        STA 0xdc0e
+loop:   LDA 0xdc04
+        STA 0x9000
+        LDX 0xdc05
+        STX 0x9001
+        JMP loop
+"""
+
+
+def test_seek_back(make_machine, machine_state):
+    machine = make_machine(timer, 0x8000)
+    c = CIA()
+    c.attach(machine, 0xdc00)
+    recorder = Recorder(machine, interval=700)
+    cycles, states = [], []
+    for _ in range(2):
+        recorder.run_until(CycleBudget(2500))
+        cycles.append(machine.cycles)
+        states.append((machine_state(machine), c.snapshot()))
+    # Back to the middle, where the timer has underflowed a few times since.
+    replayer = Replayer(machine, recorder.journal)
+    replayer.seek(cycles[0])
+    assert (machine_state(machine), c.snapshot()) == states[0]
+    replayer.run_until(CycleBudget(cycles[1] - machine.cycles))
+    assert (machine_state(machine), c.snapshot()) == states[1]
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from hello64 import codegen
+from hello64.codegen import CompiledEngine
+from hello64.conditions import InstructionBudget, PCRange
+from hello64.cpu import CPU, UnknownOpcodeError
+from hello64.fuzz import state
+from hello64.memory import Memory
+from hello64.variants import VARIANTS, CMOS65C02
+
+
+def test_generate():
+    text = codegen.generate(CPU.SPEC[0xb1])
+    assert text.startswith("def op_b1(c, read, write):  # LDA indirect_y\n")
+    assert "AddrMode" not in text and "yield" not in text
+    assert text.endswith("    return 4 + ((a ^ b) > 0xff)\n")
+
+
+def test_specializable():
+    assert all(codegen.handlers(CPU)[op] is not None for op in CPU.SPEC)
+    # The 65C02 overrides ADC, so only its own handler knows the decimal mode timing.
+    assert codegen.specializable(CMOS65C02, CMOS65C02.SPEC[0xa9])
+    assert not codegen.specializable(CMOS65C02, CMOS65C02.SPEC[0x69])
+    assert codegen.handlers(CMOS65C02)[0x69] is None
+
+
+@pytest.mark.parametrize("idx, cycles", [(0x0f, 4), (0x10, 5)])
+def test_page_cross(make_engine, idx: int, cycles: int):
+    e = make_engine(CompiledEngine, [0xbd, 0xf0, 0x20], idx=idx)
+    e.cpu.mem.ram[0x20f0 + idx] = 0x99
+    res = e.run_until(InstructionBudget(1))
+    assert res.cycles == cycles
+    assert e.cpu.acc == 0x99
+
+
+@pytest.mark.parametrize("name", VARIANTS)
+def test_variants_agree(name: str):
+    cpu_class = VARIANTS[name]
+    for seed in range(40):
+        rnd = random.Random(seed)
+        ram = bytearray(rnd.randbytes(0x10000))
+        addr = 0x1000
+        for _ in range(32):
+            op = rnd.choice(sorted(cpu_class.OPCODES))
+            ram[addr] = op
+            addr += cpu_class.SPEC[op].size
+        cpus = []
+        for _ in range(2):
+            cpu = cpu_class(Memory(bytearray(ram)), "nop")
+            cpu.pc = 0x1000
+            cpus.append(cpu)
+        e = CompiledEngine(cpus[1])
+        for _ in range(32):
+            expected = state(cpus[0], cpus[0].run_until(InstructionBudget(1)).cycles)
+            assert state(cpus[1], e.run_until(InstructionBudget(1)).cycles) == expected
+            assert cpus[1].mem.ram == cpus[0].mem.ram
+
+
+def test_unknown_opcodes(make_engine):
+    with pytest.raises(UnknownOpcodeError):
+        make_engine(CompiledEngine, [0x02]).run_until(InstructionBudget(1))
+    e = make_engine(CompiledEngine, [0x02], unknown="jam")
+    assert e.run_until(InstructionBudget(3)).cycles == 6
+    assert e.cpu.pc == 0x1000
+
+
+def test_write_observers(make_engine):
+    e = make_engine(CompiledEngine, [0xa9, 0x42, 0x8d, 0x00, 0x20])
+    seen = []
+    e.cpu.mem.add_write_observer(lambda a, v: seen.append((a, v)))
+    e.run_until(PCRange(0x1005))
+    assert seen == [(0x2000, 0x42)]
@@ -1,3 +1,5 @@
+from hello64.conditions import (CycleBudget, InstructionBudget, MemoryValue, Opcode, PCRange,
+                                Trap)
 from hello64.dump import CPUDump
 from hello64.cpu import CPU
 from hello64.memory import Memory
@@ -101,25 +103,99 @@ def test_jsr_rts(run):
         """) == CPUDump(status="nvbdizc", acc=0x20, pc=0x8006)
 
 
-if __name__ == "__main__":
-    # David Beazley already made the effort to map opcodes to their mnenomics and
-    # addressing modes - let's just use that to generate our code.
-    from .assembler import opcodes_6502
-    for op, modes in opcodes_6502.items():
-        if op == "DATA":
-            continue
-        if op == "AND":
-            op += "_"
-        seen = set()
-        for mode, data in modes.items():  # type: ignore
-            code = data[0]
-            # For branch ops `assember.py` uses the same opcode for different
-            # adressing modes (`indirect` and `abs`). That is just an implementation
-            # detail and of course only a single addressing mode per opcode makes sense.
-            if code in seen:
-                continue
-            seen.add(code)
-            # Most of what is declared as `accum` is really `implied`.
-            if mode == "accum" and op not in ("ASL", "LSR", "ROL", "ROR"):
-                mode = "implied"
-            print(f"0x{code:02x}: (self.{op.lower()}, self.addr_{mode}),")
+def test_run_until(cpu: CPU, memory: Memory, asm):
+    asm("""
+        0x8000: LDX #0x00
+        0x8002: INX
+                STX 0x9000
+                JMP 0x8002
+        """)
+    memory.ram[cpu.RESET_VECTOR] = 0x00
+    memory.ram[cpu.RESET_VECTOR + 1] = 0x80
+    cpu.reset(extended=True)
+    res = cpu.run_until(InstructionBudget(4))
+    assert (res.cycles, res.instructions, cpu.idx) == (2 + 2 + 4 + 3, 4, 1)
+    res = cpu.run_until(MemoryValue(0x9000, 0x10), CycleBudget(1000))
+    assert isinstance(res.condition, MemoryValue)
+    assert (cpu.idx, cpu.pc) == (0x10, 0x8006)
+    res = cpu.run_until(PCRange(0x8002, 0x8003))
+    assert (res.cycles, res.instructions, cpu.pc) == (3, 1, 0x8002)
+    res = cpu.run_until(CycleBudget(10), InstructionBudget(1000))
+    assert isinstance(res.condition, CycleBudget)
+    assert res.cycles == 11
+
+
+def test_run_until_trap_and_opcode(cpu: CPU, memory: Memory, asm):
+    asm("""
+        0x8000: LDA #0x01
+                DATA #0xff
+        0x9000: BNE 0x9000
+        """)
+    memory.ram[cpu.RESET_VECTOR] = 0x00
+    memory.ram[cpu.RESET_VECTOR + 1] = 0x80
+    cpu.reset(extended=True)
+    halt = Opcode(0xff)
+    res = cpu.run_until(halt, Trap())
+    assert res.condition is halt
+    assert (res.cycles, res.instructions, cpu.pc, cpu.ins) == (3, 1, 0x8003, 0xff)
+    cpu.pc = 0x9000
+    res = cpu.run_until(halt, Trap())
+    assert isinstance(res.condition, Trap)
+    assert (res.cycles, cpu.pc) == (3, 0x9000)
+
+
+def test_address_wrapping(cpu: CPU, memory: Memory):
+    # LDA 0xfff0,X wraps to the zero page, LDA (0xff,X) takes its pointer from 0xff/0x00,
+    # JMP (0x30ff) from 0x30ff/0x3000, DEC leaves A alone.
+    memory.ram[0x1000:0x100c] = bytes(
+        [0xbd, 0xf0, 0xff, 0xa1, 0xff, 0xce, 0x00, 0x20, 0x6c, 0xff, 0x30, 0xea])
+    memory.ram[0x0010] = 0x42
+    memory.ram[0x00ff], memory.ram[0x0000], memory.ram[0x0100] = 0x00, 0x20, 0x30
+    memory.ram[0x2000] = 0x11
+    memory.ram[0x30ff], memory.ram[0x3000], memory.ram[0x3100] = 0x0b, 0x10, 0x20
+    cpu.pc, cpu.idx = 0x1000, 0x20
+    cpu.run_until(InstructionBudget(1))
+    assert cpu.acc == 0x42
+    cpu.idx = 0
+    cpu.run_until(InstructionBudget(1))
+    assert cpu.acc == 0x11
+    cpu.run_until(InstructionBudget(1))
+    assert (memory.ram[0x2000], cpu.acc) == (0x10, 0x11)
+    cpu.run_until(InstructionBudget(1))
+    assert cpu.pc == 0x100b
+
+
+def test_self_modifying_code(cpu: CPU, memory: Memory, asm):
+    # Copies from 0x2000 by incrementing the address of the LDA, then makes the loop copy
+    # to 0x4000 and the INC a BIT.
+    asm("""
+        0x8000: LDX #0x00
+        0x8002: LDA 0x2000
+                STA 0x3000,X
+                INC 0x8003
+                INX
+                CPX #0x04
+                BNE 0x8002
+        0x8010: LDA #0x40
+                STA 0x8007
+                LDA #0x2c
+                STA 0x8008
+                LDX #0xfc
+                JMP 0x8002
+        """)
+    memory.ram[0x2000:0x2008] = bytes(range(1, 9))
+    generation = memory.generations[0x80]
+    cpu.pc = 0x8000
+    done = PCRange(0x8010, 0x8011)
+    assert cpu.run_until(done, CycleBudget(10000)).condition is done
+    assert memory.ram[0x3000:0x3005] == bytes([1, 2, 3, 4, 0])
+    assert cpu.run_until(done, CycleBudget(10000)).condition is done
+    assert memory.ram[0x40fc:0x4100] == memory.ram[0x4000:0x4004] == bytes([5] * 4)
+    assert memory.ram[0x8003] == 0x04
+    # 4 INCs and 2 STAs.
+    assert memory.generations[0x80] - generation == 6
+    # Changed by the host in between.
+    memory.ram[0x8007] = 0x50
+    cpu.pc = 0x8002
+    cpu.run_until(InstructionBudget(2))
+    assert memory.ram[0x5004] == 5
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from hello64.conditions import Trap
+from hello64.d64 import D64, OFFSETS
+from hello64.kernal import FA, FNADR, FNLEN, SA, Kernal, Traps
+from hello64.machine import Machine
+
+
+@pytest.fixture
+def disk() -> D64:
+    return D64.blank(b"GAMES", b"G1")
+
+
+def test_blank(disk: D64):
+    assert (disk.name, disk.id, disk.free(), disk.entries) == (b"GAMES", b"G1", 664, [])
+
+
+def test_save_load(disk: D64):
+    data = b"\x01\x08" + bytes(range(256)) * 3
+    assert disk.save(b"PROG", data)
+    assert [(e.name, e.blocks) for e in disk.entries] == [(b"PROG", 4)]
+    assert disk.free() == 660
+    assert disk.load(b"P*") == data
+    assert disk.load(b"NOPE") is None
+    # Only replaced with `@`.
+    assert not disk.save(b"PROG", b"\x00\x10")
+    assert disk.save(b"@0:PROG", b"\x00\x10")
+    assert disk.load(b"PROG") == b"\x00\x10"
+    assert disk.free() == 663
+
+
+def test_directory_grows(disk: D64):
+    for i in range(20):
+        assert disk.save(b"FILE%d" % i, bytes(300))
+    assert len(disk.entries) == 20
+    assert disk.free() == 664 - 40
+    assert disk.load(b"FILE19") == bytes(300)
+
+
+def test_listing(disk: D64):
+    disk.save(b"PROG", bytes(10))
+    listing = disk.listing()
+    assert listing.startswith(b"\x01\x04")
+    assert b'\x12"GAMES           " G1 2A\0' in listing
+    assert b'\x01\x00   "PROG"             PRG\0' in listing
+    assert listing.endswith(b"\x97\x02BLOCKS FREE.             \0\0\0")
+    # The lines are linked for 0x0401.
+    link = listing[2] | listing[3] << 8
+    assert listing[link - 0x0401 + 2 - 1] == 0
+
+
+def test_file(tmp_path, disk: D64):
+    disk.save(b"PROG", b"\x01\x08abc")
+    path = str(tmp_path / "disk.d64")
+    with open(path, "wb") as f:
+        f.write(disk.data)
+    image = D64.open(path)
+    assert D64.open(path) is image
+    assert image.load(b"PROG") == b"\x01\x08abc"
+    assert not image.save(b"OTHER", b"")
+    writable = D64(path, writable=True)
+    assert writable.save(b"OTHER", b"\x00\x10")
+    writable.close()
+    os.utime(path, ns=(0, 0))
+    reopened = D64.open(path)
+    assert reopened is not image
+    assert reopened.load(b"OTHER") == b"\x00\x10"
+
+
+def test_not_an_image():
+    with pytest.raises(ValueError):
+        D64(bytes(OFFSETS[35] - 1))
+
+
+def test_kernal_load(disk: D64):
+    disk.save(b"PROG", b"\x00\xc0" + bytes(range(100)))
+    machine = Machine()
+    ram = machine.memory.ram
+    machine.load(0x3000, b"PROG")
+    ram[FNLEN], ram[FNADR:FNADR + 2], ram[FA], ram[SA] = 4, b"\x00\x30", 8, 1
+    # LDA #0; JSR LOAD; JMP *
+    machine.load(0x1000, [0xa9, 0x00, 0x20, 0xd5, 0xff, 0x4c, 0x05, 0x10])
+    machine.cpu.pc = 0x1000
+    Traps(machine, Kernal(disk).handlers()).run_until(Trap())
+    assert ram[0xc000:0xc064] == bytes(range(100))
@@ -0,0 +1,96 @@
+import asyncio
+
+from hello64.debugserver import DebugServer, encode_packet
+from hello64.machine import Machine
+
+code = """
+0x8000: LDX #0x00
+loop:   INX
+        STX 0x9000
+        JMP loop
+"""
+
+
+class Client:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, data: str) -> str:
+        self.writer.write(encode_packet(data))
+        assert await self.reader.readexactly(1) == b"+"
+        return await self.reply()
+
+    async def reply(self) -> str:
+        assert await self.reader.readexactly(1) == b"$"
+        payload = await self.reader.readuntil(b"#")
+        await self.reader.readexactly(2)
+        return payload[:-1].decode()
+
+
+async def session(machine: Machine, dialog):
+    server = await DebugServer(machine, batch=100).start()
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        client = Client(*await asyncio.open_connection("127.0.0.1", port))
+        await dialog(client)
+        client.writer.write(encode_packet("k"))
+        # The server closes the connection.
+        assert await client.reader.read() == b"+"
+        client.writer.close()
+
+
+def test_registers_memory_and_breakpoints(make_machine):
+    machine = make_machine(code, 0x8000)
+
+    async def dialog(client: Client):
+        assert await client.send("?") == "S05"
+        assert await client.send("g") == "00000020ff0080"
+        assert await client.send("s") == "S05"
+        assert await client.send("p5") == "0280"
+        assert await client.send("P0=42") == "OK"
+        assert machine.cpu.acc == 0x42
+        assert await client.send("M9100,2:beef") == "OK"
+        assert await client.send("m9100,2") == "beef"
+        assert await client.send("Z0,8006,1") == "OK"
+        assert await client.send("c") == "S05"
+        assert await client.send("m9000,1") == "01"
+        assert await client.send("c") == "S05"
+        assert await client.send("m9000,1") == "02"
+        assert await client.send("z0,8006,1") == "OK"
+        assert await client.send("G00ff0024ff0080") == "OK"
+        assert await client.send("g") == "00ff0024ff0080"
+        assert await client.send("vMustReplyEmpty") == ""
+
+    asyncio.run(session(machine, dialog))
+    assert (machine.cpu.idx, machine.cpu.pc) == (0xff, 0x8000)
+
+
+def test_interrupt(make_machine):
+    machine = make_machine(code, 0x8000)
+
+    async def dialog(client: Client):
+        client.writer.write(encode_packet("c"))
+        assert await client.reader.readexactly(1) == b"+"
+        await asyncio.sleep(0.05)
+        client.writer.write(b"\x03")
+        assert await client.reply() == "S02"
+        assert machine.cycles > 0
+
+    asyncio.run(session(machine, dialog))
+
+
+def test_malformed_commands(make_machine):
+    machine = make_machine(code, 0x8000)
+
+    async def dialog(client: Client):
+        # GDB probes registers beyond the ones it knows without a target description.
+        assert await client.send("p6") == "E01"
+        assert await client.send("P6=00") == "E01"
+        assert await client.send("cxyz") == "E01"
+        assert await client.send("s80zz") == "E01"
+        # The session goes on.
+        assert await client.send("p5") == "0080"
+
+    asyncio.run(session(machine, dialog))
+    assert machine.cpu.pc == 0x8000
@@ -0,0 +1,37 @@
+from hello64.disasm import Disassembler
+from hello64.memory import Memory, ObservedMemory
+from .assembler import assemble_6502, strip_lines
+
+code = """
+0x8000: LDA #0x42
+0x8002: STA %0x10,X
+0x8004: LDX 0x1234,Y
+0x8007: ASL A
+0x8008: JMP [0x2000]
+0x800b: ORA [0x20,Y]
+0x800d: BNE 0x8000
+0x800f: NOP
+0x8010: DATA #0xff
+""".strip()
+
+
+def test_listing_round_trip(memory: Memory, asm):
+    end = asm(code)
+    with Disassembler(memory) as disasm:
+        listing = disasm.listing(0x8000, end)
+    assert listing == code
+    assembled = assemble_6502(strip_lines(listing.splitlines()))
+    for _, pc, ecode in assembled:
+        assert bytes(memory.ram[pc:pc + len(ecode)]) == bytes(ecode)
+
+
+def test_cache_invalidation(memory: Memory, asm):
+    asm(code)
+    with Disassembler(memory, 0x8000, 0x9000) as disasm:
+        assert isinstance(memory, ObservedMemory)
+        ins = disasm.decode(0x8004)
+        assert disasm.decode(0x8004) is ins
+        # Writing the high byte of the operand invalidates the instruction.
+        memory.write(0x8006, 0x56)
+        assert str(disasm.decode(0x8004)) == "0x8004: LDX 0x5634,Y"
+    assert type(memory) is Memory
@@ -5,8 +5,10 @@ import os
 import logging
 from pytest import fail
 
+from hello64.conditions import CycleBudget, Trap
 from hello64.cpu import CPU
 from hello64.memory import Memory
+from hello64.symbols import SymbolTable
 
 logger = logging.getLogger("test")
 
@@ -18,22 +20,17 @@ def test_functional(cpu: CPU, memory: Memory):
     memory.ram[cpu.RESET_VECTOR] = 0x00
     memory.ram[cpu.RESET_VECTOR + 1] = 0x04
     cpu.reset()
-    last_pc = 0
     cycles = 0
-    for state in cpu.start():
-        cycles += 1
-        if cycles % 1_000_000 == 0:
-            logger.info(f"{cpu.dump(cycles)}")
-        if state == "busy":
-            continue
+    while True:
+        res = cpu.run_until(Trap(), CycleBudget(1_000_000))
+        cycles += res.cycles
+        if isinstance(res.condition, Trap):
+            break
+        logger.info(f"{cpu.dump(cycles)}")
+    if cpu.pc != 0x3469:
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(str(cpu.dump(cycles)))
-        if last_pc == cpu.pc:
-            if cpu.pc == 0x3469:
-                # Success!
-                break
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(f"Stack:\n{memory.dump(0x100, 0xff)}")
-            fail(f"Test failed at: {cpu.pc:04x}")
-        last_pc = cpu.pc
+            logger.debug(f"Stack:\n{memory.dump(0x100, 0xff)}")
+        symbols = SymbolTable.from_listing(
+            os.path.join(os.path.dirname(__file__), "6502_functional_test.lst.txt"))
+        fail(f"Test failed at: {symbols.describe(cpu.pc)}")
     logger.info(f"DONE! Yeah! CPU: {cpu.dump(cycles)}")
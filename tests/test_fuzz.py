@@ -0,0 +1,32 @@
+import pytest
+
+from hello64 import fuzz
+from hello64.cpu import CPU
+
+
+def test_engines_agree():
+    failures = fuzz.fuzz_range((0, 200, 32, list(fuzz.ENGINES)))
+    assert failures == []
+
+
+def test_shrink(monkeypatch: pytest.MonkeyPatch):
+    def broken_engine(cpu: CPU):
+        step = fuzz.run_until_engine(cpu)
+
+        def broken_step():
+            cycles = step()
+            if cpu.ins == 0xaa:
+                cpu.acc ^= 0x01
+            return cycles
+
+        return broken_step
+
+    monkeypatch.setitem(fuzz.ENGINES, "broken", broken_engine)
+    case = fuzz.Case({"acc": 3, "idx": 4, "idy": 5, "sp": 0xff, "sr": 0},
+                     [[0xa9, 0x10], [0xe8], [0xaa], [0xc8], [0xea]], 1234, 0x1000)
+    divergence = fuzz.execute(case, ["run_until", "broken"])
+    assert divergence is not None and divergence.index == 2
+    small = fuzz.shrink(case, ["run_until", "broken"], divergence)
+    assert small.program == [[0xaa]]
+    assert small.fill is None
+    assert small.regs == {"acc": 0, "idx": 0, "idy": 0, "sp": 0, "sr": 0}
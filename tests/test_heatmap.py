@@ -0,0 +1,43 @@
+from hello64.conditions import Trap
+from hello64.machine import Machine
+from hello64.memory import CountedMemory, Memory, ObservedMemory
+
+# 0x1000: LDX #0x03
+# 0x1002: LDA 0x2000
+# 0x1005: STA 0x0400,X
+# 0x1008: DEX
+# 0x1009: BNE 0x1002
+# 0x100b: JMP 0x100b
+program = [
+    0xa2, 0x03, 0xad, 0x00, 0x20, 0x9d, 0x00, 0x04, 0xca, 0xd0, 0xf7, 0x4c, 0x0b, 0x10
+]
+
+
+def test_counters(tmp_path):
+    machine = Machine()
+    machine.load(0x1000, program)
+    machine.cpu.pc = 0x1000
+    memory = machine.memory
+    counters = memory.enable_counters()
+    assert type(memory) is CountedMemory
+    observed = []
+    memory.add_write_observer(lambda a, v: observed.append(a))
+    machine.run_until(Trap())
+
+    assert counters.executes[0x1002] == 3
+    assert counters.executes[0x1003] == 0
+    assert counters.reads[0x2000] == 3
+    assert [counters.writes[a] for a in range(0x0400, 0x0405)] == [0, 1, 1, 1, 0]
+    assert observed == [0x0403, 0x0402, 0x0401]
+    assert counters.hot_pages(2)[0][0] == 0x10
+    assert counters.code_regions() == [(0x1000, 0x100e)]
+
+    path = str(tmp_path / "heatmap.ppm")
+    counters.write_ppm(path)
+    with open(path, "rb") as f:
+        assert len(f.read()) == len(b"P6\n256 256\n255\n") + 3 * 0x10000
+
+    assert memory.disable_counters() is counters
+    assert type(memory) is ObservedMemory
+    memory.remove_write_observer(memory.write_observers[0])
+    assert type(memory) is Memory
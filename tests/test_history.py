@@ -0,0 +1,57 @@
+import pytest
+
+from hello64.conditions import InstructionBudget
+from hello64.history import History
+
+code = """
+0x8000: LDX #0x00
+loop:   TXA
+        STA 0x9000,X
+        INC 0x9100
+        INX
+        JMP loop
+"""
+
+
+def test_step_back_matches_forward_run(make_machine, machine_state):
+    reference = make_machine(code, 0x8000)
+    states = []
+    for _ in range(60):
+        states.append(machine_state(reference))
+        reference.run_until(InstructionBudget(1))
+
+    machine = make_machine(code, 0x8000)
+    with History(machine, interval=7) as history:
+        history.run_until(InstructionBudget(59))
+        assert machine_state(machine) == states[59]
+        history.step_back()
+        assert machine_state(machine) == states[58]
+        history.goto(13)
+        assert machine_state(machine) == states[13]
+        history.goto(40)
+        assert machine_state(machine) == states[40]
+        history.goto(0)
+        assert machine_state(machine) == states[0]
+
+
+def test_last_write(make_machine):
+    machine = make_machine(code, 0x8000)
+    with History(machine, interval=16) as history:
+        history.run_until(InstructionBudget(100))
+        # The loop has 5 instructions and `STA` is the second one.
+        assert history.last_write(0x9003) == 3 * 5 + 3
+        assert machine.memory.ram[0x9003] == 3
+        assert machine.memory.ram[0x9004] == 0
+        with pytest.raises(LookupError):
+            history.last_write(0x9010)
+
+
+def test_bounded_history(make_machine):
+    machine = make_machine(code, 0x8000)
+    with History(machine, capacity=64, interval=10, checkpoints=4) as history:
+        history.run_until(InstructionBudget(500))
+        assert 450 <= history.earliest < 500
+        with pytest.raises(LookupError):
+            history.goto(100)
+        history.goto(history.earliest)
+        assert history.instruction == history.earliest
@@ -0,0 +1,134 @@
+import pytest
+
+from hello64.bus import BusEngine
+from hello64.cia import CIA
+from hello64.codegen import CompiledEngine
+from hello64.conditions import CycleBudget, InstructionBudget, MemoryValue, Opcode, PCRange
+from hello64.machine import Machine
+from hello64.memory import Device
+from .assembler import assemble_6502, strip_lines
+
+ENGINES = {
+    "cpu": lambda cpu: cpu,
+    "bus": BusEngine,
+    "compiled": CompiledEngine,
+}
+
+LOOPS = {
+    "self-jump": "JMP 0x1000",
+    "branch": "BEQ 0x1000",
+    "wait": """
+wait:   LDA 0x2000
+        BEQ wait
+""",
+    "forward": """
+        LDX #2
+wait:   LDA 0x2000,X
+        ORA [0xfb,Y]
+        BIT %0xfd
+        BMI skip
+        NOP
+skip:   CMP #1
+        BNE wait
+""",
+    # Not idle:
+    "counting": """
+loop:   INX
+        JMP loop
+""",
+    "writing": """
+loop:   INC 0x2001
+        LDA 0x2000
+        BEQ loop
+""",
+    "subroutine": """
+loop:   JSR sub
+        JMP loop
+sub:    RTS
+""",
+    "device": """
+wait:   LDA 0xdc0d
+        AND #0
+        BEQ wait
+""",
+    # Reads 0xd080 although X is 0 at the BEQ.
+    "indexed": """
+loop:   LDX #0x90
+        LDA 0xcff0,X
+        LDX #0
+        BEQ loop
+""",
+}
+
+
+def machine(loop: str, skip: bool) -> Machine:
+    m = Machine()
+    CIA().attach(m, 0xdc00)
+    for _, pc, ecode in assemble_6502(strip_lines(["0x1000:"] + loop.splitlines())):
+        m.load(pc, ecode)
+    m.memory.ram[0xfb:0xfd] = b"\x00\x21"
+    m.cpu.pc = 0x1000
+    m.cpu.sr_z = True
+    m.cpu.skip_idle = skip
+    return m
+
+
+@pytest.mark.parametrize("name", ENGINES)
+@pytest.mark.parametrize("loop", LOOPS)
+@pytest.mark.parametrize("budget", [CycleBudget(2345), InstructionBudget(777)])
+def test_same_result(name: str, loop: str, budget):
+    results = []
+    for skip in (False, True):
+        m = machine(LOOPS[loop], skip)
+        res = ENGINES[name](m.cpu).run_until(budget)
+        cpu = m.cpu
+        results.append((res.cycles, res.instructions, cpu.pc, cpu.acc, cpu.idx, cpu.sr,
+                        bytes(m.memory.ram)))
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("name", ENGINES)
+@pytest.mark.parametrize("loop", ["self-jump", "branch", "wait", "forward"])
+def test_skipped(name: str, loop: str):
+    m = machine(LOOPS[loop], True)
+    engine = ENGINES[name](m.cpu)
+    res = engine.run_until(CycleBudget(10**12), PCRange(0x3000), MemoryValue(0x2000, 1))
+    assert 10**12 <= res.cycles < 10**12 + 20
+    assert res.instructions > 10**10
+    # The loop ends as soon as memory changes, on the BRK after it.
+    m.memory.ram[0x2000] = m.memory.ram[0x2002] = 1
+    res = engine.run_until(CycleBudget(10**12), Opcode(0x00))
+    if loop in ("wait", "forward"):
+        assert isinstance(res.condition, Opcode) and res.cycles < 100
+
+
+class Register(Device):
+    def __init__(self) -> None:
+        self.reads = 0
+
+    def read(self, address: int) -> int:
+        self.reads += 1
+        return 0
+
+
+def test_device_read():
+    m = machine(LOOPS["device"], True)
+    register = Register()
+    m.memory.map_device(register, 0xdc00, 0xdd00)
+    res = m.run_until(CycleBudget(9000))
+    # LDA abs, AND #, BEQ: 9 cycles each time around.
+    assert register.reads == res.instructions // 3 == 1000
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_indexed_device_read(name: str):
+    reads = []
+    for skip in (False, True):
+        m = machine(LOOPS["indexed"], skip)
+        register = Register()
+        m.memory.map_device(register, 0xd000, 0xd100)
+        ENGINES[name](m.cpu).run_until(CycleBudget(100000))
+        reads.append(register.reads)
+    # LDX #, LDA abs,X (crossing a page), LDX #, BEQ: 12 cycles each time around, the
+    # budget ends in the last of 8334.
+    assert reads[0] == reads[1] == 8334
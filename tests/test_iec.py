@@ -0,0 +1,417 @@
+import typing as t
+
+import pytest
+
+from hello64 import iec
+from hello64.conditions import Trap
+from hello64.d64 import D64
+from hello64.iec import CIA2, CLK_IN, DATA_IN, Drive1541
+from hello64.keyboard import CIA1
+from hello64.machine import Machine
+from .assembler import assemble_6502, strip_lines
+
+# The serial routines of the KERNAL (the handshakes unchanged, the error handling cut
+# short), loading the file named at `fname` to 0x4000 like LOAD does it.
+kernal = """
+d2pra = 0xdd00
+d1t2h = 0xdc07
+d1icr = 0xdc0d
+d1crb = 0xdc0f
+status = 0x90
+bsour = 0x95
+r2d2 = 0xa3
+bsour1 = 0xa4
+count = 0xa5
+ptr = 0xfb
+0x1000: LDA #0x3f
+        STA 0xdd02
+        LDA #0x28
+        JSR list1
+        LDA #0xf0
+        JSR second
+        LDX #0
+name1:  LDA fname,X
+        INX
+        CPX namelen
+        BNE name2
+        LDY #0x80
+        STY %r2d2
+name2:  JSR ciout
+        CPX namelen
+        BNE name1
+        LDA #0
+        STA %r2d2
+        JSR unlsn
+        LDA #0x48
+        JSR list1
+        LDA #0x60
+        JSR tksa
+        LDA #0x00
+        STA %ptr
+        LDA #0x40
+        STA %ptr+1
+        LDY #0
+load1:  JSR acptr
+        STA [ptr,Y]
+        INC %ptr
+        BNE load2
+        INC %ptr+1
+load2:  BIT %status
+        BVC load1
+        JSR untlk
+        LDA #0x28
+        JSR list1
+        LDA #0xe0
+        JSR second
+        JSR unlsn
+end:    JMP end
+
+list1:  STA %bsour
+        LDA d2pra
+        ORA #0x08
+        STA d2pra
+        JSR clklo
+        JSR datahi
+        JSR w1ms
+        JMP isour
+second: STA %bsour
+        JSR isour
+        JMP scatn
+tksa:   STA %bsour
+        JSR isour
+        JSR datalo
+        JSR scatn
+        JSR clkhi
+tkatn1: JSR debpia
+        BMI tkatn1
+        RTS
+ciout:  STA %bsour
+        JMP isour
+unlsn:  LDA #0x3f
+        JSR list1
+        JSR scatn
+        JSR clkhi
+        JMP datahi
+untlk:  LDA d2pra
+        ORA #0x08
+        STA d2pra
+        JSR clklo
+        LDA #0x5f
+        JSR list1
+        JSR scatn
+        JSR clkhi
+        JMP datahi
+
+isour:  JSR datahi
+        JSR debpia
+        BCS nodev
+        JSR clkhi
+        BIT %r2d2
+        BPL noeoi
+isr02:  JSR debpia
+        BCC isr02
+isr03:  JSR debpia
+        BCS isr03
+noeoi:  JSR debpia
+        BCC noeoi
+        JSR clklo
+        LDA #0x08
+        STA %count
+isr01:  LDA d2pra
+        CMP d2pra
+        BNE isr01
+        ASL A
+        BCC frmerr
+        ROR %bsour
+        BCS isrhi
+        JSR datalo
+        BNE isrclk
+isrhi:  JSR datahi
+isrclk: JSR clkhi
+        NOP
+        NOP
+        NOP
+        NOP
+        LDA d2pra
+        AND #0xdf
+        ORA #0x10
+        STA d2pra
+        DEC %count
+        BNE isr01
+        LDA #0x04
+        STA d1t2h
+        LDA #0x19
+        STA d1crb
+        LDA d1icr
+isr04:  LDA d1icr
+        AND #0x02
+        BNE frmerr
+        JSR debpia
+        BCS isr04
+        RTS
+nodev:  LDA #0x80
+        BNE csberr
+frmerr: LDA #0x03
+csberr: ORA %status
+        STA %status
+        RTS
+
+acptr:  LDA #0x00
+        STA %count
+        JSR clkhi
+acp00a: JSR debpia
+        BPL acp00a
+eoiacp: LDA #0x01
+        STA d1t2h
+        LDA #0x19
+        STA d1crb
+        JSR datahi
+        LDA d1icr
+acp00:  LDA d1icr
+        AND #0x02
+        BNE acp00b
+        JSR debpia
+        BMI acp00
+        BPL acp01
+acp00b: LDA %count
+        BEQ acp00c
+        LDA #0x02
+        JMP csberr
+acp00c: JSR datalo
+        JSR clkhi
+        LDA #0x40
+        ORA %status
+        STA %status
+        INC %count
+        BNE eoiacp
+acp01:  LDA #0x08
+        STA %count
+acp03:  LDA d2pra
+        CMP d2pra
+        BNE acp03
+        ASL A
+        BPL acp03
+        ROR %bsour1
+acp03a: LDA d2pra
+        CMP d2pra
+        BNE acp03a
+        ASL A
+        BMI acp03a
+        DEC %count
+        BNE acp03
+        JSR datalo
+        LDA %bsour1
+        RTS
+
+clkhi:  LDA d2pra
+        AND #0xef
+        STA d2pra
+        RTS
+clklo:  LDA d2pra
+        ORA #0x10
+        STA d2pra
+        RTS
+datahi: LDA d2pra
+        AND #0xdf
+        STA d2pra
+        RTS
+datalo: LDA d2pra
+        ORA #0x20
+        STA d2pra
+        RTS
+scatn:  LDA d2pra
+        AND #0xf7
+        STA d2pra
+        RTS
+debpia: LDA d2pra
+        CMP d2pra
+        BNE debpia
+        ASL A
+        RTS
+w1ms:   TXA
+        LDX #0xb8
+w1ms1:  DEX
+        BNE w1ms1
+        TAX
+        RTS
+
+0x3000:
+namelen: DATA #0
+fname:  DATA #0
+"""
+
+
+class Host:
+    """ The C64 side of the bus, doing the handshakes the way the KERNAL does.
+    """
+    def __init__(self, disk: D64) -> None:
+        self.machine = Machine()
+        self.cia = CIA2()
+        self.cia.attach(self.machine)
+        self.cia.write(0xdd02, 0x3f)
+        self.drive = iec.attach(self.machine, disk, cia2=self.cia)
+        self.out = 0
+
+    def pull(self, **lines: bool):
+        for name, bit in (("atn", 0x08), ("clk", 0x10), ("data", 0x20)):
+            if name in lines:
+                self.out = self.out | bit if lines[name] else self.out & ~bit
+        self.cia.write(0xdd00, self.out)
+
+    def clk(self) -> bool:
+        return not self.cia.read(0xdd00) & CLK_IN
+
+    def data(self) -> bool:
+        return not self.cia.read(0xdd00) & DATA_IN
+
+    def tick(self, cycles: int = 10):
+        self.machine.cpu.cycles += cycles
+
+    def wait(self, condition: t.Callable[[], bool], timeout: int = 5000) -> bool:
+        end = self.machine.cycles + timeout
+        while not condition():
+            if self.machine.cycles >= end:
+                return False
+            self.tick()
+        return True
+
+    def send(self, byte: int, eoi: bool = False):
+        self.pull(data=False)
+        assert self.data(), "device not present"
+        self.pull(clk=False)
+        if eoi:
+            assert self.wait(lambda: not self.data())
+            assert self.wait(self.data)
+        assert self.wait(lambda: not self.data())
+        self.pull(clk=True)
+        for i in range(8):
+            self.tick(20)
+            self.pull(data=not byte & (1 << i))
+            self.tick(20)
+            self.pull(clk=False)
+            self.tick(20)
+            self.pull(clk=True, data=False)
+        assert self.wait(self.data, 1000), "frame error"
+
+    def receive(self) -> t.Optional[t.Tuple[int, bool]]:
+        self.pull(clk=False)
+        assert self.wait(lambda: not self.clk())
+        eoi = False
+        self.pull(data=False)
+        if not self.wait(self.clk, 256):
+            eoi = True
+            self.pull(data=True)
+            self.tick(60)
+            self.pull(data=False)
+            if not self.wait(self.clk, 256):
+                return None
+        byte = 0
+        for i in range(8):
+            assert self.wait(lambda: not self.clk())
+            if not self.data():
+                byte |= 1 << i
+            assert self.wait(self.clk)
+        self.pull(data=True)
+        return byte, eoi
+
+    def command(self, *commands: int):
+        self.pull(atn=True, clk=True, data=False)
+        self.tick(1000)
+        for c in commands:
+            self.send(c)
+
+    def listen(self, secondary: int, data: bytes = b""):
+        self.command(0x28, secondary)
+        self.pull(atn=False)
+        for i, byte in enumerate(data):
+            self.send(byte, eoi=i == len(data) - 1)
+        self.command(0x3f)
+        self.pull(atn=False, clk=False, data=False)
+
+    def talk(self, secondary: int) -> t.Optional[bytes]:
+        self.command(0x48, secondary)
+        self.pull(data=True)
+        self.pull(atn=False)
+        self.pull(clk=False)
+        assert self.wait(self.clk)
+        data = bytearray()
+        complete = True
+        while True:
+            received = self.receive()
+            if received is None:
+                complete = False
+                break
+            data.append(received[0])
+            if received[1]:
+                break
+        self.command(0x5f)
+        self.pull(atn=False, clk=False, data=False)
+        return bytes(data) if complete else None
+
+    def load(self, name: bytes) -> t.Optional[bytes]:
+        self.listen(0xf0, name)
+        data = self.talk(0x60)
+        self.listen(0xe0)
+        return data
+
+
+@pytest.fixture
+def disk() -> D64:
+    disk = D64.blank(b"TEST")
+    disk.save(b"HELLO", b"\x01\x08" + bytes(range(256)) * 2)
+    return disk
+
+
+def test_load(disk: D64):
+    host = Host(disk)
+    assert host.load(b"HEL*") == disk.load(b"HELLO")
+    assert host.load(b"$") == disk.listing()
+    # Not found: the drive never starts a byte, the listener times out.
+    assert host.load(b"NOPE") is None
+    assert host.talk(0x6f) == iec.FILE_NOT_FOUND
+    assert host.talk(0x6f) == iec.OK
+    assert not host.drive.clk and not host.drive.data
+
+
+def test_save(disk: D64):
+    host = Host(disk)
+    host.listen(0xf1, b"NEW")
+    host.listen(0x61, b"\x00\xc0abc")
+    assert disk.load(b"NEW") is None
+    host.listen(0xe1)
+    assert disk.load(b"NEW") == b"\x00\xc0abc"
+
+
+def test_other_device(disk: D64):
+    host = Host(disk)
+    other = Drive1541(host.cia.bus, disk, 9)
+    host.command(0x29, 0xf0)
+    host.pull(atn=False)
+    assert other.listening and not host.drive.listening
+    # The unaddressed drive lets go of the bus.
+    assert not host.drive.data
+    host.send(ord("X"), eoi=True)
+    host.command(0x3f)
+    host.pull(atn=False, clk=False, data=False)
+    assert other.status == iec.FILE_NOT_FOUND
+    assert host.drive.status.startswith(b"73,")
+
+
+@pytest.mark.parametrize("name, found", [(b"HELLO", True), (b"H*", True), (b"NOPE", False)])
+def test_kernal_routines(disk: D64, name: bytes, found: bool):
+    machine = Machine()
+    CIA1().attach(machine)
+    iec.attach(machine, disk)
+    for _, pc, ecode in assemble_6502(strip_lines(kernal.splitlines())):
+        machine.load(pc, ecode)
+    machine.load(0x3000, bytes((len(name), )) + name)
+    machine.cpu.pc = 0x1000
+    machine.run_until(Trap())
+    data = disk.load(b"HELLO")
+    assert data is not None
+    if found:
+        assert machine.memory.ram[0x4000:0x4000 + len(data)] == data
+        assert machine.memory.ram[0x90] == 0x40
+    else:
+        # Time out after EOI.
+        assert machine.memory.ram[0x90] == 0x42
@@ -0,0 +1,51 @@
+from hello64.conditions import CycleBudget, InstructionBudget
+from hello64.journal import Journal, Recorder, Replayer
+
+code = """
+0x8000: LDA 0x9000
+        CLC
+        ADC 0x9001
+        STA 0x9001
+        JMP 0x8000
+"""
+
+
+def record(make_machine) -> Recorder:
+    recorder = Recorder(make_machine(code, 0x8000), interval=700)
+    for value in (3, 5, 0, 7):
+        recorder.run_until(CycleBudget(1000))
+        recorder.input("poke", (0x9000, value))
+    recorder.run_until(CycleBudget(1000))
+    return recorder
+
+
+def test_replay_reaches_the_same_state(make_machine, machine_state):
+    recorder = record(make_machine)
+    assert len(recorder.journal.snapshots) == 8
+    assert recorder.machine.memory.ram[0x9001] != 0
+
+    replayer = Replayer(make_machine(code, 0x8000), recorder.journal)
+    replayer.seek(recorder.machine.cycles)
+    assert machine_state(replayer.machine) == machine_state(recorder.machine)
+
+
+def test_seek_from_snapshot(tmp_path, make_machine, machine_state):
+    recorder = record(make_machine)
+    path = str(tmp_path / "journal.pickle")
+    recorder.journal.save(path)
+    journal = Journal.load(path)
+
+    replayer = Replayer(make_machine(code, 0x8000), journal)
+    replayer.seek(2500)
+    assert 2500 <= replayer.machine.cycles < 2510
+    assert 2100 <= journal.snapshot_before(2500).cycles < 2500
+    replayer.run_until(CycleBudget(recorder.machine.cycles - replayer.machine.cycles))
+    assert machine_state(replayer.machine) == machine_state(recorder.machine)
+
+
+def test_budgets_span_batches(make_machine):
+    recorder = Recorder(make_machine(code, 0x8000), interval=100)
+    res = recorder.run_until(InstructionBudget(200))
+    assert res.instructions == 200
+    assert isinstance(res.condition, InstructionBudget)
+    assert len(recorder.journal.snapshots) > 5
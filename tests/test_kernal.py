@@ -0,0 +1,162 @@
+import random
+
+import pytest
+
+from hello64 import kernal
+from hello64.bus import BusEngine
+from hello64.codegen import CompiledEngine
+from hello64.conditions import ConditionSet, PCRange, Trap
+from hello64.kernal import HostDirectory, Kernal, Traps, fast_load, match
+from hello64.machine import Machine
+
+ENGINES = {
+    "cpu": lambda cpu: cpu,
+    "bus": BusEngine,
+    "compiled": CompiledEngine,
+}
+
+
+def machine(*program: int) -> Machine:
+    """ `program` at 0x1000, followed by a `JMP *`.
+    """
+    m = Machine()
+    code = list(program) + [0x4c]
+    m.load(0x1000, code + [(0x1000 + len(code) - 1) & 0xff, 0x10])
+    m.cpu.pc = 0x1000
+    return m
+
+
+def test_pc_points():
+    cs = ConditionSet([PCRange(0x2000, 0x2001), PCRange(0x3000), PCRange(0x2000, 0x2001)])
+    assert list(cs.pc_points) == [0x2000]
+    assert [r.start for r in cs.pc_ranges] == [0x3000]
+
+
+@pytest.mark.parametrize("name", ENGINES)
+def test_traps(name: str):
+    # JSR 0x2000 twice, the second time declined.
+    m = machine(0x20, 0x00, 0x20, 0x20, 0x00, 0x20)
+    # INX; RTS, only run when declined.
+    m.load(0x2000, [0xe8, 0x60])
+    calls = []
+
+    def handler(machine: Machine) -> bool:
+        calls.append(machine.cycles)
+        machine.cpu.acc += 1
+        return len(calls) == 1
+
+    sp = m.cpu.sp
+    traps = Traps(m, {0x2000: handler}, ENGINES[name](m.cpu))
+    res = traps.run_until(Trap())
+    assert (m.cpu.acc, m.cpu.idx, traps.calls) == (2, 1, 1)
+    assert m.cpu.sp == sp
+    # JSR + RTS, JSR + INX + RTS, JMP.
+    assert res.cycles == 12 + 14 + 3
+    # The native call is no instruction.
+    assert res.instructions == 5
+
+
+def test_user_conditions_first():
+    m = machine(0x20, 0x00, 0x20)
+    traps = Traps(m, {0x2000: lambda m: pytest.fail("called")})
+    assert traps.run_until(PCRange(0x2000, 0x2001), Trap()).condition.start == 0x2000
+
+
+def test_ramtas():
+    m = Machine()
+    m.memory.ram[:] = random.Random(1).randbytes(0x10000)
+    # JSR RAMTAS; JMP *
+    m.load(0x1000, [0x20, 0x50, 0xfd, 0x4c, 0x03, 0x10])
+    m.cpu.pc, m.cpu.sp = 0x1000, 0xff
+    Traps(m, Kernal().handlers()).run_until(Trap())
+    ram = m.memory.ram
+    assert not any(ram[0x02:0xb2]) and not any(ram[0x200:0x281])
+    assert ram[0xb2:0xb4] == b"\x3c\x03"
+    assert ram[0x281:0x285] == b"\x00\x08\x00\xa0"
+    assert ram[0x288] == 0x04
+    # Only the first two bytes of the stack page are cleared.
+    assert ram[0x1fe:0x200] == b"\x02\x10"
+    assert m.cpu.pc == 0x1003
+
+
+def load_machine(name: bytes, secondary: int, *program: int) -> Machine:
+    m = machine(*program)
+    ram = m.memory.ram
+    m.load(0x3000, name)
+    ram[kernal.FNLEN] = len(name)
+    ram[kernal.FNADR:kernal.FNADR + 2] = b"\x00\x30"
+    ram[kernal.FA] = 8
+    ram[kernal.SA] = secondary
+    return m
+
+
+def test_load(tmp_path):
+    (tmp_path / "hello.prg").write_bytes(b"\x01\x08" + bytes(range(1, 101)))
+    kernal_ = Kernal(HostDirectory(str(tmp_path)))
+    # LDA #0; JSR LOAD
+    m = load_machine(b"HEL*", 1, 0xa9, 0x00, 0x20, 0xd5, 0xff)
+    Traps(m, kernal_.handlers()).run_until(Trap())
+    assert m.memory.ram[0x0801:0x0865] == bytes(range(1, 101))
+    assert (m.cpu.sr_c, m.cpu.idx, m.cpu.idy) == (False, 0x65, 0x08)
+    assert m.memory.ram[kernal.STATUS] == kernal.EOF
+    # Relocated to X/Y with secondary address 0, then verified.
+    m = load_machine(b"0:HELLO", 0, 0xa2, 0x00, 0xa0, 0x40, 0xa9, 0x00, 0x20, 0xd5, 0xff,
+                     0xa2, 0x00, 0xa0, 0x40, 0xa9, 0x01, 0x20, 0xd5, 0xff)
+    m.memory.ram[0x4000] = 0xff
+    Traps(m, kernal_.handlers()).run_until(Trap())
+    assert m.memory.ram[0x4000:0x4064] == bytes(range(1, 101))
+    assert m.memory.ram[kernal.STATUS] == kernal.EOF
+    m = load_machine(b"NOPE", 1, 0xa9, 0x00, 0x20, 0xd5, 0xff)
+    Traps(m, kernal_.handlers()).run_until(Trap())
+    assert (m.cpu.sr_c, m.cpu.acc) == (True, kernal.FILE_NOT_FOUND)
+
+
+def test_load_other_device(tmp_path):
+    m = load_machine(b"HELLO", 1, 0xa9, 0x00, 0x20, 0xd5, 0xff)
+    m.memory.ram[kernal.FA] = 1
+    # The ROM routine is run instead, here an RTS.
+    m.load(0xffd5, [0x60])
+    traps = Traps(m, Kernal(HostDirectory(str(tmp_path))).handlers())
+    traps.run_until(Trap())
+    assert traps.calls == 0
+
+
+def test_save(tmp_path):
+    # LDA #0xfb; LDX #0x10; LDY #0x20; JSR SAVE
+    m = load_machine(b"@0:OUT", 1, 0xa9, 0xfb, 0xa2, 0x10, 0xa0, 0x20, 0x20, 0xd8, 0xff)
+    m.memory.ram[0xfb:0xfd] = b"\x00\x20"
+    m.load(0x2000, bytes(range(16)))
+    Traps(m, Kernal(HostDirectory(str(tmp_path))).handlers()).run_until(Trap())
+    assert not m.cpu.sr_c
+    assert (tmp_path / "out.prg").read_bytes() == b"\x00\x20" + bytes(range(16))
+
+
+def test_chrout():
+    # LDA #0x48; JSR CHROUT; LDA #0x49; JSR CHROUT
+    m = machine(0xa9, 0x48, 0x20, 0xd2, 0xff, 0xa9, 0x49, 0x20, 0xd2, 0xff)
+    m.memory.ram[kernal.DFLTO] = 3
+    k = Kernal(capture=True)
+    Traps(m, k.handlers()).run_until(Trap())
+    assert k.output == b"HI"
+
+
+def test_match():
+    assert match(b"HELLO", b"HELLO")
+    assert match(b"0:H?LLO", b"HALLO")
+    assert match(b"*", b"ANYTHING")
+    assert match(b"HE*", b"HE")
+    assert not match(b"HELLO", b"HELLO2")
+    assert not match(b"HELLO2", b"HELLO")
+
+
+def test_fast_load(tmp_path):
+    m = Machine()
+    path = tmp_path / "prog.prg"
+    path.write_bytes(b"\x01\x08" + bytes(10))
+    m.memory.ram[kernal.TXTTAB:kernal.TXTTAB + 2] = b"\x01\x08"
+    assert fast_load(m, str(path)) == (0x0801, 0x080b)
+    assert m.memory.ram[kernal.VARTAB:kernal.STREND + 2] == b"\x0b\x08" * 3
+    # Elsewhere, the BASIC pointers stay.
+    assert fast_load(m, b"\x00\xc0\x01\x02", 0x2000) == (0x2000, 0x2002)
+    assert m.memory.ram[0x2000:0x2002] == b"\x01\x02"
+    assert m.memory.ram[kernal.VARTAB] == 0x0b
@@ -0,0 +1,115 @@
+import pytest
+
+from hello64.conditions import CycleBudget
+from hello64.journal import Snapshot
+from hello64.keyboard import CHARS, CIA1, FIRE, LEFT, UP, InputScript
+from hello64.machine import Machine
+from .assembler import assemble_6502, strip_lines
+
+# Wait for a key, then store what port B reads for each column into 0x0400,Y and wait
+# for the key to be released.
+scanner = """
+0x1000: LDA #0xff
+        STA 0xdc02
+        LDA #0x00
+        STA 0xdc03
+        LDY #0
+wait:   LDA #0x00
+        STA 0xdc00
+        LDA 0xdc01
+        CMP #0xff
+        BEQ wait
+        LDA #0xfe
+        STA %0x10
+        LDX #8
+scan:   LDA %0x10
+        STA 0xdc00
+        LDA 0xdc01
+        STA 0x0400,Y
+        INY
+        SEC
+        ROL %0x10
+        DEX
+        BNE scan
+up:     LDA #0x00
+        STA 0xdc00
+        LDA 0xdc01
+        CMP #0xff
+        BNE up
+        JMP wait
+"""
+
+
+def test_matrix():
+    cia = CIA1()
+    cia.write(0xdc02, 0xff)
+    cia.press("A")
+    cia.write(0xdc00, 0xfd)
+    assert cia.read(0xdc01) == 0xfb
+    cia.write(0xdc00, 0xfe)
+    assert cia.read(0xdc01) == 0xff
+    cia.press(*CHARS["!"])
+    cia.write(0xdc00, 0x7f)
+    assert cia.read(0xdc01) == 0xfe
+    cia.write(0xdc00, 0x00)
+    assert cia.read(0xdc01) == 0x7e
+    # Scanning the other way round.
+    cia.write(0xdc02, 0x00)
+    cia.write(0xdc03, 0xff)
+    cia.write(0xdc01, 0x7f)
+    assert cia.read(0xdc00) == 0xfd
+    # The other registers are mirrored every 16 bytes.
+    cia.write(0xdc0c, 0x11)
+    assert cia.read(0xdcfc) == 0x11
+
+
+def test_joysticks():
+    cia = CIA1()
+    cia.joystick(2, UP | FIRE)
+    cia.joystick(1, LEFT)
+    assert cia.read(0xdc00) == 0xee
+    assert cia.read(0xdc01) == 0xfb
+
+
+def test_type():
+    machine = Machine()
+    CIA1().attach(machine)
+    for _, pc, ecode in assemble_6502(strip_lines(scanner.splitlines())):
+        machine.load(pc, ecode)
+    machine.cpu.pc = 0x1000
+    script = InputScript(machine.cycles).wait(1000).type("Hi", hold=2000, gap=2000)
+    assert len(script.events) == 4
+    script.play(machine).run_until(CycleBudget(script.cycle))
+    ram = machine.memory.ram
+    assert ram[0x0400:0x0410] == bytes([0xff, 0xff, 0xff, 0xdf, 0xff, 0xff, 0xff, 0xff,
+                                        0xff, 0xff, 0xff, 0xff, 0xfd, 0xff, 0xff, 0xff])
+    assert ram[0x0410] == 0
+
+
+def test_seek_restores_inputs():
+    machine = Machine()
+    cia = CIA1()
+    cia.attach(machine)
+    machine.load(0x1000, [0x4c, 0x00, 0x10])
+    machine.cpu.pc = 0x1000
+    replayer = InputScript(machine.cycles).wait(1000).press("A", hold=2000, gap=500) \
+        .joystick(2, UP, 2000).play(machine)
+    # Snapshots at 2000 while the key is down and at 4000 while the joystick is pushed.
+    for _ in range(2):
+        replayer.run_until(CycleBudget(2000))
+        replayer.journal.snapshots.append(Snapshot.take(machine))
+    replayer.run_until(CycleBudget(10_000))
+    assert (cia.keys, cia.joysticks) == ((), [0, 0])
+    replayer.seek(2500)
+    assert (cia.keys, cia.joysticks) == (("A", ), [0, 0])
+    replayer.seek(5000)
+    assert (cia.keys, cia.joysticks) == ((), [0, UP])
+    replayer.seek(10_000)
+    assert (cia.keys, cia.joysticks) == ((), [0, 0])
+
+
+def test_unknown_keys():
+    with pytest.raises(ValueError):
+        InputScript().type("{")
+    with pytest.raises(ValueError):
+        InputScript().press("ESC")
@@ -0,0 +1,54 @@
+import asyncio
+
+from hello64.clock import AsyncClock
+from hello64.conditions import CycleBudget, Trap
+from hello64.machine import Machine, MachinePool
+from hello64.memory import Device, Memory
+
+
+def test_pool_reuses_reset_machines():
+    pool = MachinePool()
+    with pool.machine() as m:
+        m.load(0x1000, [0xa9, 0x42, 0x8d, 0x00, 0x20, 0x4c, 0x05, 0x10])
+        m.cpu.pc = 0x1000
+        res = m.run_until(Trap())
+        assert (m.cpu.acc, m.memory.ram[0x2000], m.cycles) == (0x42, 0x42, res.cycles)
+        m.memory.add_write_observer(lambda address, value: None)
+        m.memory.map_device(Device(), 0xd000, 0xd100)
+        m.memory.enable_counters()
+        m.cpu.skip_idle = False
+        m.inputs["key"] = print
+        first = m
+    with pool.machine() as m:
+        assert m is first
+        assert m.memory.ram == bytearray(0x10000)
+        assert (m.cpu.pc, m.cpu.sp, m.cpu.acc, m.cpu.ins, m.cycles) == (0, 0xff, 0, 0, 0)
+        # Nothing carries over to the next user.
+        assert type(m.memory) is Memory
+        assert not m.memory.write_observers and not any(m.memory.devices)
+        assert m.memory.counters is None and not any(m.memory.generations)
+        assert m.cpu.skip_idle and list(m.inputs) == ["poke"]
+
+
+def test_async_run():
+    machines = [Machine(), Machine(), Machine()]
+    for m in machines:
+        # INC 0x2000; JMP 0x1000
+        m.load(0x1000, [0xee, 0x00, 0x20, 0x4c, 0x00, 0x10])
+        m.cpu.pc = 0x1000
+    reference = machines.pop().run_until(CycleBudget(10_000))
+    clocks = [AsyncClock(200_000), AsyncClock(400_000)]
+
+    async def run_all():
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        results = await asyncio.gather(*(
+            m.run(CycleBudget(10_000), clock=c, batch=1000) for m, c in zip(machines, clocks)))
+        return results, loop.time() - t0
+
+    results, duration = asyncio.run(run_all())
+    assert [r.cycles for r in results] == [reference.cycles] * 2
+    assert machines[0].memory.ram == machines[1].memory.ram
+    assert machines[0].memory.ram[0x2000] == (reference.instructions + 1) // 2 % 0x100
+    # The slower machine sets the pace.
+    assert duration >= 10_000 / 200_000 * 0.95
@@ -0,0 +1,89 @@
+from multiprocessing import shared_memory
+
+import pytest
+
+from hello64.conditions import Trap
+from hello64.machine import Machine
+from hello64.memory import Device, MappedMemory, Memory, ObservedMemory
+
+# LDA #0x42; STA 0x0400; JMP 0x1005
+program = [0xa9, 0x42, 0x8d, 0x00, 0x04, 0x4c, 0x05, 0x10]
+
+
+def run(memory: Memory) -> Machine:
+    machine = Machine(memory)
+    machine.load(0x1000, program)
+    machine.cpu.pc = 0x1000
+    machine.run_until(Trap())
+    return machine
+
+
+def test_shared_memory():
+    memory = Memory.shared()
+    try:
+        run(memory)
+        observer = shared_memory.SharedMemory(memory.backing.name)  # type: ignore
+        assert observer.buf[0x0400] == 0x42
+        memory.write(0x0401, 0x43)
+        assert observer.buf[0x0401] == 0x43
+        observer.close()
+    finally:
+        memory.unlink()
+
+
+def test_mapped_file(tmp_path):
+    path = str(tmp_path / "ram.bin")
+    memory = Memory.mapped(path)
+    run(memory)
+    memory.add_write_observer(lambda *_: None)
+    assert isinstance(memory, ObservedMemory)
+    memory.write(0x0401, 0x43)
+    memory.close()
+    with open(path, "rb") as f:
+        ram = f.read()
+    assert len(ram) == 0x10000
+    assert ram[0x0400:0x0402] == b"\x42\x43"
+    memory = Memory.mapped(path)
+    assert memory.ram[0x0400] == 0x42
+    memory.close()
+
+
+def test_ram_size():
+    with pytest.raises(ValueError):
+        Memory(bytearray(10))
+
+
+class Registers(Device):
+    __slots__ = ["values"]
+
+    def __init__(self) -> None:
+        self.values: dict = {}
+
+    def read(self, address: int) -> int:
+        return self.values.get(address, 0xaa)
+
+    def write(self, address: int, value: int):
+        self.values[address] = value
+
+
+def test_map_device():
+    device = Registers()
+    memory = Memory()
+    memory.map_device(device, 0xd000, 0xd100)
+    assert isinstance(memory, MappedMemory)
+    machine = run(memory)
+    machine.load(0x1000, [0xad, 0x00, 0xd0, 0x8d, 0x01, 0xd0, 0x4c, 0x06, 0x10])
+    machine.cpu.pc = 0x1000
+    machine.run_until(Trap())
+    # LDA 0xd000; STA 0xd001 went to the device, the RAM below is untouched.
+    assert device.values == {0xd001: 0xaa}
+    assert memory.ram[0xd001] == 0 and memory.ram[0x0400] == 0x42
+    memory.enable_counters()
+    assert memory.read(0xd002) == 0xaa
+    assert memory.counters.reads[0xd002] == 1  # type: ignore
+    memory.disable_counters()
+    memory.unmap_device(device)
+    assert type(memory) is Memory
+    assert memory.read(0xd002) == 0
+    with pytest.raises(ValueError):
+        memory.map_device(device, 0xd010, 0xd100)
@@ -0,0 +1,47 @@
+from time import monotonic
+
+from hello64.conditions import CycleBudget, MemoryValue
+from hello64.machine import Machine
+from hello64.multiplex import Multiplexer, run_parallel
+
+
+def counter(index: int) -> Machine:
+    """ A machine counting 0x2000 up forever: INC 0x2000; JMP 0x1000. `index` (passed by
+        `run_parallel()` to its factory) does not matter, all machines are the same.
+    """
+    machine = Machine()
+    machine.load(0x1000, [0xee, 0x00, 0x20, 0x4c, 0x00, 0x10])
+    machine.cpu.pc = 0x1000
+    return machine
+
+
+def test_round_robin_is_fair():
+    mux = Multiplexer(quantum=100)
+    slots = [mux.add(counter(i), CycleBudget(10_000)) for i in range(3)]
+    for _ in range(10):
+        mux.step()
+        cycles = [s.machine.cycles for s in slots]
+        assert max(cycles) - min(cycles) < 10
+    results = mux.run()
+    assert [r.cycles for r in results] == [slots[0].machine.cycles] * 3
+
+
+def test_stop_conditions_and_pacing():
+    mux = Multiplexer(quantum=1000)
+    fast = mux.add(counter(0), MemoryValue(0x2000, 5))
+    paced = mux.add(counter(1), CycleBudget(5000), frequency=100_000)
+    t0 = monotonic()
+    results = mux.run()
+    assert results[0].condition is fast.run.conditions[0]
+    assert fast.machine.memory.ram[0x2000] == 5
+    assert results[1].cycles >= 5000
+    assert monotonic() - t0 >= 5000 / 100_000 * 0.95
+    assert paced.done
+    # Whole slices of 1000 cycles, the last one ending at the budget.
+    assert paced.batches <= 6
+
+
+def test_run_parallel():
+    results = run_parallel(counter, 5, CycleBudget(2000), processes=2, quantum=500)
+    assert len(results) == 5
+    assert all(r.cycles >= 2000 for r in results)
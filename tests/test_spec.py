@@ -0,0 +1,48 @@
+import pytest
+
+from hello64.bus import microcode
+from hello64.cpu import CPU
+from hello64.memory import Memory
+from hello64.spec import DOCUMENTED, AddrMode, parse
+from hello64.variants import VARIANTS
+
+
+def test_parse():
+    (s, ) = parse("b1  LDA  indirect_y  5*  read").values()
+    assert (s.opcode, s.mnemonic, s.mode, s.cycles, s.penalty, s.bus) == \
+        (0xb1, "LDA", AddrMode.indirect_y, 5, "page", "read")
+    assert (s.size, s.handler, s.addr_mode) == (2, "lda", "addr_indirect_y")
+    assert DOCUMENTED[0x29].handler == "and_"
+    assert DOCUMENTED[0xd0].penalty == "branch"
+
+
+def test_documented():
+    assert len(DOCUMENTED) == 151
+    assert all(op == s.opcode for op, s in DOCUMENTED.items())
+    assert CPU.SPEC is DOCUMENTED
+
+
+@pytest.mark.parametrize("name", VARIANTS)
+def test_handlers_exist(name: str):
+    cpu_class = VARIANTS[name]
+    for s in cpu_class.SPEC.values():
+        assert callable(getattr(cpu_class, s.handler)), s
+        assert callable(getattr(cpu_class, s.addr_mode)), s
+    assert set(cpu_class.OPCODES) == set(cpu_class.SPEC)
+
+
+@pytest.mark.parametrize("name", VARIANTS)
+def test_timing_matches_spec(name: str):
+    cpu_class = VARIANTS[name]
+    cpu = cpu_class(Memory())
+    for op, s in cpu_class.SPEC.items():
+        busy, crossed = cpu.timing[op]
+        assert len(busy) == s.cycles - 2
+        assert len(crossed) - len(busy) == (s.penalty == "page")
+
+
+@pytest.mark.parametrize("name", ["6502", "nmos"])
+def test_microcode_matches_spec(name: str):
+    # The bus engine checks the microcode against the spec cycles when compiling it.
+    code = microcode(VARIANTS[name])
+    assert all(code[op] is not None for op in VARIANTS[name].SPEC)
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+HEAVY = ("asyncio", "multiprocessing", "hello64.disasm", "hello64.bus", "hello64.codegen")
+
+
+def imported(code: str):
+    """ The heavy modules imported by running `code` in a fresh interpreter.
+    """
+    check = f"{code}\nimport sys\nprint(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", check], env=dict(os.environ, PYTHONPATH=SRC),
+                         capture_output=True, text=True, check=True).stdout
+    return out.split()
+
+
+@pytest.mark.parametrize("code", [
+    "import hello64",
+    "import hello64; hello64.CPU(hello64.Memory())",
+    "import hello64; hello64.Machine()",
+])
+def test_lazy_imports(code: str):
+    assert imported(code) == []
+
+
+def test_lazy_exports():
+    assert imported("import hello64; hello64.CompiledEngine") == ["hello64.codegen"]
@@ -0,0 +1,24 @@
+import os
+
+from hello64.symbols import SymbolTable
+
+listing = os.path.join(os.path.dirname(__file__), "6502_functional_test.lst.txt")
+
+
+def test_listing():
+    symbols = SymbolTable.from_listing(listing)
+    assert symbols.address_of("start") == 0x0400
+    assert symbols.describe(0x0400) == "0400 (start, line 740)"
+    # The operand of an instruction belongs to the instruction.
+    assert symbols.describe(0x3463) == "3463 (bin_rti_ret+0xe, line 13356)"
+    loc = symbols.lookup(0x000d)
+    assert (loc.symbol, loc.offset, loc.line) == ("ad1", 0, 633)
+
+
+def test_vice_labels(tmp_path):
+    path = tmp_path / "labels.txt"
+    path.write_text("al C:0810 .main\nal C:0900 .loop\n")
+    symbols = SymbolTable()
+    symbols.load_vice_labels(str(path))
+    assert symbols.describe(0x0800) == "0800"
+    assert symbols.describe(0x0905) == "0905 (loop+0x5)"
@@ -0,0 +1,95 @@
+import pytest
+
+from hello64.conditions import InstructionBudget, Trap
+from hello64.cpu import CPU, UnknownOpcodeError
+from hello64.disasm import decode
+from hello64.variants import CMOS65C02, NMOS6502
+
+
+def test_tables_are_composed():
+    assert set(CPU.OPCODES) < set(NMOS6502.OPCODES)
+    assert set(CPU.OPCODES) < set(CMOS65C02.OPCODES)
+    assert len(CPU.OPCODES) == 151
+    assert len(CMOS65C02.OPCODES) == 151 + 27 + 14
+
+
+@pytest.mark.parametrize("unknown", ["raise", "nop", "jam"])
+def test_unknown_opcodes(make_machine, unknown: str):
+    # 0x02 is unknown to the documented CPU; then LDA #0x42 and JMP to itself.
+    m = make_machine([0x02, 0xa9, 0x42, 0x4c, 0x03, 0x10], unknown=unknown)
+    if unknown == "raise":
+        with pytest.raises(UnknownOpcodeError):
+            m.run_until(Trap())
+        return
+    res = m.run_until(Trap())
+    if unknown == "nop":
+        assert (m.cpu.pc, m.cpu.acc, res.cycles) == (0x1003, 0x42, 2 + 2 + 3)
+    else:
+        assert (m.cpu.pc, m.cpu.acc, res.cycles) == (0x1000, 0, 2)
+
+
+def test_nmos_undocumented(make_machine):
+    m = make_machine([
+        0xa7, 0x10,  # LAX %0x10
+        0x87, 0x11,  # SAX %0x11
+        0xc7, 0x12,  # DCP %0x12
+        0xe7, 0x13,  # ISC %0x13
+        0x07, 0x14,  # SLO %0x14
+        0x0c, 0x00, 0x20,  # NOP 0x2000
+        0x02,  # JAM
+    ], cpu_class=NMOS6502)
+    ram = m.memory.ram
+    ram[0x10:0x15] = bytes([0x81, 0xff, 0x82, 0x00, 0x40])
+    m.cpu.sr_c = True
+    res = m.run_until(Trap())
+    assert (m.cpu.acc, m.cpu.idx) == (0x80, 0x81)
+    assert bytes(ram[0x10:0x15]) == bytes([0x81, 0x81, 0x81, 0x01, 0x80])
+    assert res.cycles == 3 + 3 + 5 + 5 + 5 + 4 + 2
+    assert m.cpu.pc == 0x100d
+    assert decode(ram, 0x1000, NMOS6502).text == "LAX %0x10"
+
+
+def test_cmos_65c02(make_machine):
+    m = make_machine([
+        0x64, 0x10,  # STZ %0x10
+        0x1a,  # INC A
+        0xda,  # PHX
+        0x7a,  # PLY
+        0xb2, 0x20,  # LDA [0x20]
+        0x04, 0x11,  # TSB %0x11
+        0x80, 0x01,  # BRA 0x100c
+        0x00,  # BRK (skipped)
+        0x7c, 0x00, 0x30,  # JMP [0x3000,X]
+    ], cpu_class=CMOS65C02, idx=2, acc=0)
+    ram = m.memory.ram
+    ram[0x10] = 0xff
+    ram[0x11] = 0x0c
+    ram[0x20:0x22] = bytes([0x00, 0x40])
+    ram[0x4000] = 0x03
+    ram[0x3002:0x3004] = bytes([0x00, 0x50])
+    res = m.run_until(InstructionBudget(8))
+    assert ram[0x10] == 0
+    assert (m.cpu.acc, m.cpu.idy) == (0x03, 0x02)
+    assert ram[0x11] == 0x0f
+    # TSB sets Z if none of the bits were set before.
+    assert m.cpu.sr_z
+    assert m.cpu.pc == 0x5000
+    assert res.cycles == 3 + 2 + 3 + 4 + 5 + 5 + 3 + 6
+    assert decode(ram, 0x1005, CMOS65C02).text == "LDA [0x20]"
+    assert decode(ram, 0x100c, CMOS65C02).text == "JMP [0x3000,X]"
+
+
+def test_cmos_nops(make_machine):
+    m = make_machine([
+        0x02, 0xff,  # NOP #0xff
+        0x44, 0x10,  # NOP %0x10
+        0xf4, 0x10,  # NOP %0x10,X
+        0x5c, 0x00, 0x20,  # NOP 0x2000
+        0xdc, 0x00, 0x20,  # NOP 0x2000
+        0x03,  # 1 byte NOP
+        0xa9, 0x42,  # LDA #0x42
+    ], cpu_class=CMOS65C02)
+    res = m.run_until(InstructionBudget(7))
+    assert (m.cpu.pc, m.cpu.acc) == (0x100f, 0x42)
+    assert res.cycles == 2 + 3 + 4 + 8 + 4 + 1 + 2
+    assert decode(m.memory.ram, 0x1009, CMOS65C02).text == "NOP 0x2000"
@@ -0,0 +1,56 @@
+import json
+
+from hello64 import vectors
+from hello64.cpu import CPU
+from hello64.memory import Memory
+
+
+def case(pc: int, a: int, value: int, final_a: int):
+    return {
+        "name": f"b5 {value:02x}",
+        "initial": {
+            "pc": pc, "s": 0xfd, "a": a, "x": 2, "y": 0, "p": 0x24,
+            "ram": [[pc, 0xb5], [pc + 1, 0x10], [0x12, value]]
+        },
+        "final": {
+            "pc": pc + 2, "s": 0xfd, "a": final_a, "x": 2, "y": 0,
+            "p": 0x24 | (0x80 if final_a & 0x80 else 0) | (0x02 if final_a == 0 else 0),
+            "ram": [[pc, 0xb5], [pc + 1, 0x10], [0x12, value]]
+        },
+        "cycles": [[pc, 0xb5, "read"]] * 4,
+    }
+
+
+def stray_write(pc: int):
+    """ A `STA 0x20` whose case does not list 0x20 as written.
+    """
+    regs = {"pc": pc, "s": 0xfd, "a": 1, "x": 2, "y": 0, "p": 0x24}
+    ram = [[pc, 0x85], [pc + 1, 0x20]]
+    return {
+        "name": "85",
+        "initial": {**regs, "ram": ram},
+        "final": {**regs, "pc": pc + 2, "ram": ram},
+        "cycles": [[pc, 0x85, "read"]] * 3,
+    }
+
+
+def test_replay(tmp_path):
+    path = tmp_path / "b5.json"
+    path.write_text(json.dumps([
+        case(0x1000, 0x01, 0x80, 0x80),
+        case(0x2000, 0x01, 0x00, 0x00),
+        case(0x3000, 0x01, 0x42, 0x43),
+        stray_write(0x4000),
+        case(0x5000, 0x01, 0x00, 0x00),
+    ]))
+    vs = vectors.load(str(path))
+    assert len(vs) == 5
+    assert (tmp_path / "b5.json.cache").exists()
+    assert list(vectors.load(str(path)).ram_in.addr) == list(vs.ram_in.addr)
+    cpu = CPU(Memory())
+    failed, failures = vectors.replay(vs, cpu)
+    assert failed == 2
+    assert failures[0].startswith("b5 #2:")
+    assert failures[1].startswith("b5 #3: ram[0020] = 01, expected 00")
+    # The stray write does not carry over into the next case.
+    assert cpu.mem.ram == bytearray(0x10000)